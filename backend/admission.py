@@ -0,0 +1,132 @@
+# backend/admission.py
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from batching import BatchScheduler, QueueFullError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class AdmissionRejected(QueueFullError):
+    """Raised instead of queueing work that would miss its deadline or overflow the queue"""
+
+    def __init__(self, message: str, reason: str, retry_after: float):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class AdmissionController:
+    """
+    Deadline-aware admission in front of the inference scheduler.
+
+    At most `max_pending` journals are admitted at once. A journal is
+    rejected up front when the estimated wait for its batch already exceeds
+    its remaining deadline, and gives up (freeing its queue slot) when the
+    deadline passes while it waits. The estimate is the number of batches
+    queued ahead of it times a moving average of recent batch latency,
+    spread over the scheduler's concurrent batch slots.
+    """
+
+    def __init__(
+        self,
+        scheduler: BatchScheduler,
+        max_pending: int = 512,
+        default_deadline_ms: float = 2000.0,
+        max_deadline_ms: float = 30000.0,
+        smoothing: float = 0.2,
+    ):
+        self.scheduler = scheduler
+        self.max_pending = max(1, max_pending)
+        self.default_deadline = default_deadline_ms / 1000
+        self.max_deadline = max_deadline_ms / 1000
+        self.smoothing = smoothing
+        self.batch_seconds: Optional[float] = None
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed: Dict[str, int] = {"queue_full": 0, "deadline": 0, "expired": 0}
+        self.degraded = 0
+        scheduler.batch_listeners.append(self.observe_batch)
+
+    def observe_batch(self, size: int, latency_ms: float):
+        """Scheduler batch listener: exponentially weighted batch latency"""
+        seconds = latency_ms / 1000
+        if self.batch_seconds is None:
+            self.batch_seconds = seconds
+        else:
+            self.batch_seconds += self.smoothing * (seconds - self.batch_seconds)
+
+    def deadline(self, budget_ms: Optional[float] = None) -> float:
+        """Monotonic deadline for a request with `budget_ms` (default when absent), capped"""
+        budget = self.default_deadline if budget_ms is None or budget_ms <= 0 else min(budget_ms / 1000, self.max_deadline)
+        return time.monotonic() + budget
+
+    def estimate_wait(self) -> float:
+        """Seconds until a journal queued now would have its scores"""
+        scheduler = self.scheduler
+        batch_seconds = self.batch_seconds or 0.0
+        batches = math.ceil((scheduler.queue_depth + 1) / scheduler.max_batch_size)
+        return scheduler.max_wait + batches * batch_seconds / scheduler.max_concurrent_batches
+
+    def _reject(self, message: str, reason: str) -> AdmissionRejected:
+        self.shed[reason] += 1
+        return AdmissionRejected(message, reason, retry_after=max(self.estimate_wait(), 1.0))
+
+    async def run(self, call: Callable[[], Awaitable[T]], deadline: Optional[float] = None) -> T:
+        """
+        Run `call()` if it can finish by `deadline` (monotonic seconds)
+
+        Without a deadline only the pending bound applies. A full scheduler
+        queue inside `call()` is shed like the pending bound, so it carries
+        a retry hint too.
+
+        Raises:
+            AdmissionRejected: Shed before queueing, the scheduler queue was full,
+                or the deadline passed while waiting
+        """
+        if self.in_flight >= self.max_pending:
+            raise self._reject(f"Too many journals waiting for the model ({self.in_flight})", "queue_full")
+        remaining = None
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            estimate = self.estimate_wait()
+            if remaining <= 0 or estimate > remaining:
+                raise self._reject(
+                    f"Estimated model wait {estimate * 1000:.0f}ms exceeds the {max(remaining, 0) * 1000:.0f}ms left",
+                    "deadline",
+                )
+
+        self.in_flight += 1
+        self.admitted += 1
+        try:
+            if remaining is None:
+                return await call()
+            return await asyncio.wait_for(call(), remaining)
+        except asyncio.TimeoutError:
+            raise self._reject("Deadline passed while waiting for the model", "expired")
+        except AdmissionRejected:
+            raise
+        except QueueFullError as e:
+            raise self._reject(str(e), "queue_full") from e
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_pending": self.max_pending,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "degraded": self.degraded,
+            "estimated_wait_ms": self.estimate_wait() * 1000,
+            "batch_latency_ewma_ms": self.batch_seconds * 1000 if self.batch_seconds is not None else None,
+        }
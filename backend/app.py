@@ -1,17 +1,365 @@
 # backend/main.py
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
 from datetime import datetime
+from contextlib import asynccontextmanager
+import asyncio
+import hmac
+import logging
+import math
+import time
 import uvicorn
 import os
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+import sys
 import firebase_admin
 from firebase_admin import credentials, firestore, messaging
 import json
 
-app = FastAPI(title="Mental Health App API", version="1.0.0")
+from batching import BatchScheduler, QueueFullError
+from startup import StartupState, warmup_texts
+from memory_firestore import InMemoryFirestore
+from write_behind import WriteBehindBuffer
+from history_cache import InvalidCursorError, MoodHistoryCache
+from notifications import FakeTransport, FcmTransport, NotificationFanout, TokenIndex
+from suggestions import CopingSuggestion, SuggestionCatalog
+from friends import FriendIndex
+from metrics import BATCH_SIZE_BUCKETS, Metrics
+from streaming import NdjsonStreamProcessor, StreamError
+from hot_swap import ModelDeployment, ServingModel
+from admission import AdmissionController, AdmissionRejected
+from repository import MoodRepository, create_repository
+
+# Shared model code lives next to the backend in ../model
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "model")
+sys.path.append(MODEL_DIR)
+from result_cache import EmotionResultCache, model_fingerprint
+from postprocess import sentiment_score
+from mood_trend import MoodTrendRegistry
+from chunking import LongTextChunker, aggregate_window_scores
+from cascade import ModelCascade
+from registry import ModelRegistry, is_mmap_loadable, load_mmap_model
+
+logger = logging.getLogger(__name__)
+
+# Hugging Face model name or local checkpoint directory
+EMOTION_MODEL_NAME = os.getenv("NEUS_EMOTION_MODEL", "j-hartmann/emotion-english-distilroberta-base")
+
+# "torch" (eager pipeline) or "onnx" (ONNX Runtime, see model/onnx_engine.py)
+EMOTION_ENGINE = os.getenv("NEUS_EMOTION_ENGINE", "torch")
+
+# Number of dedicated inference processes (0 runs the model in the API process)
+INFERENCE_WORKERS = int(os.getenv("NEUS_INFERENCE_WORKERS", "0"))
+
+# Long-text mode: score long journals as sentence-aware windows of at most
+# NEUS_WINDOW_TOKENS tokens, reading no more than NEUS_MAX_REQUEST_TOKENS
+LONG_TEXT = os.getenv("NEUS_LONG_TEXT", "0") == "1"
+WINDOW_TOKENS = int(os.getenv("NEUS_WINDOW_TOKENS", "256"))
+MAX_REQUEST_TOKENS = int(os.getenv("NEUS_MAX_REQUEST_TOKENS", "2048"))
+
+# Cascade mode: a hashed n-gram first stage (model/cascade.py) answers journals
+# it is at least NEUS_CASCADE_THRESHOLD confident about; the rest go to the model
+CASCADE_MODEL = os.getenv("NEUS_CASCADE_MODEL") or None
+CASCADE_THRESHOLD = float(os.getenv("NEUS_CASCADE_THRESHOLD", "0.9"))
+
+# Local model registry (model/registry.py); when set, the backend serves its
+# active version and can switch versions at runtime through /admin/models
+MODEL_REGISTRY = ModelRegistry(os.environ["NEUS_MODEL_REGISTRY"]) if os.getenv("NEUS_MODEL_REGISTRY") else None
+
+# Admin endpoints answer only requests carrying this X-Admin-Token (unset disables them)
+ADMIN_TOKEN = os.getenv("NEUS_ADMIN_TOKEN") or None
+
+# Max entries of one /predict/stream request being analyzed or awaiting output
+STREAM_MAX_IN_FLIGHT = int(os.getenv("NEUS_STREAM_MAX_IN_FLIGHT", "256"))
+
+# Admission control: journals get NEUS_DEFAULT_DEADLINE_MS (or the client's
+# X-Request-Deadline-Ms, capped) to be scored; ones that cannot make it are
+# shed with 503, or answered without emotion scores in degraded mode
+DEFAULT_DEADLINE_MS = float(os.getenv("NEUS_DEFAULT_DEADLINE_MS", "2000"))
+MAX_DEADLINE_MS = float(os.getenv("NEUS_MAX_DEADLINE_MS", "30000"))
+DEGRADED_MODE = os.getenv("NEUS_DEGRADED_MODE", "1") == "1"
+
+# Request handlers reach Firestore through a repository on the async client
+# ("async") or, with "threads" or SDKs without it, a pool of this many threads
+FIRESTORE_CLIENT = os.getenv("NEUS_FIRESTORE_CLIENT", "async")
+FIRESTORE_THREADS = int(os.getenv("NEUS_FIRESTORE_THREADS", "16"))
+
+# Sequence-length buckets exercised before the model is reported ready
+WARMUP_BUCKETS = [int(n) for n in os.getenv("NEUS_WARMUP_BUCKETS", "16,32,64,128,256,512").split(",") if n.strip()]
+
+# Prometheus metrics at /metrics (NEUS_METRICS=0 turns every metric into a no-op)
+metrics = Metrics(
+    enabled=os.getenv("NEUS_METRICS", "1") == "1",
+    trace_sample_rate=float(os.getenv("NEUS_TRACE_SAMPLE_RATE", "0")),
+)
+
+# Firebase, the model and the result cache are initialized in the background
+# by the lifespan hook, so importing this module stays cheap
+db = None
+repository: Optional[MoodRepository] = None
+cascade = None
+startup_state = StartupState(["firestore", "model"])
+
+def async_firestore_client():
+    from firebase_admin import firestore_async
+    return firestore_async.client()
+
+def init_firestore():
+    """Initialize Firebase, verify Firestore answers a query and build the repository"""
+    global db, repository
+    if os.getenv("NEUS_FIRESTORE") == "memory":
+        # Local in-memory stand-in for tests and benchmarks
+        client = InMemoryFirestore()
+    else:
+        cred = credentials.Certificate(os.getenv("NEUS_FIREBASE_CREDENTIALS", "path/to/serviceAccountKey.json"))
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(cred)
+        client = firestore.client()
+        client.collection('mood_entries').limit(1).get()
+    # The async client opens its channel on first use, from the event loop
+    async_factory = async_firestore_client if FIRESTORE_CLIENT == "async" else None
+    new_repository = create_repository(client, async_factory, max_workers=FIRESTORE_THREADS)
+    if metrics.enabled:
+        new_repository.call_listeners.append(metrics.record_firestore_call)
+    db = metrics.instrument_firestore(client)
+    repository = new_repository
+
+# Optional write-behind mode: /predict appends mood entries to a local log and
+# a background thread commits them to Firestore in batches
+if os.getenv("NEUS_WRITE_BEHIND", "0") == "1":
+    write_buffer = WriteBehindBuffer(
+        lambda: db,
+        os.getenv("NEUS_WRITE_BEHIND_LOG", "data/write_behind.log"),
+        flush_size=int(os.getenv("NEUS_WRITE_BEHIND_FLUSH_SIZE", "200")),
+        flush_interval=float(os.getenv("NEUS_WRITE_BEHIND_FLUSH_INTERVAL", "1.0")),
+        fsync=os.getenv("NEUS_WRITE_BEHIND_FSYNC", "0") == "1",
+    )
+else:
+    write_buffer = None
+
+# Per-user cache of recent mood entries, kept current by /predict
+history_cache = MoodHistoryCache(
+    lambda: require_repository(),
+    hot_window=int(os.getenv("NEUS_HISTORY_HOT_WINDOW", "50")),
+    max_users=int(os.getenv("NEUS_HISTORY_MAX_USERS", "10000")),
+    ttl_seconds=float(os.getenv("NEUS_HISTORY_TTL_SECONDS", "300")),
+)
+
+async def load_trend_history(user_id: str) -> List[tuple]:
+    """A user's (timestamp, sentiment, entry_id) oldest first, to seed their trend"""
+    # Taken before the query: an entry flushed while it runs is then seen
+    # twice (skipped by ID) rather than not at all
+    buffered = write_buffer.pending_documents('mood_entries') if write_buffer is not None else []
+    entries = await require_repository().get_history(user_id, ['timestamp', 'emotion_scores'])
+    stored = {entry['id'] for entry in entries}
+    entries += [{**data, 'id': entry_id} for entry_id, data in buffered
+                if data.get('user_id') == user_id and entry_id not in stored]
+    # Entries stored degraded have no scores; /predict leaves them out of the trend too
+    return [
+        (entry.get('timestamp'), sentiment_score(entry['emotion_scores']), entry['id'])
+        for entry in entries if entry.get('emotion_scores')
+    ]
+
+# Incremental per-user mood trends, updated in O(1) by /predict
+trend_registry = MoodTrendRegistry(
+    load_trend_history,
+    max_users=int(os.getenv("NEUS_TREND_MAX_USERS", "10000")),
+    half_life_days=float(os.getenv("NEUS_TREND_HALF_LIFE_DAYS", "7")),
+    ttl_seconds=float(os.getenv("NEUS_TREND_TTL_SECONDS", "300")),
+)
+
+# Bulk push notifications: cached token index + multicast fan-out
+token_index = TokenIndex(
+    lambda: require_repository(),
+    ttl_seconds=float(os.getenv("NEUS_TOKEN_CACHE_TTL_SECONDS", "3600")),
+)
+notification_fanout = NotificationFanout(
+    token_index,
+    metrics.instrument_transport(FakeTransport() if os.getenv("NEUS_FCM_TRANSPORT") == "fake" else FcmTransport()),
+    concurrency=int(os.getenv("NEUS_NOTIFICATION_CONCURRENCY", "8")),
+)
+# Running campaigns and model changes, referenced until they finish
+campaign_tasks = set()
+model_tasks = set()
+
+def load_serving_model(version: Optional[str] = None) -> ServingModel:
+    """Load a model version (NEUS_EMOTION_MODEL without a registry) with its result cache"""
+    model_path = MODEL_REGISTRY.path(version) if version else EMOTION_MODEL_NAME
+    emotion_model = None
+    worker_pool = None
+    long_text_chunker = None
+
+    if EMOTION_ENGINE == "onnx":
+        from onnx_engine import OnnxEmotionEngine
+        # Registry versions carry their export in <version>/onnx
+        onnx_dir = os.path.join(model_path, "onnx") if version else os.getenv("NEUS_ONNX_MODEL_DIR", os.path.join(MODEL_DIR, "onnx"))
+        emotion_model = OnnxEmotionEngine(
+            onnx_dir,
+            quantized=os.getenv("NEUS_ONNX_QUANTIZED", "1") == "1",
+        )
+    elif INFERENCE_WORKERS > 0:
+        from worker_pool import InferenceWorkerPool
+        pool = InferenceWorkerPool(
+            model_path,
+            num_workers=INFERENCE_WORKERS,
+            threads_per_worker=int(os.getenv("NEUS_INFERENCE_THREADS_PER_WORKER", "0")) or None,
+            batch_timeout=float(os.getenv("NEUS_INFERENCE_BATCH_TIMEOUT_SECONDS", "120")),
+        )
+        pool.start()
+        worker_pool = pool
+    else:
+        from transformers import AutoTokenizer, pipeline
+        if is_mmap_loadable(model_path):
+            # Mapped weights: loading a version next to the old one adds no copy
+            model = load_mmap_model(model_path)
+            emotion_model = pipeline(
+                "text-classification",
+                model=model,
+                tokenizer=AutoTokenizer.from_pretrained(model_path),
+                return_all_scores=True
+            )
+        else:
+            emotion_model = pipeline(
+                "text-classification",
+                model=model_path,
+                return_all_scores=True
+            )
+
+    if LONG_TEXT:
+        if emotion_model is not None:
+            tokenizer = emotion_model.tokenizer
+        else:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_path)
+        long_text_chunker = LongTextChunker(tokenizer, window_tokens=WINDOW_TOKENS, max_tokens=MAX_REQUEST_TOKENS)
+
+    # Content-addressed cache of emotion scores (NEUS_CACHE_MAX_ENTRIES=0 disables it)
+    if EMOTION_ENGINE == "onnx":
+        cache_model_path = emotion_model.model_dir
+        engine_id = "onnx-int8" if emotion_model.quantized else "onnx-fp32"
+    else:
+        cache_model_path, engine_id = model_path, "torch"
+    if LONG_TEXT:
+        # Windowed scores differ from truncated ones for long journals
+        engine_id += f"+windows-{WINDOW_TOKENS}-{MAX_REQUEST_TOKENS}"
+    if cascade is not None:
+        # First-stage answers differ from the model's
+        engine_id += cascade.engine_id
+    cache_model_id = model_fingerprint(cache_model_path, engine_id, version=version or os.getenv("NEUS_MODEL_VERSION"))
+    result_cache = EmotionResultCache(
+        cache_model_id,
+        max_entries=int(os.getenv("NEUS_CACHE_MAX_ENTRIES", "10000")),
+        ttl_seconds=float(os.getenv("NEUS_CACHE_TTL_SECONDS", "86400")),
+        disk_path=os.getenv("NEUS_CACHE_DISK_PATH") or None,
+        max_disk_entries=int(os.getenv("NEUS_CACHE_DISK_MAX_ENTRIES", "100000")) or None,
+    )
+
+    def score_batch(texts: List[str]) -> List[dict]:
+        if worker_pool is not None:
+            return worker_pool.infer(texts)
+        outputs = emotion_model(texts, batch_size=len(texts), truncation=True)
+        return [{emotion['label']: emotion['score'] for emotion in emotions} for emotions in outputs]
+
+    return ServingModel(
+        version or EMOTION_MODEL_NAME,
+        score_batch,
+        result_cache=result_cache,
+        long_text_chunker=long_text_chunker,
+        close=worker_pool.stop if worker_pool is not None else None,
+    )
+
+def load_emotion_model():
+    """Load the cascade first stage and the model version to serve"""
+    global cascade
+    if CASCADE_MODEL:
+        cascade = ModelCascade.load(CASCADE_MODEL, CASCADE_THRESHOLD)
+    deployment.active = load_serving_model(MODEL_REGISTRY.active_version() if MODEL_REGISTRY else None)
+
+def warmup_model(serving: Optional[ServingModel] = None):
+    """Run one batch per sequence-length bucket so first requests hit warm kernels"""
+    serving = serving or deployment.active
+    batch_size = int(os.getenv("NEUS_WARMUP_BATCH_SIZE", "0")) or inference_scheduler.max_batch_size
+    for texts in warmup_texts(WARMUP_BUCKETS, batch_size):
+        serving.score(texts)
+
+def run_emotion_batch(texts: List[str]) -> List[dict]:
+    """Run one padded forward pass over a batch of journal texts on the active version"""
+    with metrics.stage("model_batch"):
+        return deployment.score_active(texts)
+
+def score_with(serving: ServingModel, text: str) -> dict:
+    """Score one journal directly on `serving`, bypassing the batch scheduler"""
+    if serving.long_text_chunker is None:
+        return serving.score([text])[0]
+    plan = serving.long_text_chunker.plan(text)
+    return aggregate_window_scores(serving.score(plan.windows), plan.tokens)
+
+# Loads, warms and switches model versions; optionally mirrors traffic to a shadow
+deployment = ModelDeployment(
+    load_serving_model,
+    warmup_model,
+    max_shadow_in_flight=int(os.getenv("NEUS_SHADOW_MAX_IN_FLIGHT", "4")),
+)
+
+# Micro-batching inference scheduler
+inference_scheduler = BatchScheduler(
+    run_emotion_batch,
+    max_batch_size=int(os.getenv("NEUS_BATCH_MAX_SIZE", "16")),
+    max_wait_ms=float(os.getenv("NEUS_BATCH_MAX_WAIT_MS", "5")),
+    max_queue_size=int(os.getenv("NEUS_BATCH_QUEUE_SIZE", "1024")),
+    max_concurrent_batches=max(1, INFERENCE_WORKERS) if EMOTION_ENGINE != "onnx" else 1,
+)
+
+# Bounded, deadline-aware admission in front of the scheduler
+admission = AdmissionController(
+    inference_scheduler,
+    max_pending=int(os.getenv("NEUS_ADMISSION_MAX_PENDING", "512")),
+    default_deadline_ms=DEFAULT_DEADLINE_MS,
+    max_deadline_ms=MAX_DEADLINE_MS,
+)
+
+async def initialize_services():
+    """Bring up Firestore and the model concurrently, then warm the model"""
+    async def start_firestore():
+        with startup_state.phase("firestore"):
+            await asyncio.to_thread(init_firestore)
+        startup_state.mark_ready("firestore")
+
+    async def start_model():
+        with startup_state.phase("model_load"):
+            await asyncio.to_thread(load_emotion_model)
+        with startup_state.phase("model_warmup"):
+            await asyncio.to_thread(warmup_model)
+        startup_state.mark_ready("model")
+
+    with startup_state.phase("total"):
+        await asyncio.gather(start_firestore(), start_model(), return_exceptions=True)
+    if startup_state.is_ready():
+        logger.info(f"API ready: {startup_state.report()['phase_seconds']}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await inference_scheduler.start()
+    if write_buffer is not None:
+        write_buffer.start()
+    init_task = asyncio.create_task(initialize_services())
+    yield
+    init_task.cancel()
+    await inference_scheduler.stop()
+    if write_buffer is not None:
+        await asyncio.to_thread(write_buffer.stop)
+    if repository is not None:
+        await repository.close()
+    if deployment.active is not None:
+        deployment.active.release(timeout=10)
+    if deployment.shadow is not None:
+        deployment.shadow.release(timeout=10)
+
+app = FastAPI(title="Mental Health App API", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -22,32 +370,143 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Firebase
-cred = credentials.Certificate("path/to/serviceAccountKey.json")
-firebase_admin.initialize_app(cred)
-db = firestore.client()
-
-# Load emotion analysis model
-emotion_model = pipeline(
-    "text-classification",
-    model="j-hartmann/emotion-english-distilroberta-base",
-    return_all_scores=True
+http_requests = metrics.counter('neus_http_requests_total', 'HTTP requests', ['method', 'route', 'status'])
+http_seconds = metrics.histogram('neus_http_request_seconds', 'HTTP request latency', ['method', 'route'])
+handler_errors = metrics.counter('neus_handler_errors_total', 'Unexpected errors turned into a 500', ['error'])
+inference_batch_size = metrics.histogram(
+    'neus_inference_batch_size', 'Journals per model forward pass', buckets=BATCH_SIZE_BUCKETS
 )
+inference_batch_seconds = metrics.histogram('neus_inference_batch_seconds', 'Model batch latency')
+inference_queue_wait = metrics.histogram('neus_inference_queue_wait_seconds', 'Time a journal waits for its model batch')
+admission_shed = metrics.counter('neus_admission_shed_total', 'Journals refused model time', ['reason'])
+degraded_responses = metrics.counter('neus_degraded_responses_total', 'Responses sent without emotion scores')
+cascade_answers = metrics.counter('neus_cascade_answers_total', 'Journals scored per cascade tier', ['tier'])
+
+def observe_batch(size: int, latency_ms: float):
+    inference_batch_size.observe(size)
+    inference_batch_seconds.observe(latency_ms / 1000)
+
+if metrics.enabled:
+    inference_scheduler.batch_listeners.append(observe_batch)
+    inference_scheduler.wait_listeners.append(inference_queue_wait.observe)
+
+def cache_hit_ratios():
+    """(labels, hit ratio) for every cache the API keeps"""
+    caches = {
+        "emotion_result": deployment.active.result_cache if deployment.active else None,
+        "mood_history": history_cache,
+        "fcm_token": token_index,
+        "friends": friend_index,
+    }
+    return [({"cache": name}, cache.stats()["hit_ratio"]) for name, cache in caches.items() if cache is not None]
+
+metrics.gauge('neus_inference_queue_depth', 'Journals waiting for a model batch',
+              function=lambda: inference_scheduler.queue_depth)
+metrics.gauge('neus_cache_hit_ratio', 'Cache hit ratio since startup', ['cache'], function=cache_hit_ratios)
+metrics.gauge('neus_firestore_coalesced_reads', 'Firestore reads answered by an identical read already in flight',
+              function=lambda: repository.coalesced if repository is not None else 0)
+metrics.gauge('neus_write_behind_pending', 'Buffered mood entry writes not yet in Firestore',
+              function=lambda: write_buffer.pending if write_buffer is not None else 0)
+metrics.gauge('neus_model_version', 'Model versions loaded for serving (1 per version and role)', ['version', 'role'],
+              function=lambda: [({"version": serving.version, "role": role}, 1)
+                                for role, serving in (("active", deployment.active), ("shadow", deployment.shadow))
+                                if serving is not None])
+metrics.gauge('neus_ready', 'Components ready to serve (1) or still starting (0)', ['component'],
+              function=lambda: [({"component": name}, int(ready)) for name, ready in startup_state.components.items()])
+
+async def record_request_metrics(request: Request, call_next):
+    """Count and time every request; log a sampled per-stage trace"""
+    trace = metrics.start_trace(request.method, request.url.path)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        http_seconds.observe(time.perf_counter() - started, method=request.method, route=route_path)
+        http_requests.inc(method=request.method, route=route_path, status=status)
+        metrics.finish_trace(trace, status)
+
+# Only installed with metrics on: the middleware itself costs a task per request
+if metrics.enabled:
+    app.add_middleware(BaseHTTPMiddleware, dispatch=record_request_metrics)
+
+def server_error(e: Exception) -> HTTPException:
+    """500 for an unexpected handler error, counted by exception type"""
+    handler_errors.inc(error=type(e).__name__)
+    logger.exception(f"Unhandled {type(e).__name__}: {e}")
+    return HTTPException(status_code=500, detail=str(e))
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints need NEUS_ADMIN_TOKEN set and sent back as X-Admin-Token"""
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+    if not hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def require_repository() -> MoodRepository:
+    """Firestore repository, or 503 while it is still initializing"""
+    if repository is None:
+        raise HTTPException(status_code=503, detail="Firestore is not ready", headers={"Retry-After": "1"})
+    return repository
+
+async def analyze_journal(text: str, deadline: Optional[float] = None) -> dict:
+    """
+    Emotion scores for a journal, served from cache when the text was seen before
+
+    Only model inference is subject to admission control; cache hits and
+    cascade first-stage answers are always served.
+    """
+    if not startup_state.is_ready("model"):
+        raise HTTPException(status_code=503, detail="Emotion model is still loading", headers={"Retry-After": "1"})
+    serving = deployment.active
+    with metrics.stage("cache_lookup"):
+        emotion_scores = await serving.result_cache.aget(text)
+    if emotion_scores is None and cascade is not None:
+        with metrics.stage("cascade"):
+            # Featurizing is CPU work; keep it off the event loop
+            emotion_scores = (await asyncio.to_thread(cascade.route, [text]))[0]
+        cascade_answers.inc(tier="first_stage" if emotion_scores is not None else "transformer")
+    if emotion_scores is None:
+        with metrics.stage("inference"):
+            started = time.perf_counter()
+            try:
+                emotion_scores = await admission.run(lambda: score_journal(text), deadline)
+            except AdmissionRejected as e:
+                admission_shed.inc(reason=e.reason)
+                raise
+        if cascade is not None:
+            cascade.record_escalated(1, time.perf_counter() - started)
+        # A swap while this journal waited may have released `serving`, and
+        # its batch may have run on the new version: cache only when neither
+        if deployment.active is serving and serving.result_cache is not None:
+            await serving.result_cache.aput(text, emotion_scores)
+        deployment.mirror(text, emotion_scores, score_with)
+    return emotion_scores
+
+async def score_journal(text: str) -> dict:
+    """Run a journal through the batch scheduler, as windows in long-text mode"""
+    long_text_chunker = deployment.active.long_text_chunker
+    if long_text_chunker is None:
+        return await inference_scheduler.submit(text)
+    plan = await asyncio.to_thread(long_text_chunker.plan, text)
+    if len(plan.windows) == 1:
+        return await inference_scheduler.submit(plan.windows[0])
+    # Windows join the shared batches, so a long journal never occupies a
+    # forward pass of its own
+    window_scores = await inference_scheduler.submit_many(plan.windows)
+    return aggregate_window_scores(window_scores, plan.tokens)
 
 # Data models
 class MoodEntry(BaseModel):
     mood: str
     journal: Optional[str] = ""
-    timestamp: datetime = datetime.now()
+    timestamp: datetime = Field(default_factory=datetime.now)
     user_id: str
 
-class CopingSuggestion(BaseModel):
-    suggestion: str
-    category: str
-    is_social: bool = False
-    friend_name: Optional[str] = None
-    activity: Optional[str] = None
-
 class Friend(BaseModel):
     name: str
     favorite_show: str
@@ -60,6 +519,13 @@ class PushNotification(BaseModel):
     body: str
     data: Optional[dict] = None
 
+class BulkNotification(BaseModel):
+    title: str
+    body: str
+    data: Optional[dict] = None
+    user_ids: Optional[List[str]] = None
+    segment: Optional[str] = None
+
 # Close friends database
 CLOSE_FRIENDS = [
     {"name": "Pratik", "favorite_show": "Silo", "last_talked": "2 days ago", "phone": "+1234567890"},
@@ -68,146 +534,164 @@ CLOSE_FRIENDS = [
     {"name": "Riya", "favorite_show": "Wednesday", "last_talked": "5 days ago", "phone": "+1234567893"}
 ]
 
+# Per-user friends from the users collection; CLOSE_FRIENDS when none are stored
+friend_index = FriendIndex(
+    lambda: repository,
+    CLOSE_FRIENDS,
+    ttl_seconds=float(os.getenv("NEUS_FRIENDS_TTL_SECONDS", "600")),
+)
+
+# Coping suggestion templates, compiled once
+suggestion_catalog = SuggestionCatalog()
+
 # Emotion analysis endpoint
 @app.post("/predict", response_model=dict)
-async def predict_mood_and_suggestions(entry: MoodEntry):
+async def predict_mood_and_suggestions(entry: MoodEntry, x_request_deadline_ms: Optional[float] = Header(None)):
     """
     Analyze journal text and return mood prediction with personalized coping suggestions
+
+    The model must answer within the X-Request-Deadline-Ms budget (or the
+    default). When it cannot, the entry is answered and stored without
+    emotion scores in degraded mode, or rejected with 503 and Retry-After.
     """
     try:
-        # Analyze journal text if provided
-        emotion_scores = {}
-        if entry.journal:
-            emotions = emotion_model(entry.journal)
-            emotion_scores = {emotion['label']: emotion['score'] for emotion in emotions}
-        
-        # Get personalized coping suggestions
-        suggestions = get_coping_suggestions(entry.mood, entry.user_id)
-        
-        # Store in Firestore
-        doc_ref = db.collection('mood_entries').add({
-            'user_id': entry.user_id,
-            'mood': entry.mood,
-            'journal': entry.journal,
-            'timestamp': entry.timestamp,
-            'emotion_scores': emotion_scores
-        })
-        
-        return {
-            "mood": entry.mood,
-            "emotion_analysis": emotion_scores,
-            "coping_suggestions": suggestions,
-            "entry_id": doc_ref[1].id
-        }
+        return await process_entry(entry, deadline=admission.deadline(x_request_deadline_ms), allow_degraded=DEGRADED_MODE)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": e.retry_after_header})
+    except QueueFullError as e:
+        retry_after = str(max(1, math.ceil(admission.estimate_wait())))
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": retry_after})
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise server_error(e)
 
-def get_coping_suggestions(mood: str, user_id: str) -> List[CopingSuggestion]:
-    """Generate personalized coping suggestions based on mood"""
-    import random
+# Streaming bulk analysis
+@app.post("/predict/stream")
+async def predict_stream(request: Request, store: bool = True, suggestions: bool = False, max_in_flight: int = STREAM_MAX_IN_FLIGHT):
+    """
+    Analyze an NDJSON stream of mood entries and stream NDJSON results back
+
+    Each output line is the `/predict` response for one input line (with
+    its `line` index) or its error; a final line carries a summary. Pass
+    `store=false` to analyze without writing entries.
+    """
+    if not startup_state.is_ready("model"):
+        raise HTTPException(status_code=503, detail="Emotion model is still loading", headers={"Retry-After": "1"})
+    if store and write_buffer is None:
+        require_repository()
+
+    async def handle(record: dict) -> dict:
+        try:
+            entry = MoodEntry(**record)
+        except ValidationError as e:
+            raise StreamError(f"Invalid entry: {e.errors(include_url=False)}", status=422)
+        for attempt in range(5):
+            try:
+                result = await process_entry(entry, store=store, with_suggestions=suggestions)
+                return jsonable_encoder(result)
+            except QueueFullError:
+                # Other traffic filled the inference queue; back off and retry
+                await asyncio.sleep(0.05 * 2 ** attempt)
+            except HTTPException as e:
+                raise StreamError(str(e.detail), status=e.status_code)
+        raise StreamError("Inference queue is full", status=503)
+
+    processor = NdjsonStreamProcessor(handle, max_in_flight=max(1, min(max_in_flight, STREAM_MAX_IN_FLIGHT)))
+    return StreamingResponse(processor.run(request.stream()), media_type="application/x-ndjson")
+
+async def process_entry(
+    entry: MoodEntry,
+    store: bool = True,
+    with_suggestions: bool = True,
+    deadline: Optional[float] = None,
+    allow_degraded: bool = False,
+) -> dict:
+    """
+    Analyze one entry, optionally suggest coping strategies and store it
+
+    With `allow_degraded`, an entry the model cannot score before `deadline`
+    still gets coping suggestions and is stored with empty emotion scores
+    (`backfill.py` can fill them in later); the response is marked degraded.
+    """
+    # Analyze journal text if provided
+    emotion_scores = {}
+    degraded = False
+    if entry.journal:
+        try:
+            emotion_scores = await analyze_journal(entry.journal, deadline)
+        except AdmissionRejected:
+            if not allow_degraded:
+                raise
+            degraded = True
+            admission.degraded += 1
+            degraded_responses.inc()
     
-    # Get user's friends (in production, fetch from user's profile)
-    friends = CLOSE_FRIENDS
-    random_friend = random.choice(friends)
+    result = {"mood": entry.mood, "emotion_analysis": emotion_scores}
     
-    suggestions_map = {
-        "excellent": [
-            CopingSuggestion(
-                suggestion=f"Let's call {random_friend['name']} and talk about your favorite show {random_friend['favorite_show']}!",
-                category="social",
-                is_social=True,
-                friend_name=random_friend['name'],
-                activity=random_friend['favorite_show']
-            ),
-            CopingSuggestion(
-                suggestion="Share your positive energy with someone today",
-                category="social",
-                is_social=False
-            ),
-            CopingSuggestion(
-                suggestion="Practice gratitude - write down 3 things you're thankful for",
-                category="mindfulness",
-                is_social=False
-            )
-        ],
-        "good": [
-            CopingSuggestion(
-                suggestion=f"Text {random_friend['name']} about the latest episode of {random_friend['favorite_show']}",
-                category="social",
-                is_social=True,
-                friend_name=random_friend['name'],
-                activity=random_friend['favorite_show']
-            ),
-            CopingSuggestion(
-                suggestion="Take a mindful walk outside",
-                category="physical",
-                is_social=False
-            )
-        ],
-        "okay": [
-            CopingSuggestion(
-                suggestion=f"Reach out to {random_friend['name']} - you haven't talked in {random_friend['last_talked']}",
-                category="social",
-                is_social=True,
-                friend_name=random_friend['name']
-            ),
-            CopingSuggestion(
-                suggestion="Practice deep breathing exercises",
-                category="mindfulness",
-                is_social=False
-            )
-        ],
-        "struggling": [
-            CopingSuggestion(
-                suggestion=f"Call {random_friend['name']} and catch up about {random_friend['favorite_show']} - connection helps",
-                category="social",
-                is_social=True,
-                friend_name=random_friend['name'],
-                activity=random_friend['favorite_show']
-            ),
-            CopingSuggestion(
-                suggestion="Try progressive muscle relaxation",
-                category="mindfulness",
-                is_social=False
-            )
-        ],
-        "difficult": [
-            CopingSuggestion(
-                suggestion=f"Text {random_friend['name']} that you need someone to talk to - they care about you",
-                category="social",
-                is_social=True,
-                friend_name=random_friend['name']
-            ),
-            CopingSuggestion(
-                suggestion="Consider professional support",
-                category="professional",
-                is_social=False
-            )
-        ]
+    # Get personalized coping suggestions
+    if with_suggestions or degraded:
+        with metrics.stage("suggestions"):
+            result["coping_suggestions"] = await get_coping_suggestions(entry.mood, entry.user_id)
+    
+    if degraded:
+        result["degraded"] = True
+    if not store:
+        result["entry_id"] = None
+        return result
+    
+    # Store in Firestore (or the write-behind log, flushed in batches)
+    entry_data = {
+        'user_id': entry.user_id,
+        'mood': entry.mood,
+        'journal': entry.journal,
+        'timestamp': entry.timestamp,
+        'emotion_scores': emotion_scores
     }
+    if write_buffer is not None:
+        with metrics.stage("write_behind"):
+            entry_id = write_buffer.add('mood_entries', entry_data)
+    else:
+        with metrics.stage("firestore_write"):
+            entry_id = await require_repository().add_entry(entry_data)
+    with metrics.stage("cache_update"):
+        history_cache.record(entry.user_id, entry_id, entry_data)
+        # Missing scores are not a neutral mood, so degraded entries skip the trend
+        if not degraded:
+            trend_registry.record(entry.user_id, sentiment_score(emotion_scores), entry.timestamp, entry_id)
     
-    return suggestions_map.get(mood, [])
+    result["entry_id"] = entry_id
+    return result
+
+async def get_coping_suggestions(mood: str, user_id: str) -> List[CopingSuggestion]:
+    """Generate personalized coping suggestions based on mood"""
+    return suggestion_catalog.render(mood, await friend_index.get(user_id))
 
 # Get mood history
 @app.get("/mood-history/{user_id}")
-async def get_mood_history(user_id: str, limit: int = 10):
-    """Get user's mood history from Firestore"""
+async def get_mood_history(user_id: str, limit: int = Query(10, ge=1), cursor: Optional[str] = None):
+    """Get user's mood history, newest first; pass `next_cursor` back for older pages"""
     try:
-        docs = db.collection('mood_entries')\
-                 .where('user_id', '==', user_id)\
-                 .order_by('timestamp', direction=firestore.Query.DESCENDING)\
-                 .limit(limit)\
-                 .stream()
-        
-        history = []
-        for doc in docs:
-            data = doc.to_dict()
-            data['id'] = doc.id
-            history.append(data)
-        
-        return {"history": history}
+        history, next_cursor = await history_cache.get_page(user_id, limit, cursor)
+        return {"history": history, "next_cursor": next_cursor}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise server_error(e)
+
+# Mood trend
+@app.get("/mood-trend/{user_id}")
+async def get_mood_trend(user_id: str):
+    """Get user's mood trend: slope, averages and daily/weekly rollups"""
+    try:
+        trend = await trend_registry.get(user_id)
+        return trend.report()
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise server_error(e)
 
 # Push notification endpoint
 @app.post("/send-notification")
@@ -215,11 +699,10 @@ async def send_push_notification(notification: PushNotification):
     """Send push notification to user"""
     try:
         # Get user's FCM token from Firestore
-        user_doc = db.collection('users').document(notification.user_id).get()
-        if not user_doc.exists:
+        user_data = await require_repository().get_user(notification.user_id, ['fcm_token'])
+        if user_data is None:
             raise HTTPException(status_code=404, detail="User not found")
         
-        user_data = user_doc.to_dict()
         fcm_token = user_data.get('fcm_token')
         
         if not fcm_token:
@@ -236,26 +719,172 @@ async def send_push_notification(notification: PushNotification):
         )
         
         # Send message
-        response = messaging.send(message)
+        with metrics.stage("fcm_send"):
+            response = await asyncio.to_thread(messaging.send, message)
+        metrics.fcm_messages.inc(outcome='sent')
         return {"success": True, "message_id": response}
     
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise server_error(e)
+
+# Bulk push notification campaign
+@app.post("/send-notification/bulk", dependencies=[Depends(require_admin)])
+async def send_bulk_notification(notification: BulkNotification, wait: bool = False):
+    """Send a notification to a list of users or a segment; returns the campaign report"""
+    if (notification.user_ids is None) == (notification.segment is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of user_ids or segment")
+    require_repository()
+
+    campaign = notification_fanout.create(notification.title, notification.body, notification.data)
+    run = notification_fanout.run(campaign, user_ids=notification.user_ids, segment=notification.segment)
+    if wait:
+        return await run
+    task = asyncio.create_task(run)
+    campaign_tasks.add(task)
+    task.add_done_callback(campaign_tasks.discard)
+    return JSONResponse(status_code=202, content=campaign.report())
+
+@app.get("/send-notification/bulk/{campaign_id}", dependencies=[Depends(require_admin)])
+async def get_bulk_notification(campaign_id: str):
+    """Progress and throughput of a bulk notification campaign"""
+    campaign = notification_fanout.campaigns.get(campaign_id)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return {**campaign.report(), "token_index": token_index.stats()}
 
 # Get friends list
 @app.get("/friends/{user_id}")
 async def get_friends(user_id: str):
     """Get user's close friends list"""
     try:
-        # In production, fetch from user's profile in Firestore
-        return {"friends": CLOSE_FRIENDS}
+        return {"friends": await friend_index.get(user_id)}
+    except Exception as e:
+        raise server_error(e)
+
+@app.put("/friends/{user_id}")
+async def update_friends(user_id: str, friends: List[Friend]):
+    """Replace user's close friends list"""
+    try:
+        require_repository()
+        return {"friends": await friend_index.update(user_id, [friend.model_dump() for friend in friends])}
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise server_error(e)
+
+# Inference batching stats
+@app.get("/inference/stats")
+async def get_inference_stats():
+    """Report recent batch sizes, latencies and queue waits, cache counters, cascade routing and admission"""
+    return {
+        **inference_scheduler.stats(),
+        "cache": deployment.active.result_cache.stats() if deployment.active else None,
+        "cascade": cascade.stats() if cascade else None,
+        "admission": admission.stats(),
+    }
 
-# Health check
+# Mood history cache stats
+@app.get("/mood-history-cache/stats")
+async def get_history_cache_stats():
+    """Report history cache hit ratio, Firestore reads saved and repository call counts"""
+    return {**history_cache.stats(), "repository": repository.stats() if repository is not None else None}
+
+# Write-behind buffer stats
+@app.get("/write-behind/stats")
+async def get_write_behind_stats():
+    """Report buffered, flushed and failed mood entry writes"""
+    if write_buffer is None:
+        return {"enabled": False}
+    return {"enabled": True, **write_buffer.stats()}
+
+def require_model_version(version: str) -> str:
+    """`version` if it exists in the registry and the model can be changed now"""
+    if MODEL_REGISTRY is None:
+        raise HTTPException(status_code=404, detail="No model registry configured")
+    try:
+        MODEL_REGISTRY.manifest(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {version}")
+    if not startup_state.is_ready("model"):
+        raise HTTPException(status_code=503, detail="Emotion model is still loading", headers={"Retry-After": "1"})
+    if deployment.lock.locked():
+        raise HTTPException(status_code=409, detail=f"Model change in progress: {deployment.state}")
+    return version
+
+async def run_model_change(change, wait: bool):
+    """Await a deployment change, or run it in the background and answer 202"""
+    if wait:
+        try:
+            await change
+        except Exception as e:
+            raise server_error(e)
+        return deployment.stats()
+
+    async def run():
+        try:
+            await change
+        except Exception as e:
+            # Recorded in deployment.last_error for GET /admin/models
+            logger.error(f"Model change failed: {e}")
+
+    task = asyncio.create_task(run())
+    model_tasks.add(task)
+    task.add_done_callback(model_tasks.discard)
+    return JSONResponse(status_code=202, content=jsonable_encoder(deployment.stats()))
+
+@app.get("/admin/models", dependencies=[Depends(require_admin)])
+async def list_models():
+    """Registry versions, the active and shadow versions, and recent swaps"""
+    return {
+        "registry_active": MODEL_REGISTRY.active_version() if MODEL_REGISTRY else None,
+        "versions": MODEL_REGISTRY.versions() if MODEL_REGISTRY else [],
+        **deployment.stats(),
+    }
+
+@app.post("/admin/models/{version}/activate", dependencies=[Depends(require_admin)])
+async def activate_model(version: str, wait: bool = False):
+    """Load and warm `version` next to the current one, then switch traffic to it"""
+    require_model_version(version)
+
+    async def activate():
+        await deployment.activate(version)
+        # Restarts come up on the new version
+        MODEL_REGISTRY.set_active(version)
+
+    return await run_model_change(activate(), wait)
+
+@app.post("/admin/models/{version}/shadow", dependencies=[Depends(require_admin)])
+async def shadow_model(version: str, percent: float = Query(10.0, ge=0, le=100), wait: bool = False):
+    """Mirror `percent` of analyzed journals to `version` and compare its scores"""
+    require_model_version(version)
+    return await run_model_change(deployment.start_shadow(version, percent), wait)
+
+@app.delete("/admin/models/shadow", dependencies=[Depends(require_admin)])
+async def stop_shadow_model():
+    """Stop mirroring traffic and release the shadow version"""
+    await deployment.stop_shadow()
+    return deployment.stats()
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def get_metrics():
+    """Stage timings, queue depth, batch sizes, Firestore/FCM calls and cache hit ratios"""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Health check (liveness only; see /ready)
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now()}
 
+# Readiness probe: 200 only once the model is warm and Firestore answers
+@app.get("/ready")
+async def readiness_check():
+    report = startup_state.report()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
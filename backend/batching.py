@@ -0,0 +1,212 @@
+# backend/batching.py
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue cannot accept another request"""
+
+
+class BatchScheduler:
+    """
+    Dynamic micro-batching scheduler for model inference.
+
+    Requests are queued and coalesced into a single batch once either
+    `max_batch_size` items are waiting or the oldest item has waited
+    `max_wait_ms`. Each batch runs as one forward pass on a dedicated
+    executor thread so the event loop is never blocked. Up to
+    `max_concurrent_batches` batches may be in flight at once, which lets a
+    multi-process worker pool keep every worker busy.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[str]], List[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        max_queue_size: int = 1024,
+        max_concurrent_batches: int = 1,
+        history_size: int = 256,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_queue_size = max_queue_size
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self.batch_history: Deque[Tuple[int, float]] = deque(maxlen=history_size)
+        self.total_batches = 0
+        self.total_items = 0
+        self.batch_listeners: List[Callable[[int, float], None]] = []
+        # Seconds each item spent queued before its batch started
+        self.wait_history: Deque[float] = deque(maxlen=history_size)
+        self.wait_listeners: List[Callable[[float], None]] = []
+
+        self._pending: Deque[Tuple[str, asyncio.Future, float]] = deque()
+        self._not_empty: Optional[asyncio.Event] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight: set = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent_batches, thread_name_prefix="inference"
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        """Start the background batching loop on the running event loop"""
+        if self.running:
+            return
+        self._not_empty = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            "Batch scheduler started (max_batch_size=%d, max_wait_ms=%.1f, max_queue_size=%d)",
+            self.max_batch_size, self.max_wait * 1000, self.max_queue_size,
+        )
+
+    async def stop(self):
+        """Stop the batching loop and fail any requests still waiting"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in list(self._in_flight):
+            task.cancel()
+
+        while self._pending:
+            _, future, _ = self._pending.popleft()
+            if not future.done():
+                future.set_exception(RuntimeError("Inference scheduler stopped"))
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, text: str) -> Any:
+        """Queue a single text and wait for its slot in the next batch"""
+        if not self.running:
+            raise RuntimeError("Inference scheduler is not running")
+        if len(self._pending) >= self.max_queue_size:
+            raise QueueFullError(f"Inference queue is full ({self.max_queue_size} pending)")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        self._not_empty.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._batch_full.set()
+        return await future
+
+    async def submit_many(self, texts: List[str]) -> List[Any]:
+        """Queue several texts at once; they may be split across batches"""
+        # All or nothing: a partly queued request would only waste its batches
+        if len(self._pending) + len(texts) > self.max_queue_size:
+            raise QueueFullError(f"Inference queue is full ({len(self._pending)} pending, {len(texts)} requested)")
+        return list(await asyncio.gather(*(self.submit(text) for text in texts)))
+
+    def stats(self) -> Dict:
+        """Summary of recent batch sizes and latencies"""
+        sizes = [size for size, _ in self.batch_history]
+        latencies = sorted(latency for _, latency in self.batch_history)
+        waits = sorted(wait * 1000 for wait in self.wait_history)
+        return {
+            "queue_depth": self.queue_depth,
+            "total_batches": self.total_batches,
+            "total_items": self.total_items,
+            "recent_batches": len(sizes),
+            "avg_batch_size": sum(sizes) / len(sizes) if sizes else 0.0,
+            "max_batch_size_seen": max(sizes) if sizes else 0,
+            "p50_batch_latency_ms": _percentile(latencies, 0.50),
+            "p95_batch_latency_ms": _percentile(latencies, 0.95),
+            "p50_queue_wait_ms": _percentile(waits, 0.50),
+            "p95_queue_wait_ms": _percentile(waits, 0.95),
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._not_empty.wait()
+            # While every batch slot is busy, new requests keep accumulating
+            await self._slots.acquire()
+
+            # Give the batch a chance to fill up, bounded by the wait window
+            if len(self._pending) < self.max_batch_size and self.max_wait > 0:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), timeout=self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = []
+            now = time.perf_counter()
+            while self._pending and len(batch) < self.max_batch_size:
+                text, future, enqueued = self._pending.popleft()
+                # Skip requests whose caller already went away
+                if not future.done():
+                    batch.append((text, future))
+                    self.wait_history.append(now - enqueued)
+                    for listener in self.wait_listeners:
+                        listener(now - enqueued)
+
+            if not self._pending:
+                self._not_empty.clear()
+            if len(self._pending) < self.max_batch_size:
+                self._batch_full.clear()
+
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._dispatch(loop, batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, loop: asyncio.AbstractEventLoop, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            await self._run_batch(loop, batch)
+        finally:
+            self._slots.release()
+
+    async def _run_batch(self, loop: asyncio.AbstractEventLoop, batch: List[Tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        started = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(self._executor, self.run_batch, texts)
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(batch)} inputs")
+        except Exception as e:
+            logger.error(f"Inference batch of {len(batch)} failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.batch_history.append((len(batch), latency_ms))
+        self.total_batches += 1
+        self.total_items += len(batch)
+        logger.debug("Inference batch size=%d latency=%.1fms", len(batch), latency_ms)
+        for listener in self.batch_listeners:
+            listener(len(batch), latency_ms)
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
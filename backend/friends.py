@@ -0,0 +1,100 @@
+# backend/friends.py
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FriendIndex:
+    """
+    Cached `user_id -> friends` index over the `users` collection.
+
+    A user's friends live in the `friends` array of their user document and
+    are read with a single-field repository `get_user`. Users without friends on file get
+    `default_friends`. `update` writes through to Firestore and refreshes the
+    cache, so `/friends` and coping suggestions see the change immediately;
+    entries expire after `ttl_seconds` to pick up edits made elsewhere.
+    """
+
+    def __init__(
+        self,
+        get_repository: Callable[[], Any],
+        default_friends: List[Dict],
+        ttl_seconds: float = 600.0,
+        max_users: int = 10000,
+    ):
+        self.get_repository = get_repository
+        self.default_friends = default_friends
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cached(self, user_id: str) -> Optional[List[Dict]]:
+        """The user's friends if cached and fresh, else None (counted as a miss)"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    async def get(self, user_id: str) -> List[Dict]:
+        """The user's friends; the defaults when none are stored or Firestore is unavailable"""
+        friends = self.cached(user_id)
+        if friends is not None:
+            return friends
+
+        repository = self.get_repository()
+        if repository is None:
+            return self.default_friends
+        try:
+            user = await repository.get_user(user_id, ['friends'])
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Could not load friends of {user_id}, using defaults: {e}")
+            return self.default_friends
+
+        friends = (user or {}).get('friends') or self.default_friends
+        self._store(user_id, friends)
+        return friends
+
+    async def update(self, user_id: str, friends: List[Dict]) -> List[Dict]:
+        """Replace the user's friends in Firestore and in the cache"""
+        await self.get_repository().update_user(user_id, {'friends': friends})
+        friends = friends or self.default_friends
+        self._store(user_id, friends)
+        return friends
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Drop one user's entry, or every entry"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "errors": self.errors,
+        }
+
+    def _store(self, user_id: str, friends: List[Dict]):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic(), friends)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
@@ -0,0 +1,201 @@
+# backend/history_cache.py
+import base64
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fields the history and insight screens render; everything else stays in Firestore
+HISTORY_FIELDS = ['mood', 'journal', 'timestamp', 'emotion_scores']
+
+
+def _utc(value: datetime) -> datetime:
+    """Firestore stores naive datetimes as UTC; compare everything that way"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+# An entry's place in a history, newest first: (timestamp, document ID).
+# The ID breaks ties between entries written in the same instant
+Position = Tuple[datetime, Optional[str]]
+
+
+def _position(entry: Dict) -> Position:
+    return _utc(entry['timestamp']), entry['id']
+
+
+def _older(entry: Dict, position: Position) -> bool:
+    """True when `entry` comes after `position` in newest-first order"""
+    timestamp, doc_id = _position(entry)
+    if position[1] is None:
+        # Cursor issued before IDs were encoded: timestamp only
+        return timestamp < position[0]
+    return (timestamp, doc_id) < position
+
+
+def encode_cursor(entry: Dict) -> str:
+    timestamp, doc_id = _position(entry)
+    payload = json.dumps({"t": timestamp.isoformat(), "id": doc_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+class InvalidCursorError(ValueError):
+    """Raised for a pagination cursor this cache did not issue"""
+
+
+def decode_cursor(cursor: str) -> Position:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        doc_id = payload.get("id")
+        if doc_id is not None and not isinstance(doc_id, str):
+            raise TypeError("cursor id must be a string")
+        return _utc(datetime.fromisoformat(payload["t"])), doc_id
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise InvalidCursorError(f"Invalid history cursor: {cursor!r}") from e
+
+
+class _UserWindow:
+    """Most recent entries of one user, newest first"""
+
+    def __init__(self, entries: List[Dict], complete: bool):
+        self.loaded_at = time.monotonic()
+        self.entries = entries
+        # True when the window holds the user's entire history
+        self.complete = complete
+
+
+class MoodHistoryCache:
+    """
+    Per-user in-process cache of the most recent mood entries.
+
+    The newest `hot_window` entries of each active user are loaded with one
+    projected repository query and then kept current by `record`, which `/predict`
+    calls on every write. Pages beyond the hot window are read with
+    `start_after` cursors instead of ever-larger limits. Entries are ordered
+    by timestamp, then document ID, so entries sharing a timestamp are
+    never skipped or repeated across pages. Users are evicted
+    least-recently-used beyond `max_users`, and windows are reloaded after
+    `ttl_seconds` to pick up writes made by other API processes.
+    """
+
+    def __init__(
+        self,
+        get_repository: Callable[[], Any],
+        hot_window: int = 50,
+        max_users: int = 10000,
+        ttl_seconds: float = 300.0,
+        fields: Optional[List[str]] = None,
+    ):
+        self.get_repository = get_repository
+        self.hot_window = hot_window
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.fields = fields or HISTORY_FIELDS
+
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        self.documents_read = 0
+        self.reads_saved = 0
+
+        self._users: "OrderedDict[str, _UserWindow]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get_page(self, user_id: str, limit: int = 10, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        One page of a user's history, newest first
+
+        Returns:
+            Tuple[List[Dict], Optional[str]]: The entries and the cursor for
+            the next page (None once the history is exhausted)
+
+        Raises:
+            ValueError: `limit` is not positive
+            InvalidCursorError: `cursor` was not issued by this cache
+        """
+        if limit <= 0:
+            raise ValueError(f"limit must be positive, got {limit}")
+        after = decode_cursor(cursor) if cursor else None
+        window, hit = await self._window(user_id)
+
+        cached = [entry for entry in window.entries if after is None or _older(entry, after)]
+        page = [dict(entry) for entry in cached[:limit]]
+        if hit:
+            self.reads_saved += len(page)
+
+        exhausted = window.complete and len(cached) <= limit
+        if len(page) < limit and not window.complete:
+            # Continue past the hot window straight from Firestore
+            start = _position(page[-1]) if page else after
+            requested = limit - len(page)
+            older = await self._query(user_id, requested, start)
+            page.extend(older)
+            exhausted = len(older) < requested
+
+        next_cursor = None if exhausted or not page else encode_cursor(page[-1])
+        return page, next_cursor
+
+    def record(self, user_id: str, entry_id: str, data: Dict):
+        """Add a freshly written entry to the user's hot window, if cached"""
+        entry = {'id': entry_id, **{field: data.get(field) for field in self.fields}}
+        with self._lock:
+            window = self._users.get(user_id)
+            if window is None:
+                return
+            key = _position(entry)
+            position = 0
+            while position < len(window.entries) and _position(window.entries[position]) > key:
+                position += 1
+            window.entries.insert(position, entry)
+            if len(window.entries) > self.hot_window:
+                window.entries.pop()
+                window.complete = False
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._users),
+            "hot_window": self.hot_window,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "firestore_queries": self.queries,
+            "firestore_documents_read": self.documents_read,
+            "firestore_reads_saved": self.reads_saved,
+        }
+
+    async def _window(self, user_id: str) -> Tuple[_UserWindow, bool]:
+        with self._lock:
+            window = self._users.get(user_id)
+            if window is not None and time.monotonic() - window.loaded_at <= self.ttl_seconds:
+                self._users.move_to_end(user_id)
+                self.hits += 1
+                return window, True
+            self._users.pop(user_id, None)
+            self.misses += 1
+
+        entries = await self._query(user_id, self.hot_window, None)
+        window = _UserWindow(entries, complete=len(entries) < self.hot_window)
+        with self._lock:
+            # Another request may have loaded (and updated) it meanwhile
+            window = self._users.setdefault(user_id, window)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return window, False
+
+    async def _query(self, user_id: str, limit: int, start_after: Optional[Position]) -> List[Dict]:
+        if limit <= 0:
+            return []
+        entries = await self.get_repository().recent_entries(user_id, limit, start_after, self.fields)
+        self.queries += 1
+        self.documents_read += len(entries)
+        return entries
@@ -0,0 +1,258 @@
+# backend/hot_swap.py
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ServingModel:
+    """
+    One loaded model version and the state derived from it
+
+    Counts the batches running on it so a replaced version is only torn
+    down once the batches already handed to it have finished.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        score_batch: Callable[[List[str]], List[dict]],
+        result_cache=None,
+        long_text_chunker=None,
+        close: Optional[Callable[[], None]] = None,
+    ):
+        self.version = version
+        self.result_cache = result_cache
+        self.long_text_chunker = long_text_chunker
+        self.loaded_at = time.time()
+        self._score_batch = score_batch
+        self._close = close
+        self._in_flight = 0
+        self._idle = threading.Condition()
+
+    def pin(self):
+        """Count a batch as running on this version; `release` waits for its `unpin`"""
+        with self._idle:
+            self._in_flight += 1
+
+    def unpin(self):
+        with self._idle:
+            self._in_flight -= 1
+            if not self._in_flight:
+                self._idle.notify_all()
+
+    def score(self, texts: List[str]) -> List[dict]:
+        self.pin()
+        try:
+            return self._score_batch(texts)
+        finally:
+            self.unpin()
+
+    def release(self, timeout: float = 60.0):
+        """Wait for running batches, then free the weights (workers, engine, cache)"""
+        with self._idle:
+            if not self._idle.wait_for(lambda: self._in_flight == 0, timeout):
+                logger.warning(f"Model {self.version} still has {self._in_flight} batches running; releasing anyway")
+        if self._close is not None:
+            self._close()
+        self._score_batch = None
+        self.result_cache = None
+        self.long_text_chunker = None
+        logger.info(f"Released model {self.version}")
+
+    def describe(self) -> Dict:
+        return {"version": self.version, "loaded_at": self.loaded_at, "in_flight_batches": self._in_flight}
+
+
+class ModelDeployment:
+    """
+    Active model version plus an optional shadow, swapped without downtime
+
+    A new version is loaded and warmed in a worker thread while the current
+    one keeps serving. Switching is a single reference assignment under
+    `_swap_lock`, and `score_active` reads the reference and pins the
+    version under the same lock, so every batch runs entirely on one
+    version and the old version is released only once the batches pinned
+    to it finish. A shadow version
+    scores `shadow_percent` of requests in the background, after the
+    response is computed, and its agreement with the active version is
+    reported by `stats()`.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[Optional[str]], ServingModel],
+        warmup: Callable[[ServingModel], None],
+        max_shadow_in_flight: int = 4,
+        rng: Optional[random.Random] = None,
+    ):
+        self.load = load
+        self.warmup = warmup
+        self.max_shadow_in_flight = max_shadow_in_flight
+        self.active: Optional[ServingModel] = None
+        self.shadow: Optional[ServingModel] = None
+        self.shadow_percent = 0.0
+        self.state = "idle"
+        self.last_error: Optional[str] = None
+        self.events = deque(maxlen=20)
+        self._rng = rng or random.Random()
+        self._lock: Optional[asyncio.Lock] = None
+        # Held only to swap a reference or to read and pin it, never across I/O
+        self._swap_lock = threading.Lock()
+        self._shadow_tasks = set()
+        self._reset_shadow_stats()
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created on first use so it belongs to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _reset_shadow_stats(self):
+        self._shadow_compared = 0
+        self._shadow_agreed = 0
+        self._shadow_abs_diff = 0.0
+        self._shadow_seconds = 0.0
+        self._shadow_errors = 0
+        self._shadow_skipped = 0
+
+    def score_active(self, texts: List[str]) -> List[dict]:
+        """Score a batch on the active version, pinned so a concurrent swap waits for it"""
+        with self._swap_lock:
+            serving = self.active
+            serving.pin()
+        try:
+            return serving.score(texts)
+        finally:
+            serving.unpin()
+
+    def _record(self, event: str, version: Optional[str], **details):
+        self.events.append({"event": event, "version": version, "at": time.time(), **details})
+        logger.info(f"Model {event}: {version} {details or ''}")
+
+    async def _prepare(self, version: Optional[str]) -> ServingModel:
+        self.state = f"loading {version}"
+        started = time.perf_counter()
+        candidate = await asyncio.to_thread(self.load, version)
+        try:
+            self.state = f"warming {version}"
+            await asyncio.to_thread(self.warmup, candidate)
+        except Exception:
+            await asyncio.to_thread(candidate.release)
+            raise
+        self._record("loaded", version, seconds=round(time.perf_counter() - started, 3))
+        return candidate
+
+    async def activate(self, version: Optional[str]) -> ServingModel:
+        """Load, warm and switch traffic to `version`; reuses it if it is the shadow"""
+        async with self.lock:
+            try:
+                if self.shadow is not None and self.shadow.version == version:
+                    with self._swap_lock:
+                        candidate, self.shadow, self.shadow_percent = self.shadow, None, 0.0
+                else:
+                    candidate = await self._prepare(version)
+            except Exception as e:
+                self.state = "idle"
+                self.last_error = f"{type(e).__name__}: {e}"
+                self._record("failed", version, error=self.last_error)
+                raise
+            with self._swap_lock:
+                previous, self.active = self.active, candidate
+            self._record("activated", candidate.version)
+            if previous is not None:
+                self.state = f"releasing {previous.version}"
+                await asyncio.to_thread(previous.release)
+            self.state = "idle"
+            return candidate
+
+    async def start_shadow(self, version: str, percent: float):
+        """Mirror `percent` of requests to `version` for comparison"""
+        async with self.lock:
+            try:
+                candidate = await self._prepare(version)
+            except Exception as e:
+                self.state = "idle"
+                self.last_error = f"{type(e).__name__}: {e}"
+                self._record("failed", version, error=self.last_error)
+                raise
+            with self._swap_lock:
+                previous, self.shadow = self.shadow, candidate
+                self.shadow_percent = max(0.0, min(100.0, percent))
+            self._reset_shadow_stats()
+            self._record("shadowing", version, percent=self.shadow_percent)
+            if previous is not None:
+                await asyncio.to_thread(previous.release)
+            self.state = "idle"
+
+    async def stop_shadow(self):
+        async with self.lock:
+            with self._swap_lock:
+                previous, self.shadow, self.shadow_percent = self.shadow, None, 0.0
+            if previous is not None:
+                self._record("shadow stopped", previous.version)
+                await asyncio.to_thread(previous.release)
+
+    def mirror(self, text: str, primary_scores: dict, score: Callable[[ServingModel, str], dict]):
+        """Maybe score `text` on the shadow in the background and compare the results"""
+        if self._rng.random() * 100 >= self.shadow_percent:
+            return
+        if len(self._shadow_tasks) >= self.max_shadow_in_flight:
+            self._shadow_skipped += 1
+            return
+        with self._swap_lock:
+            shadow = self.shadow
+            if shadow is None:
+                return
+            # Unpinned in _compare, so stopping the shadow waits for the comparison
+            shadow.pin()
+        task = asyncio.create_task(self._compare(shadow, text, primary_scores, score))
+        self._shadow_tasks.add(task)
+        task.add_done_callback(self._shadow_tasks.discard)
+
+    async def _compare(self, shadow: ServingModel, text: str, primary_scores: dict,
+                       score: Callable[[ServingModel, str], dict]):
+        started = time.perf_counter()
+        try:
+            shadow_scores = await asyncio.to_thread(score, shadow, text)
+        except Exception as e:
+            self._shadow_errors += 1
+            logger.warning(f"Shadow model {shadow.version} failed: {e}")
+            return
+        finally:
+            shadow.unpin()
+        if shadow is not self.shadow:
+            return
+        self._shadow_seconds += time.perf_counter() - started
+        self._shadow_compared += 1
+        if primary_scores and shadow_scores:
+            self._shadow_agreed += max(primary_scores, key=primary_scores.get) == max(shadow_scores, key=shadow_scores.get)
+            labels = set(primary_scores) | set(shadow_scores)
+            self._shadow_abs_diff += sum(
+                abs(primary_scores.get(label, 0.0) - shadow_scores.get(label, 0.0)) for label in labels
+            ) / len(labels)
+
+    def stats(self) -> Dict:
+        compared = self._shadow_compared
+        return {
+            "active": self.active.describe() if self.active else None,
+            "state": self.state,
+            "last_error": self.last_error,
+            "shadow": {
+                **self.shadow.describe(),
+                "percent": self.shadow_percent,
+                "compared": compared,
+                "top_emotion_agreement": self._shadow_agreed / compared if compared else None,
+                "mean_abs_score_diff": self._shadow_abs_diff / compared if compared else None,
+                "mean_latency_ms": self._shadow_seconds / compared * 1000 if compared else None,
+                "errors": self._shadow_errors,
+                "skipped": self._shadow_skipped,
+            } if self.shadow else None,
+            "events": list(self.events),
+        }
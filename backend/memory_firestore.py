@@ -0,0 +1,284 @@
+# backend/memory_firestore.py
+import copy
+import secrets
+import string
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from google.cloud.firestore import DELETE_FIELD
+except ImportError:  # pragma: no cover - only without the Firebase SDK installed
+    DELETE_FIELD = object()
+
+_AUTO_ID_ALPHABET = string.ascii_letters + string.digits
+
+
+def new_document_id() -> str:
+    """Firestore-style 20 character auto ID, generated client-side"""
+    return "".join(secrets.choice(_AUTO_ID_ALPHABET) for _ in range(20))
+
+
+class InMemoryFirestore:
+    """
+    Local stand-in for the subset of the Firestore client the backend uses.
+
+    Supports `collection().add/document/where/order_by/limit/start_after/
+    select/stream`, document `get/set/update/delete`, batched writes and
+    `get_all`. Read and write counts are tracked so tests and benchmarks can
+    assert on Firestore traffic.
+    """
+
+    def __init__(self):
+        self._collections: Dict[str, Dict[str, Dict]] = {}
+        self._lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+
+    def collection(self, name: str) -> "_Collection":
+        return _Collection(self, name)
+
+    def batch(self) -> "_WriteBatch":
+        return _WriteBatch(self)
+
+    def get_all(self, references: Iterable["_DocumentRef"], field_paths: Optional[List[str]] = None):
+        for reference in references:
+            yield reference.get(field_paths=field_paths)
+
+    def _documents(self, collection: str) -> Dict[str, Dict]:
+        return self._collections.setdefault(collection, {})
+
+
+class _Snapshot:
+    def __init__(self, reference: "_DocumentRef", data: Optional[Dict]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field: str) -> Any:
+        # Like DocumentSnapshot.get: None for a missing document, KeyError for a missing field
+        if self._data is None:
+            return None
+        return self._data[field]
+
+
+class _DocumentRef:
+    def __init__(self, store: InMemoryFirestore, collection: str, doc_id: str):
+        self._store = store
+        self._collection = collection
+        self.id = doc_id
+
+    def get(self, field_paths: Optional[List[str]] = None) -> _Snapshot:
+        with self._store._lock:
+            self._store.reads += 1
+            data = self._store._documents(self._collection).get(self.id)
+            if data is not None and field_paths is not None:
+                data = {field: data[field] for field in field_paths if field in data}
+            return _Snapshot(self, copy.deepcopy(data))
+
+    def set(self, data: Dict, merge: bool = False):
+        with self._store._lock:
+            self._store.writes += 1
+            documents = self._store._documents(self._collection)
+            current = documents.get(self.id, {}) if merge else {}
+            documents[self.id] = _apply(current, data)
+
+    def update(self, data: Dict):
+        with self._store._lock:
+            documents = self._store._documents(self._collection)
+            if self.id not in documents:
+                raise KeyError(f"No document to update: {self._collection}/{self.id}")
+            self._store.writes += 1
+            documents[self.id] = _apply(documents[self.id], data)
+
+    def delete(self):
+        with self._store._lock:
+            self._store.writes += 1
+            self._store._documents(self._collection).pop(self.id, None)
+
+
+class _Query:
+    def __init__(self, store: InMemoryFirestore, collection: str):
+        self._store = store
+        self._collection = collection
+        self._filters: List[Tuple[str, str, Any]] = []
+        self._orders: List[Tuple[str, str]] = []
+        self._limit: Optional[int] = None
+        self._start_after: Optional[Dict] = None
+        self._fields: Optional[List[str]] = None
+
+    def _copy(self) -> "_Query":
+        query = _Query(self._store, self._collection)
+        query._filters = list(self._filters)
+        query._orders = list(self._orders)
+        query._limit = self._limit
+        query._start_after = self._start_after
+        query._fields = self._fields
+        return query
+
+    def where(self, field: str = None, op: str = None, value: Any = None, filter=None) -> "_Query":
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        query = self._copy()
+        query._filters.append((field, op, value))
+        return query
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "_Query":
+        query = self._copy()
+        query._orders.append((field, direction))
+        return query
+
+    def limit(self, count: int) -> "_Query":
+        query = self._copy()
+        query._limit = count
+        return query
+
+    def start_after(self, values) -> "_Query":
+        query = self._copy()
+        query._start_after = values.to_dict() if isinstance(values, _Snapshot) else dict(values)
+        return query
+
+    def select(self, field_paths: List[str]) -> "_Query":
+        query = self._copy()
+        query._fields = list(field_paths)
+        return query
+
+    def stream(self):
+        with self._store._lock:
+            rows = [
+                (doc_id, copy.deepcopy(data))
+                for doc_id, data in self._store._documents(self._collection).items()
+                if all(_matches(data, field, op, value) for field, op, value in self._filters)
+            ]
+        for field, direction in reversed(self._orders):
+            rows.sort(key=lambda row: _sort_key(_field(*row, field)), reverse=direction == "DESCENDING")
+        if self._start_after is not None and self._orders:
+            rows = [row for row in rows if _after(*row, self._start_after, self._orders)]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+
+        with self._store._lock:
+            self._store.reads += max(1, len(rows))
+        for doc_id, data in rows:
+            if self._fields is not None:
+                data = {field: data[field] for field in self._fields if field in data}
+            yield _Snapshot(_DocumentRef(self._store, self._collection, doc_id), data)
+
+    def get(self) -> List[_Snapshot]:
+        return list(self.stream())
+
+
+class _Collection(_Query):
+    def document(self, doc_id: Optional[str] = None) -> _DocumentRef:
+        return _DocumentRef(self._store, self._collection, doc_id or new_document_id())
+
+    def add(self, data: Dict, document_id: Optional[str] = None) -> Tuple[datetime, _DocumentRef]:
+        reference = self.document(document_id)
+        reference.set(data)
+        return datetime.now(timezone.utc), reference
+
+
+class _WriteBatch:
+    """Buffered writes applied atomically on commit"""
+
+    def __init__(self, store: InMemoryFirestore):
+        self._store = store
+        self._writes: List[Tuple[str, _DocumentRef, Optional[Dict], bool]] = []
+
+    def set(self, reference: _DocumentRef, data: Dict, merge: bool = False):
+        self._writes.append(("set", reference, data, merge))
+
+    def update(self, reference: _DocumentRef, data: Dict):
+        self._writes.append(("update", reference, data, False))
+
+    def delete(self, reference: _DocumentRef):
+        self._writes.append(("delete", reference, None, False))
+
+    def commit(self) -> List:
+        if len(self._writes) > 500:
+            raise ValueError("A batch can contain at most 500 writes")
+        with self._store._lock:
+            for kind, reference, data, merge in self._writes:
+                if kind == "set":
+                    reference.set(data, merge=merge)
+                elif kind == "update":
+                    reference.update(data)
+                else:
+                    reference.delete()
+        results = [None] * len(self._writes)
+        self._writes = []
+        return results
+
+
+def _apply(current: Dict, data: Dict) -> Dict:
+    merged = copy.deepcopy(current)
+    for field, value in data.items():
+        if value is DELETE_FIELD:
+            merged.pop(field, None)
+        else:
+            merged[field] = copy.deepcopy(value)
+    return merged
+
+
+def _matches(data: Dict, field: str, op: str, value: Any) -> bool:
+    if field not in data:
+        return False
+    actual = data[field]
+    if op == "==":
+        return actual == value
+    if op == "!=":
+        return actual != value
+    if op == "<":
+        return actual < value
+    if op == "<=":
+        return actual <= value
+    if op == ">":
+        return actual > value
+    if op == ">=":
+        return actual >= value
+    if op == "in":
+        return actual in value
+    if op == "array_contains":
+        return isinstance(actual, list) and value in actual
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+def _sort_key(value: Any):
+    """Order values the way Firestore orders mixed types"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, str(value))
+
+
+def _field(doc_id: str, data: Dict, field: str) -> Any:
+    """A field's value; `__name__` is the document ID, as in Firestore"""
+    return doc_id if field == "__name__" else data.get(field)
+
+
+def _after(doc_id: str, data: Dict, cursor: Dict, orders: List[Tuple[str, str]]) -> bool:
+    """True when the document sorts strictly after `cursor` under `orders`"""
+    for field, direction in orders:
+        if field not in cursor:
+            break
+        current, boundary = _sort_key(_field(doc_id, data, field)), _sort_key(cursor[field])
+        if current == boundary:
+            continue
+        return current < boundary if direction == "DESCENDING" else current > boundary
+    return False
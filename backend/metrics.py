@@ -0,0 +1,401 @@
+# backend/metrics.py
+import bisect
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger("neus.trace")
+
+# Seconds; covers cache hits (sub-millisecond) to slow Firestore round trips
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# Firestore methods that hit the network, and the ones that only build a reference or query
+FIRESTORE_CALLS = {'get', 'stream', 'add', 'set', 'update', 'delete', 'commit', 'get_all'}
+# Write batch methods that only queue a write locally; its `commit` is the call
+FIRESTORE_BATCH_WRITES = {'create', 'set', 'update', 'delete'}
+FIRESTORE_BUILDERS = {
+    'collection', 'document', 'where', 'order_by', 'limit', 'limit_to_last', 'offset',
+    'start_at', 'start_after', 'end_at', 'end_before', 'select', 'batch',
+}
+
+_current_trace: contextvars.ContextVar[Optional["RequestTrace"]] = contextvars.ContextVar("neus_trace", default=None)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    """
+    Settable gauge, or one computed at scrape time when `function` is given
+
+    `function` returns a number, or `(labels, value)` pairs for a labelled
+    gauge. Computed gauges cost nothing on the hot path.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], Any]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        if self.function is None:
+            with self._lock:
+                values = sorted(self._values.items())
+        else:
+            try:
+                result = self.function()
+            except Exception as e:
+                logger.warning(f"Metric {self.name} could not be computed: {e}")
+                return []
+            if isinstance(result, (int, float)):
+                values = [((), result)]
+            else:
+                values = [(self._key(labels), value) for labels, value in result]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in values if value is not None
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (last is +Inf), sum, count]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        samples = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            samples.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            samples.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return samples
+
+
+class _NoopMetric:
+    """Stands in for every metric while metrics are disabled"""
+
+    def inc(self, amount: float = 1, **labels):
+        pass
+
+    def set(self, value: float, **labels):
+        pass
+
+    def observe(self, value: float, **labels):
+        pass
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_METRIC = _NoopMetric()
+_NOOP_TIMER = _NoopTimer()
+
+
+class RequestTrace:
+    """Stage timings of one sampled request"""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+
+    def add(self, stage: str, seconds: float):
+        self.stages.append((stage, seconds))
+
+
+class _StageTimer:
+    def __init__(self, metrics: "Metrics", stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        self.metrics.stage_seconds.observe(elapsed, stage=self.stage)
+        if exc_type is not None:
+            self.metrics.stage_errors.inc(stage=self.stage, error=exc_type.__name__)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(self.stage, elapsed)
+        return False
+
+
+class Metrics:
+    """
+    In-process metrics registry with Prometheus text exposition.
+
+    When `enabled` is False every metric is a shared no-op and `stage()`
+    returns a shared no-op context manager, so instrumented code pays one
+    method call per site. Requests are traced with probability
+    `trace_sample_rate`; a trace logs each stage's duration as one JSON line
+    on the `neus.trace` logger.
+    """
+
+    def __init__(self, enabled: bool = True, trace_sample_rate: float = 0.0):
+        self.enabled = enabled
+        self.trace_sample_rate = trace_sample_rate if enabled else 0.0
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+        self.stage_seconds = self.histogram('neus_stage_seconds', 'Time spent per request stage', ['stage'])
+        self.stage_errors = self.counter('neus_stage_errors_total', 'Request stages that raised', ['stage', 'error'])
+        self.firestore_calls = self.counter(
+            'neus_firestore_calls_total', 'Firestore calls', ['operation', 'collection', 'outcome']
+        )
+        self.firestore_seconds = self.histogram('neus_firestore_call_seconds', 'Firestore call latency', ['operation'])
+        self.fcm_messages = self.counter('neus_fcm_messages_total', 'FCM messages sent', ['outcome'])
+        self.fcm_seconds = self.histogram('neus_fcm_call_seconds', 'FCM call latency', ['operation'])
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              function: Optional[Callable[[], Any]] = None):
+        return self._register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def stage(self, name: str):
+        """Context manager timing one stage of the current request"""
+        if not self.enabled:
+            return _NOOP_TIMER
+        return _StageTimer(self, name)
+
+    def start_trace(self, method: str, path: str) -> Optional[contextvars.Token]:
+        """Begin a sampled trace for the current request; None when not sampled"""
+        if not self.trace_sample_rate or random.random() >= self.trace_sample_rate:
+            return None
+        return _current_trace.set(RequestTrace(method, path))
+
+    def finish_trace(self, token: Optional[contextvars.Token], status: int):
+        if token is None:
+            return
+        trace = _current_trace.get()
+        _current_trace.reset(token)
+        trace_logger.info(json.dumps({
+            "method": trace.method,
+            "path": trace.path,
+            "status": status,
+            "total_ms": round((time.perf_counter() - trace.started) * 1000, 3),
+            "stages_ms": [[stage, round(seconds * 1000, 3)] for stage, seconds in trace.stages],
+        }))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def instrument_firestore(self, client):
+        """Wrap a Firestore client so every network call is counted and timed"""
+        return _InstrumentedFirestore(client, self, None) if self.enabled else client
+
+    def record_firestore_call(self, operation: str, collection: str, seconds: float, outcome: str):
+        """Count and time one Firestore call made outside an instrumented client"""
+        self.firestore_seconds.observe(seconds, operation=operation)
+        self.firestore_calls.inc(operation=operation, collection=collection, outcome=outcome)
+
+    def instrument_transport(self, transport):
+        """Wrap a notification transport so multicast calls are counted and timed"""
+        return _InstrumentedTransport(transport, self) if self.enabled else transport
+
+    def _register(self, metric: _Metric):
+        if not self.enabled:
+            return _NOOP_METRIC
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+
+def _unwrap(value):
+    if isinstance(value, _InstrumentedFirestore):
+        return value._target
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unwrap(item) for item in value)
+    return value
+
+
+class _InstrumentedFirestore:
+    """Proxy over a Firestore client, reference, query or batch"""
+
+    def __init__(self, target, metrics: Metrics, collection: Optional[str]):
+        self._target = target
+        self._metrics = metrics
+        self._collection = collection
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._target, name)
+        if name in FIRESTORE_BUILDERS:
+            def build(*args, **kwargs):
+                collection = args[0] if name == 'collection' and args else self._collection
+                result = attribute(*_unwrap(args), **{key: _unwrap(value) for key, value in kwargs.items()})
+                if name == 'batch':
+                    return _InstrumentedBatch(result, self._metrics, collection)
+                return _InstrumentedFirestore(result, self._metrics, collection)
+            return build
+        if name in FIRESTORE_CALLS:
+            def call(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    result = attribute(*_unwrap(args), **{key: _unwrap(value) for key, value in kwargs.items()})
+                except Exception as e:
+                    self._record(name, started, type(e).__name__)
+                    raise
+                if name in ('stream', 'get_all'):
+                    return self._timed_iteration(name, result, started)
+                self._record(name, started, 'ok')
+                return result
+            return call
+        return attribute
+
+    def _timed_iteration(self, name: str, results: Iterable, started: float):
+        outcome = 'ok'
+        try:
+            yield from results
+        except Exception as e:
+            outcome = type(e).__name__
+            raise
+        finally:
+            self._record(name, started, outcome)
+
+    def _record(self, operation: str, started: float, outcome: str):
+        self._metrics.record_firestore_call(operation, self._collection or '', time.perf_counter() - started, outcome)
+
+
+class _InstrumentedBatch(_InstrumentedFirestore):
+    """Proxy over a write batch: queued writes are not calls, only `commit` is"""
+
+    def __getattr__(self, name: str):
+        if name not in FIRESTORE_BATCH_WRITES:
+            return super().__getattr__(name)
+        attribute = getattr(self._target, name)
+
+        def queue(*args, **kwargs):
+            return attribute(*_unwrap(args), **{key: _unwrap(value) for key, value in kwargs.items()})
+        return queue
+
+
+class _InstrumentedTransport:
+    def __init__(self, transport, metrics: Metrics):
+        self._transport = transport
+        self._metrics = metrics
+
+    def __getattr__(self, name: str):
+        return getattr(self._transport, name)
+
+    def send_multicast(self, tokens: List[str], title: str, body: str, data: Dict[str, str]) -> List[Optional[Exception]]:
+        started = time.perf_counter()
+        try:
+            results = self._transport.send_multicast(tokens, title, body, data)
+        except Exception as e:
+            self._metrics.fcm_messages.inc(len(tokens), outcome=type(e).__name__)
+            raise
+        finally:
+            self._metrics.fcm_seconds.observe(time.perf_counter() - started, operation='send_multicast')
+        failed = sum(1 for error in results if error is not None)
+        self._metrics.fcm_messages.inc(len(results) - failed, outcome='sent')
+        if failed:
+            self._metrics.fcm_messages.inc(failed, outcome='failed')
+        return results
@@ -0,0 +1,277 @@
+# backend/notifications.py
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from firebase_admin import messaging
+
+logger = logging.getLogger(__name__)
+
+# FCM accepts at most 500 tokens per multicast call
+MULTICAST_LIMIT = 500
+
+
+class InvalidTokenError(Exception):
+    """The device token is no longer registered and should be pruned"""
+
+
+class FcmTransport:
+    """Sends multicast messages through Firebase Cloud Messaging"""
+
+    def send_multicast(self, tokens: List[str], title: str, body: str, data: Dict[str, str]) -> List[Optional[Exception]]:
+        message = messaging.MulticastMessage(
+            notification=messaging.Notification(title=title, body=body),
+            data=data,
+            tokens=tokens,
+        )
+        response = messaging.send_each_for_multicast(message)
+        results = []
+        for item in response.responses:
+            if item.success:
+                results.append(None)
+            elif isinstance(item.exception, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+                results.append(InvalidTokenError(str(item.exception)))
+            else:
+                results.append(item.exception)
+        return results
+
+
+class FakeTransport:
+    """
+    In-process FCM stand-in for tests and load runs
+
+    Tokens in `invalid_tokens` fail as unregistered; every call is recorded.
+    """
+
+    def __init__(self, invalid_tokens: Optional[Set[str]] = None, latency_seconds: float = 0.0):
+        self.invalid_tokens = set(invalid_tokens or ())
+        self.latency_seconds = latency_seconds
+        self.calls: List[Tuple[List[str], str, str, Dict[str, str]]] = []
+        self._lock = threading.Lock()
+
+    def send_multicast(self, tokens: List[str], title: str, body: str, data: Dict[str, str]) -> List[Optional[Exception]]:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with self._lock:
+            self.calls.append((list(tokens), title, body, dict(data)))
+        return [InvalidTokenError(token) if token in self.invalid_tokens else None for token in tokens]
+
+
+def _token(user: Optional[Dict]) -> Optional[str]:
+    return (user or {}).get('fcm_token')
+
+
+class TokenIndex:
+    """
+    Cached `user_id -> fcm_token` index over the `users` collection.
+
+    Misses are read through the repository in batched `get_all` calls,
+    projecting only the `fcm_token` field. Users without a token are cached
+    too, so repeated campaigns do not re-read them. Entries expire after
+    `ttl_seconds`.
+    """
+
+    def __init__(self, get_repository: Callable[[], Any], ttl_seconds: float = 3600.0, max_entries: int = 1_000_000):
+        self.get_repository = get_repository
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def resolve(self, user_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Tokens for `user_ids`; None where the user has no token or does not exist"""
+        now = time.monotonic()
+        tokens: Dict[str, Optional[str]] = {}
+        missing = []
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._entries.get(user_id)
+                if entry is not None and now - entry[0] <= self.ttl_seconds:
+                    tokens[user_id] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.append(user_id)
+                    self.misses += 1
+
+        if missing:
+            users = await self.get_repository().get_users(missing, ['fcm_token'])
+            fetched = {user_id: _token(user) for user_id, user in users.items()}
+            self._store(fetched)
+            tokens.update(fetched)
+        return tokens
+
+    async def segment(self, segment: str) -> Dict[str, Optional[str]]:
+        """Tokens of every user tagged with `segment` (in their `segments` array)"""
+        users = await self.get_repository().users_in_segment(segment, ['fcm_token'])
+        tokens = {user_id: _token(user) for user_id, user in users.items()}
+        self._store(tokens)
+        return tokens
+
+    async def prune(self, stale: Dict[str, str]) -> int:
+        """
+        Drop invalid tokens (`user_id -> token`) from Firestore and the cache
+
+        Users are re-read first and only a token still equal to the stale
+        one is deleted, in batched writes: a user who registered a new
+        device meanwhile keeps it, and deleted users are skipped.
+
+        Returns:
+            int: Number of tokens deleted
+        """
+        repository = self.get_repository()
+        users = await repository.get_users(list(stale), ['fcm_token'])
+        pruned = []
+        for user_id, user in users.items():
+            if user is not None and _token(user) == stale[user_id]:
+                pruned.append(user_id)
+            else:
+                # Gone, or re-registered: re-read on next use
+                self.invalidate(user_id)
+        if pruned:
+            await repository.delete_user_field(pruned, 'fcm_token')
+            self._store({user_id: None for user_id in pruned})
+        return len(pruned)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _store(self, tokens: Dict[str, Optional[str]]):
+        now = time.monotonic()
+        with self._lock:
+            for user_id, token in tokens.items():
+                self._entries[user_id] = (now, token)
+                self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class Campaign:
+    """Progress and outcome of one bulk notification send"""
+
+    def __init__(self, title: str, body: str, data: Optional[Dict[str, str]] = None):
+        self.id = uuid.uuid4().hex
+        self.title = title
+        self.body = body
+        self.data = {key: str(value) for key, value in (data or {}).items()}
+        self.status = "pending"
+        self.recipients = 0
+        self.without_token = 0
+        self.sent = 0
+        self.failed = 0
+        self.pruned = 0
+        self.errors: Dict[str, int] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def report(self) -> Dict:
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        return {
+            "campaign_id": self.id,
+            "status": self.status,
+            "recipients": self.recipients,
+            "without_token": self.without_token,
+            "sent": self.sent,
+            "failed": self.failed,
+            "pruned_tokens": self.pruned,
+            "errors": dict(self.errors),
+            "elapsed_seconds": round(elapsed, 3),
+            "messages_per_second": self.sent / elapsed if elapsed else 0.0,
+        }
+
+
+class NotificationFanout:
+    """
+    Bulk push-notification engine.
+
+    Resolves recipients through the token index, sends multicast chunks of
+    up to 500 tokens with at most `concurrency` chunks in flight, and prunes
+    tokens FCM reports as unregistered.
+    """
+
+    def __init__(self, token_index: TokenIndex, transport, concurrency: int = 8, max_campaigns: int = 100):
+        self.token_index = token_index
+        self.transport = transport
+        self.concurrency = max(1, concurrency)
+        self.max_campaigns = max_campaigns
+        self.campaigns: "OrderedDict[str, Campaign]" = OrderedDict()
+
+    def create(self, title: str, body: str, data: Optional[Dict[str, str]] = None) -> Campaign:
+        campaign = Campaign(title, body, data)
+        self.campaigns[campaign.id] = campaign
+        while len(self.campaigns) > self.max_campaigns:
+            self.campaigns.popitem(last=False)
+        return campaign
+
+    async def run(self, campaign: Campaign, user_ids: Optional[List[str]] = None, segment: Optional[str] = None) -> Dict:
+        """Resolve recipients and send; returns the campaign report"""
+        campaign.status = "running"
+        campaign.started_at = time.time()
+        try:
+            if segment is not None:
+                tokens = await self.token_index.segment(segment)
+            else:
+                tokens = await self.token_index.resolve(list(dict.fromkeys(user_ids or [])))
+
+            recipients = [(user_id, token) for user_id, token in tokens.items() if token]
+            campaign.recipients = len(tokens)
+            campaign.without_token = len(tokens) - len(recipients)
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+            chunks = [recipients[i:i + MULTICAST_LIMIT] for i in range(0, len(recipients), MULTICAST_LIMIT)]
+            await asyncio.gather(*(self._send_chunk(campaign, chunk, semaphore) for chunk in chunks))
+            campaign.status = "completed"
+        except Exception as e:
+            campaign.status = "failed"
+            campaign.errors[type(e).__name__] = campaign.errors.get(type(e).__name__, 0) + 1
+            logger.error(f"Notification campaign {campaign.id} failed: {e}")
+        finally:
+            campaign.finished_at = time.time()
+
+        report = campaign.report()
+        logger.info(f"Notification campaign {campaign.id}: {report}")
+        return report
+
+    async def _send_chunk(self, campaign: Campaign, chunk: List[Tuple[str, str]], semaphore: asyncio.Semaphore):
+        async with semaphore:
+            tokens = [token for _, token in chunk]
+            try:
+                results = await asyncio.to_thread(
+                    self.transport.send_multicast, tokens, campaign.title, campaign.body, campaign.data
+                )
+            except Exception as e:
+                campaign.failed += len(chunk)
+                campaign.errors[type(e).__name__] = campaign.errors.get(type(e).__name__, 0) + len(chunk)
+                logger.error(f"Multicast of {len(chunk)} messages failed: {e}")
+                return
+
+            invalid_tokens = {}
+            for (user_id, token), error in zip(chunk, results):
+                if error is None:
+                    campaign.sent += 1
+                    continue
+                campaign.failed += 1
+                campaign.errors[type(error).__name__] = campaign.errors.get(type(error).__name__, 0) + 1
+                if isinstance(error, InvalidTokenError):
+                    invalid_tokens[user_id] = token
+
+            if invalid_tokens:
+                try:
+                    campaign.pruned += await self.token_index.prune(invalid_tokens)
+                except Exception as e:
+                    logger.warning(f"Could not prune {len(invalid_tokens)} invalid tokens: {e}")
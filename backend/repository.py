@@ -0,0 +1,362 @@
+# backend/repository.py
+import asyncio
+import copy
+import logging
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple, TypeVar
+
+from firebase_admin import firestore
+
+from memory_firestore import InMemoryFirestore
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+ENTRIES = 'mood_entries'
+USERS = 'users'
+DOCUMENT_ID = '__name__'
+# Documents per get_all round trip; writes per batch (Firestore allows 500)
+GET_ALL_CHUNK = 300
+MAX_BATCH_WRITES = 500
+
+# (timestamp, document ID) of the last entry seen; the ID may be None
+Position = Tuple[datetime, Optional[str]]
+
+
+def _recent_query(client, user_id: str, limit: int, start_after: Optional[Position], fields: Optional[List[str]]):
+    # The document ID orders entries that share a timestamp
+    query = client.collection(ENTRIES)\
+                  .where('user_id', '==', user_id)\
+                  .order_by('timestamp', direction=firestore.Query.DESCENDING)\
+                  .order_by(DOCUMENT_ID, direction=firestore.Query.DESCENDING)
+    if start_after is not None:
+        timestamp, doc_id = start_after
+        cursor = {'timestamp': timestamp}
+        if doc_id is not None:
+            cursor[DOCUMENT_ID] = doc_id
+        query = query.start_after(cursor)
+    if fields:
+        query = query.select(fields)
+    return query.limit(limit)
+
+
+def _segment_query(client, segment: str, fields: Optional[List[str]]):
+    query = client.collection(USERS).where('segments', 'array_contains', segment)
+    return query.select(fields) if fields else query
+
+
+def _entry(doc) -> Dict:
+    data = doc.to_dict()
+    data['id'] = doc.id
+    return data
+
+
+def _fields_key(fields: Optional[Iterable[str]]) -> Optional[tuple]:
+    return tuple(fields) if fields else None
+
+
+class MoodRepository(ABC):
+    """
+    Non-blocking access to the `mood_entries` and `users` collections.
+
+    Subclasses implement the underscored operations. Identical reads that
+    overlap (the same user document and fields, the same history page)
+    share one Firestore call: later callers await the first caller's
+    result instead of sending their own. Every call is timed and passed to
+    `call_listeners` as `(operation, collection, seconds, outcome)`.
+    """
+
+    def __init__(self):
+        self.call_listeners: List[Callable[[str, str, float, str], None]] = []
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def add_entry(self, data: Dict) -> str:
+        """Store a mood entry and return its document ID"""
+        return await self._timed('add', ENTRIES, self._add_entry(data))
+
+    async def recent_entries(
+        self,
+        user_id: str,
+        limit: int,
+        start_after: Optional[Position] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict]:
+        """A user's entries newest first (after `start_after` when given), each with its `id`"""
+        if limit <= 0:
+            return []
+        key = ('recent_entries', user_id, limit, start_after, _fields_key(fields))
+        return await self._coalesce(
+            key, lambda: self._timed('stream', ENTRIES, self._recent_entries(user_id, limit, start_after, fields))
+        )
+
+    async def get_history(self, user_id: str, fields: Optional[List[str]] = None, page_size: int = 500) -> List[Dict]:
+        """A user's entire history oldest first, read newest first in pages of `page_size`"""
+        if fields and 'timestamp' not in fields:
+            # Pages continue after the last entry's position
+            fields = [*fields, 'timestamp']
+        entries: List[Dict] = []
+        start_after: Optional[Position] = None
+        while True:
+            page = await self.recent_entries(user_id, page_size, start_after, fields)
+            entries.extend(page)
+            if len(page) < page_size:
+                break
+            start_after = (page[-1]['timestamp'], page[-1]['id'])
+        entries.reverse()
+        return entries
+
+    async def get_user(self, user_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        """The user document (only `fields` when given), or None if it does not exist"""
+        key = ('user', user_id, _fields_key(fields))
+        return await self._coalesce(key, lambda: self._timed('get', USERS, self._get_user(user_id, fields)))
+
+    async def update_user(self, user_id: str, data: Dict):
+        """Merge `data` into the user document, creating it if needed"""
+        await self._timed('set', USERS, self._update_user(user_id, data))
+
+    async def get_users(self, user_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Optional[Dict]]:
+        """User documents by ID (only `fields` when given), None for users that do not exist"""
+        users: Dict[str, Optional[Dict]] = {user_id: None for user_id in user_ids}
+        for start in range(0, len(user_ids), GET_ALL_CHUNK):
+            chunk = user_ids[start:start + GET_ALL_CHUNK]
+            users.update(await self._timed('get_all', USERS, self._get_users(chunk, fields)))
+        return users
+
+    async def users_in_segment(self, segment: str, fields: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """Users tagged with `segment` (in their `segments` array), by ID"""
+        return await self._timed('stream', USERS, self._users_in_segment(segment, fields))
+
+    async def delete_user_field(self, user_ids: List[str], field: str):
+        """Remove `field` from each user document, in batched writes"""
+        for start in range(0, len(user_ids), MAX_BATCH_WRITES):
+            chunk = user_ids[start:start + MAX_BATCH_WRITES]
+            await self._timed('commit', USERS, self._delete_user_field(chunk, field))
+
+    async def close(self):
+        """Release threads or channels held by the repository"""
+
+    def stats(self) -> Dict:
+        return {
+            "backend": type(self).__name__,
+            "calls": self.calls,
+            "coalesced_reads": self.coalesced,
+            "reads_in_flight": len(self._in_flight),
+        }
+
+    async def _coalesce(self, key: Hashable, load: Callable[[], Awaitable[T]]) -> T:
+        shared = self._in_flight.get(key)
+        if shared is None:
+            shared = asyncio.ensure_future(load())
+            self._in_flight[key] = shared
+            shared.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded so one caller giving up does not cancel the read for the
+        # others; copied so callers can modify their result independently
+        return copy.deepcopy(await asyncio.shield(shared))
+
+    async def _timed(self, operation: str, collection: str, call: Awaitable[T]) -> T:
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            return await call
+        except Exception as e:
+            outcome = type(e).__name__
+            raise
+        finally:
+            self.calls += 1
+            seconds = time.perf_counter() - started
+            for listener in self.call_listeners:
+                listener(operation, collection, seconds, outcome)
+
+    @abstractmethod
+    async def _add_entry(self, data: Dict) -> str:
+        ...
+
+    @abstractmethod
+    async def _recent_entries(self, user_id: str, limit: int, start_after: Optional[Position],
+                              fields: Optional[List[str]]) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    async def _get_user(self, user_id: str, fields: Optional[List[str]]) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    async def _update_user(self, user_id: str, data: Dict):
+        ...
+
+    @abstractmethod
+    async def _get_users(self, user_ids: List[str], fields: Optional[List[str]]) -> Dict[str, Dict]:
+        ...
+
+    @abstractmethod
+    async def _users_in_segment(self, segment: str, fields: Optional[List[str]]) -> Dict[str, Dict]:
+        ...
+
+    @abstractmethod
+    async def _delete_user_field(self, user_ids: List[str], field: str):
+        ...
+
+
+class AsyncFirestoreRepository(MoodRepository):
+    """
+    Repository over Firestore's asyncio client
+
+    One client, and so one gRPC channel multiplexing every request, is
+    shared by the whole process; calls never leave the event loop.
+    """
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    async def _add_entry(self, data: Dict) -> str:
+        _, reference = await self.client.collection(ENTRIES).add(data)
+        return reference.id
+
+    async def _recent_entries(self, user_id, limit, start_after, fields):
+        return [_entry(doc) async for doc in _recent_query(self.client, user_id, limit, start_after, fields).stream()]
+
+    async def _get_user(self, user_id, fields):
+        snapshot = await self.client.collection(USERS).document(user_id).get(field_paths=fields)
+        return snapshot.to_dict() if snapshot.exists else None
+
+    async def _update_user(self, user_id, data):
+        await self.client.collection(USERS).document(user_id).set(data, merge=True)
+
+    async def _get_users(self, user_ids, fields):
+        references = [self.client.collection(USERS).document(user_id) for user_id in user_ids]
+        return {
+            snapshot.id: snapshot.to_dict()
+            async for snapshot in self.client.get_all(references, field_paths=fields) if snapshot.exists
+        }
+
+    async def _users_in_segment(self, segment, fields):
+        return {doc.id: doc.to_dict() async for doc in _segment_query(self.client, segment, fields).stream()}
+
+    async def _delete_user_field(self, user_ids, field):
+        batch = self.client.batch()
+        for user_id in user_ids:
+            batch.update(self.client.collection(USERS).document(user_id), {field: firestore.DELETE_FIELD})
+        await batch.commit()
+
+
+class _SyncClientRepository(MoodRepository):
+    """Repository over a synchronous client; subclasses decide where its calls run"""
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    @abstractmethod
+    async def _run(self, function: Callable[..., T], *args) -> T:
+        ...
+
+    async def _add_entry(self, data):
+        return await self._run(lambda: self.client.collection(ENTRIES).add(data)[1].id)
+
+    async def _recent_entries(self, user_id, limit, start_after, fields):
+        return await self._run(
+            lambda: [_entry(doc) for doc in _recent_query(self.client, user_id, limit, start_after, fields).stream()]
+        )
+
+    async def _get_user(self, user_id, fields):
+        snapshot = await self._run(lambda: self.client.collection(USERS).document(user_id).get(field_paths=fields))
+        return snapshot.to_dict() if snapshot.exists else None
+
+    async def _update_user(self, user_id, data):
+        await self._run(lambda: self.client.collection(USERS).document(user_id).set(data, merge=True))
+
+    async def _get_users(self, user_ids, fields):
+        def read():
+            references = [self.client.collection(USERS).document(user_id) for user_id in user_ids]
+            return {
+                snapshot.id: snapshot.to_dict()
+                for snapshot in self.client.get_all(references, field_paths=fields) if snapshot.exists
+            }
+        return await self._run(read)
+
+    async def _users_in_segment(self, segment, fields):
+        return await self._run(
+            lambda: {doc.id: doc.to_dict() for doc in _segment_query(self.client, segment, fields).stream()}
+        )
+
+    async def _delete_user_field(self, user_ids, field):
+        def commit():
+            batch = self.client.batch()
+            for user_id in user_ids:
+                batch.update(self.client.collection(USERS).document(user_id), {field: firestore.DELETE_FIELD})
+            batch.commit()
+        await self._run(commit)
+
+
+class ThreadPoolRepository(_SyncClientRepository):
+    """
+    Repository over the synchronous client, called from a bounded thread pool
+
+    For SDKs without the async client. At most `max_workers` calls run at
+    once, on threads of their own, so a burst of requests cannot starve the
+    default executor used for model loading and other blocking work. All
+    threads share the client's gRPC channel.
+    """
+
+    def __init__(self, client, max_workers: int = 16):
+        super().__init__(client)
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="firestore")
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "max_workers": self.max_workers}
+
+
+class InMemoryRepository(_SyncClientRepository):
+    """
+    Repository over `InMemoryFirestore`, for tests and benchmarks
+
+    The store never blocks, so calls run inline on the event loop. Set
+    `latency_seconds` to add a simulated round trip (awaited, not slept)
+    before each call, e.g. to measure coalescing under concurrency.
+    """
+
+    def __init__(self, store: Optional[InMemoryFirestore] = None, latency_seconds: float = 0.0):
+        super().__init__(store if store is not None else InMemoryFirestore())
+        self.latency_seconds = latency_seconds
+
+    @property
+    def store(self) -> InMemoryFirestore:
+        return self.client
+
+    async def _run(self, function, *args):
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return function(*args)
+
+
+def create_repository(client: Any, async_client_factory: Optional[Callable[[], Any]] = None,
+                      max_workers: int = 16) -> MoodRepository:
+    """
+    Repository for `client`: in-memory for the local stand-in, otherwise the
+    async client from `async_client_factory` when it can be created, else a
+    thread pool over `client`
+    """
+    if isinstance(client, InMemoryFirestore):
+        return InMemoryRepository(client)
+    if async_client_factory is not None:
+        try:
+            return AsyncFirestoreRepository(async_client_factory())
+        except Exception as e:
+            logger.warning(f"Firestore async client unavailable, using {max_workers} threads: {e}")
+    return ThreadPoolRepository(client, max_workers=max_workers)
@@ -0,0 +1,68 @@
+# backend/startup.py
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupState:
+    """
+    Tracks deferred initialization of the API's dependencies.
+
+    Each phase is timed, and each component flips to ready only once it has
+    been exercised successfully, so `/ready` never reports capacity that
+    cannot yet serve traffic.
+    """
+
+    def __init__(self, components: Iterable[str]):
+        self.started_at = time.time()
+        self.components: Dict[str, bool] = {name: False for name in components}
+        self.phase_seconds: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time one startup phase and record its failure, if any"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.errors[name] = f"{type(e).__name__}: {e}"
+            logger.error(f"Startup phase '{name}' failed: {e}")
+            raise
+        finally:
+            self.phase_seconds[name] = round(time.perf_counter() - started, 3)
+            logger.info(f"Startup phase '{name}' took {self.phase_seconds[name]:.3f}s")
+
+    def mark_ready(self, component: str):
+        self.components[component] = True
+
+    def is_ready(self, component: Optional[str] = None) -> bool:
+        if component is not None:
+            return self.components.get(component, False)
+        return all(self.components.values())
+
+    def report(self) -> Dict:
+        return {
+            "ready": self.is_ready(),
+            "components": dict(self.components),
+            "phase_seconds": dict(self.phase_seconds),
+            "errors": dict(self.errors),
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+        }
+
+
+def warmup_texts(bucket_lengths: List[int], batch_size: int) -> List[List[str]]:
+    """
+    Build one warmup batch per sequence-length bucket
+
+    Each word of the filler text is roughly one token, leaving room for the
+    special tokens the tokenizer adds.
+    """
+    batches = []
+    for length in bucket_lengths:
+        text = " ".join(["today"] * max(1, length - 2))
+        batches.append([text] * max(1, batch_size))
+    return batches
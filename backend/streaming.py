@@ -0,0 +1,137 @@
+# backend/streaming.py
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Union
+
+logger = logging.getLogger(__name__)
+
+# Yielded by `iter_ndjson_lines` in place of a line longer than the limit
+OVERSIZED_LINE = object()
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int = 1 << 20) -> AsyncIterator[Union[bytes, object]]:
+    """
+    Split a streamed body into lines without buffering more than one line
+
+    Lines longer than `max_line_bytes` are skipped and reported as
+    `OVERSIZED_LINE`, so one bad record cannot grow memory without bound.
+    """
+    buffer = b""
+    skipping = False
+    async for chunk in chunks:
+        buffer += chunk
+        while True:
+            newline = buffer.find(b"\n")
+            if newline < 0:
+                break
+            line, buffer = buffer[:newline], buffer[newline + 1:]
+            if skipping:
+                skipping = False
+            else:
+                yield line
+        if len(buffer) > max_line_bytes:
+            if not skipping:
+                yield OVERSIZED_LINE
+            skipping = True
+            buffer = b""
+    if buffer and not skipping:
+        yield buffer
+
+
+class StreamError(Exception):
+    """A per-line failure reported in the output stream instead of aborting it"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class NdjsonStreamProcessor:
+    """
+    Runs `handle(record)` for every line of an NDJSON stream.
+
+    At most `max_in_flight` lines are being processed or waiting to be
+    written out at any time. Beyond that the body is not read any further,
+    which pushes back on the client through the transport. Results are
+    emitted as they complete, tagged with `line` (the record's 0-based
+    position among non-empty input lines), and the stream ends with a
+    summary line.
+    """
+
+    def __init__(
+        self,
+        handle: Callable[[Dict], Awaitable[Dict]],
+        max_in_flight: int = 256,
+        max_line_bytes: int = 1 << 20,
+        encode: Callable[[Any], str] = json.dumps,
+    ):
+        self.handle = handle
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_line_bytes = max_line_bytes
+        self.encode = encode
+
+    async def run(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        slots = asyncio.Semaphore(self.max_in_flight)
+        results: asyncio.Queue = asyncio.Queue()
+        tasks = set()
+        summary = {"lines": 0, "succeeded": 0, "failed": 0}
+        started = time.perf_counter()
+        done = object()
+
+        async def process(index: int, line):
+            try:
+                if line is OVERSIZED_LINE:
+                    raise StreamError(f"Line exceeds {self.max_line_bytes} bytes", status=413)
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    raise StreamError(f"Invalid JSON: {e}")
+                if not isinstance(record, dict):
+                    raise StreamError("Each line must be a JSON object")
+                result = {"line": index, **(await self.handle(record))}
+            except StreamError as e:
+                result = {"line": index, "error": str(e), "status": e.status}
+            except Exception as e:
+                logger.error(f"Stream line {index} failed: {e}")
+                result = {"line": index, "error": str(e), "status": 500}
+            await results.put(result)
+
+        async def read():
+            index = 0
+            try:
+                async for line in iter_ndjson_lines(chunks, self.max_line_bytes):
+                    if line is not OVERSIZED_LINE and not line.strip():
+                        continue
+                    # Released once the result has been written out
+                    await slots.acquire()
+                    task = asyncio.create_task(process(index, line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    index += 1
+                if tasks:
+                    await asyncio.gather(*list(tasks))
+            finally:
+                await results.put(done)
+
+        reader = asyncio.create_task(read())
+        try:
+            while True:
+                result = await results.get()
+                if result is done:
+                    break
+                summary["lines"] += 1
+                summary["failed" if "error" in result else "succeeded"] += 1
+                yield (self.encode(result) + "\n").encode()
+                slots.release()
+            # Surface a failure to read the body itself
+            await reader
+        finally:
+            reader.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+        summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        summary["lines_per_second"] = summary["lines"] / summary["elapsed_seconds"] if summary["elapsed_seconds"] else 0.0
+        yield (json.dumps({"summary": summary}) + "\n").encode()
@@ -0,0 +1,100 @@
+# backend/suggestions.py
+import random
+import string
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+
+class CopingSuggestion(BaseModel):
+    suggestion: str
+    category: str
+    is_social: bool = False
+    friend_name: Optional[str] = None
+    activity: Optional[str] = None
+
+
+# Per-mood suggestion templates. Social templates are `str.format`
+# strings over a friend's fields; `activity` names the friend field to
+# attach as the suggested activity. A social template is skipped for a
+# friend missing any field it uses.
+SUGGESTION_TEMPLATES: Dict[str, List[Dict]] = {
+    "excellent": [
+        {"suggestion": "Let's call {name} and talk about your favorite show {favorite_show}!",
+         "category": "social", "is_social": True, "activity": "favorite_show"},
+        {"suggestion": "Share your positive energy with someone today", "category": "social"},
+        {"suggestion": "Practice gratitude - write down 3 things you're thankful for", "category": "mindfulness"},
+    ],
+    "good": [
+        {"suggestion": "Text {name} about the latest episode of {favorite_show}",
+         "category": "social", "is_social": True, "activity": "favorite_show"},
+        {"suggestion": "Take a mindful walk outside", "category": "physical"},
+    ],
+    "okay": [
+        {"suggestion": "Reach out to {name} - you haven't talked in {last_talked}",
+         "category": "social", "is_social": True},
+        {"suggestion": "Practice deep breathing exercises", "category": "mindfulness"},
+    ],
+    "struggling": [
+        {"suggestion": "Call {name} and catch up about {favorite_show} - connection helps",
+         "category": "social", "is_social": True, "activity": "favorite_show"},
+        {"suggestion": "Try progressive muscle relaxation", "category": "mindfulness"},
+    ],
+    "difficult": [
+        {"suggestion": "Text {name} that you need someone to talk to - they care about you",
+         "category": "social", "is_social": True},
+        {"suggestion": "Consider professional support", "category": "professional"},
+    ],
+}
+
+
+class SuggestionCatalog:
+    """
+    Coping suggestions compiled once from `SUGGESTION_TEMPLATES`.
+
+    Suggestions that do not mention a friend are built a single time and
+    shared between calls; `render` formats only the requested mood's social
+    templates, with one randomly picked friend.
+    """
+
+    def __init__(self, templates: Optional[Dict[str, List[Dict]]] = None, rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
+        # mood -> [(static suggestion, None) | (None, social template)];
+        # social templates carry the friend fields they need in `fields`
+        self._compiled: Dict[str, List[Tuple[Optional[CopingSuggestion], Optional[Dict]]]] = {}
+        for mood, entries in (templates or SUGGESTION_TEMPLATES).items():
+            compiled = []
+            for entry in entries:
+                if entry.get("is_social"):
+                    fields = {name for _, name, _, _ in string.Formatter().parse(entry["suggestion"]) if name}
+                    compiled.append((None, {**entry, "fields": fields | {"name"}}))
+                else:
+                    compiled.append((CopingSuggestion(**entry), None))
+            self._compiled[mood] = compiled
+
+    @property
+    def moods(self) -> List[str]:
+        return list(self._compiled)
+
+    def render(self, mood: str, friends: List[Dict]) -> List[CopingSuggestion]:
+        """Suggestions for `mood` (empty for an unknown mood)"""
+        compiled = self._compiled.get(mood)
+        if not compiled:
+            return []
+        # Friends come from user documents, so tolerate malformed entries
+        friends = [friend for friend in friends if isinstance(friend, dict)]
+        friend = self.rng.choice(friends) if friends else None
+
+        suggestions = []
+        for static, template in compiled:
+            if static is not None:
+                suggestions.append(static)
+            elif friend is not None and all(friend.get(field) for field in template["fields"]):
+                suggestions.append(CopingSuggestion(
+                    suggestion=template["suggestion"].format_map(friend),
+                    category=template["category"],
+                    is_social=True,
+                    friend_name=friend["name"],
+                    activity=friend.get(template["activity"]) if "activity" in template else None,
+                ))
+        return suggestions
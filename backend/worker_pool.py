@@ -0,0 +1,223 @@
+# backend/worker_pool.py
+import itertools
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional
+
+import torch
+import torch.multiprocessing as mp
+from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerCrashedError(Exception):
+    """Raised for a batch whose worker process died while running it"""
+
+
+class WorkerTimeoutError(WorkerCrashedError):
+    """Raised for a batch that got no result within the pool's batch timeout"""
+
+
+def _worker_main(index: int, model, tokenizer, num_threads: int, task_queue, result_queue, current):
+    """Inference loop run inside each worker process"""
+    # Shutdown is driven by the parent, not by terminal signals
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+    if isinstance(model, str):
+        # Map the checkpoint's safetensors file; every worker shares its pages
+        from registry import load_mmap_model
+        model = load_mmap_model(model)
+    model.eval()
+    classifier = pipeline(
+        "text-classification",
+        model=model,
+        tokenizer=tokenizer,
+        return_all_scores=True
+    )
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        task_id, texts = task
+        # Shared memory, written at once: a queued message could die unsent with us
+        current.value = task_id
+        try:
+            with torch.inference_mode():
+                outputs = classifier(texts, batch_size=len(texts), truncation=True)
+            results = [{emotion['label']: emotion['score'] for emotion in emotions} for emotions in outputs]
+            result_queue.put(("done", task_id, results))
+        except Exception as e:
+            result_queue.put(("error", task_id, f"{type(e).__name__}: {e}"))
+        current.value = -1
+
+
+class InferenceWorkerPool:
+    """
+    Pool of model worker processes that share one read-only copy of the weights.
+
+    The parent loads the model once from safetensors (memory-mapped) and moves
+    its tensors into shared memory; every worker maps the same pages instead
+    of holding its own copy. A local checkpoint with a `model.safetensors`
+    file is instead mapped by each worker directly, so the weights are never
+    copied at all. Batches are handed out over a local IPC queue, so
+    whichever worker is idle picks up the next batch.
+
+    Workers are checked every `check_interval` seconds, busy or not. Each
+    worker records the batch it took in a shared-memory slot, so when one
+    dies it is replaced and exactly that batch fails; batches still queued
+    are left for the other workers. `infer` gives up after `batch_timeout`
+    seconds, which also covers a result lost with its worker.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        num_workers: Optional[int] = None,
+        threads_per_worker: Optional[int] = None,
+        batch_timeout: float = 120.0,
+        check_interval: float = 1.0,
+    ):
+        cpu_count = os.cpu_count() or 1
+        self.model_name = model_name
+        self.num_workers = num_workers or cpu_count
+        self.threads_per_worker = threads_per_worker or max(1, cpu_count // self.num_workers)
+        self.batch_timeout = batch_timeout
+        self.check_interval = check_interval
+
+        self._ctx = mp.get_context("spawn")
+        self._task_queue = None
+        self._result_queue = None
+        self._processes: List = []
+        self._model = None
+        self._tokenizer = None
+
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._futures: Dict[int, Future] = {}
+        # Per worker: shared ID of the task it is running, -1 when idle
+        self._current: List = []
+        self._collector: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        """Load shared weights and spawn the worker processes"""
+        logger.info(
+            f"Starting {self.num_workers} inference workers "
+            f"({self.threads_per_worker} threads each) for {self.model_name}"
+        )
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        if os.path.isfile(os.path.join(self.model_name, "model.safetensors")):
+            # Workers map the file themselves (see _worker_main)
+            self._model = self.model_name
+        else:
+            self._model = AutoModelForSequenceClassification.from_pretrained(
+                self.model_name, use_safetensors=True
+            )
+            self._model.eval()
+            self._model.share_memory()
+
+        self._task_queue = self._ctx.Queue()
+        self._result_queue = self._ctx.Queue()
+        self._stopping.clear()
+        self._current = [self._ctx.Value('q', -1, lock=False) for _ in range(self.num_workers)]
+        self._processes = [self._spawn(index) for index in range(self.num_workers)]
+
+        self._collector = threading.Thread(
+            target=self._collect_results, name="inference-results", daemon=True
+        )
+        self._collector.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Ask workers to exit and fail anything still outstanding"""
+        self._stopping.set()
+        for _ in self._processes:
+            self._task_queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+        with self._lock:
+            pending = list(self._futures.values())
+            self._futures.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Inference worker pool stopped"))
+
+    def infer(self, texts: List[str]) -> List[dict]:
+        """Run one batch on whichever worker is free and wait for the scores"""
+        task_id = next(self._ids)
+        future = Future()
+        with self._lock:
+            self._futures[task_id] = future
+        self._task_queue.put((task_id, texts))
+        try:
+            return future.result(timeout=self.batch_timeout)
+        except FutureTimeoutError:
+            self._forget(task_id)
+            raise WorkerTimeoutError(f"No result for a batch of {len(texts)} within {self.batch_timeout}s")
+
+    def _spawn(self, index: int):
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(index, self._model, self._tokenizer, self.threads_per_worker,
+                  self._task_queue, self._result_queue, self._current[index]),
+            name=f"inference-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def _collect_results(self):
+        last_check = time.monotonic()
+        while not self._stopping.is_set():
+            # Checked on a timer too: under steady load the queue is never empty
+            if time.monotonic() - last_check >= self.check_interval:
+                self._check_workers()
+                last_check = time.monotonic()
+            try:
+                kind, task_id, payload = self._result_queue.get(timeout=self.check_interval)
+            except queue.Empty:
+                continue
+
+            future = self._forget(task_id)
+            if future is None or future.done():
+                continue
+            if kind == "done":
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+    def _forget(self, task_id: int) -> Optional[Future]:
+        """Drop a task's bookkeeping; returns its future if still pending"""
+        with self._lock:
+            return self._futures.pop(task_id, None)
+
+    def _check_workers(self):
+        """Replace dead workers and fail the batch each one was running"""
+        for index, process in enumerate(self._processes):
+            if process.is_alive() or self._stopping.is_set():
+                continue
+
+            logger.error(f"Inference worker {index} exited with code {process.exitcode}; restarting")
+            task_id = self._current[index].value
+            self._current[index].value = -1
+            future = self._forget(task_id) if task_id >= 0 else None
+            if future is not None and not future.done():
+                future.set_exception(WorkerCrashedError(f"Inference worker {index} crashed"))
+            self._processes[index] = self._spawn(index)
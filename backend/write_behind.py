@@ -0,0 +1,247 @@
+# backend/write_behind.py
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from memory_firestore import new_document_id
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, dict):
+        if set(value) == {"__datetime__"}:
+            return datetime.fromisoformat(value["__datetime__"])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+class WriteBehindBuffer:
+    """
+    Durable write-behind buffer for Firestore document creation.
+
+    `add` assigns a client-side document ID, appends the write to a local
+    append-only log and returns immediately. A background thread commits
+    pending writes with Firestore batched writes once `flush_size` writes are
+    waiting or `flush_interval` seconds have passed, retrying failed commits
+    with backoff. Writes use `set` on the pre-assigned ID, so replaying the
+    log after a crash never creates duplicates.
+    """
+
+    def __init__(
+        self,
+        get_db: Callable[[], Any],
+        log_path: str,
+        flush_size: int = 200,
+        flush_interval: float = 1.0,
+        max_backoff: float = 30.0,
+        fsync: bool = False,
+    ):
+        self.get_db = get_db
+        self.log_path = log_path
+        self.committed_path = log_path + ".committed"
+        self.flush_size = max(1, min(flush_size, MAX_BATCH_WRITES))
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.fsync = fsync
+
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.replayed = 0
+
+        self._pending: Deque[Dict] = deque()
+        self._seq = 0
+        self._committed_seq = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._log = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        """Replay unflushed writes from the log and start the flush thread"""
+        directory = os.path.dirname(self.log_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        torn = self._replay()
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        if torn:
+            # End the line a crash cut short, or the next write would join it
+            self._log.write("\n")
+            self._log.flush()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Flush what is pending (best effort within `timeout`) and stop"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning(f"Write-behind flush still running after {timeout}s; abandoning it")
+            self._thread = None
+        # Under the lock, so a flush that outlived the join sees the log closed
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+        if self._pending:
+            logger.warning(f"{len(self._pending)} buffered writes left in {self.log_path}; they replay on restart")
+
+    def add(self, collection: str, data: Dict) -> str:
+        """Buffer a new document and return its ID"""
+        doc_id = new_document_id()
+        with self._lock:
+            self._seq += 1
+            record = {"seq": self._seq, "collection": collection, "id": doc_id, "data": _encode(data)}
+            self._log.write(json.dumps(record) + "\n")
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            self._pending.append(record)
+            if len(self._pending) >= self.flush_size:
+                self._wakeup.set()
+        return doc_id
+
+    def pending_documents(self, collection: str) -> List[Tuple[str, Dict]]:
+        """(ID, data) of the buffered writes to `collection` not committed yet, oldest first"""
+        with self._lock:
+            records = [record for record in self._pending if record["collection"] == collection]
+        return [(record["id"], _decode(record["data"])) for record in records]
+
+    def stats(self) -> Dict:
+        return {
+            "pending": self.pending,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "replayed": self.replayed,
+        }
+
+    def _flush_loop(self):
+        backoff = self.flush_interval
+        # In the past, so writes replayed by start() go out at once
+        last_flush = time.monotonic() - self.flush_interval
+        while True:
+            self._wakeup.wait(max(0.0, last_flush + self.flush_interval - time.monotonic()))
+            self._wakeup.clear()
+            stopping = self._stopping.is_set()
+            if not stopping and len(self._pending) < self.flush_size and time.monotonic() - last_flush < self.flush_interval:
+                # A stale wakeup from a batch that already went out: keep coalescing
+                continue
+            last_flush = time.monotonic()
+
+            while self._pending:
+                db = self.get_db()
+                if db is None:
+                    break
+                try:
+                    self._flush_once(db)
+                    backoff = self.flush_interval
+                except Exception as e:
+                    self.failed_flushes += 1
+                    if self._stopping.is_set():
+                        # Stopping: leave the rest to replay on restart
+                        logger.error(f"Write-behind flush failed while stopping ({len(self._pending)} pending): {e}")
+                        return
+                    logger.error(f"Write-behind flush failed ({len(self._pending)} pending), retrying in {backoff:.1f}s: {e}")
+                    if self._stopping.wait(backoff):
+                        return
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                if len(self._pending) < self.flush_size and not stopping:
+                    break
+
+            if stopping:
+                return
+
+    def _flush_once(self, db):
+        records: List[Dict] = list(self._pending)[:self.flush_size]
+        batch = db.batch()
+        for record in records:
+            reference = db.collection(record["collection"]).document(record["id"])
+            batch.set(reference, _decode(record["data"]))
+        batch.commit()
+
+        with self._lock:
+            for _ in records:
+                self._pending.popleft()
+            self._committed_seq = records[-1]["seq"]
+            self._write_committed()
+            if not self._pending:
+                self._compact()
+        self.flushed += len(records)
+        self.flushes += 1
+
+    def _write_committed(self):
+        tmp_path = self.committed_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(self._committed_seq))
+        os.replace(tmp_path, self.committed_path)
+
+    def _compact(self):
+        """Truncate the log once every write in it has been committed"""
+        if self._log is None:
+            return
+        # Reset the marker first: a crash in between only replays
+        # already-committed writes, which are idempotent
+        self._committed_seq = 0
+        self._write_committed()
+        self._log.seek(0)
+        self._log.truncate()
+        self._seq = 0
+
+    def _replay(self) -> bool:
+        """Queue the logged writes not committed yet; True if the log ends in a torn line"""
+        if os.path.exists(self.committed_path):
+            with open(self.committed_path) as f:
+                self._committed_seq = int(f.read().strip() or 0)
+        if not os.path.exists(self.log_path):
+            return False
+
+        torn = False
+        with open(self.log_path, encoding="utf-8") as f:
+            for line in f:
+                torn = not line.endswith("\n")
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append
+                    logger.warning("Skipping unreadable write-behind log line")
+                    continue
+                self._seq = max(self._seq, record["seq"])
+                if record["seq"] > self._committed_seq:
+                    self._pending.append(record)
+
+        self.replayed = len(self._pending)
+        if self.replayed:
+            logger.info(f"Replaying {self.replayed} buffered writes from {self.log_path}")
+            self._wakeup.set()
+        return torn
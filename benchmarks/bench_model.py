@@ -0,0 +1,142 @@
+# benchmarks/bench_model.py
+"""
+Offline microbenchmarks for EmotionAnalyzer
+
+    python benchmarks/bench_model.py --output benchmarks/results/model.json
+
+Covers tokenization, the forward pass over a batch size x sequence length
+grid, post-processing (scalar and vectorized) and end-to-end
+`batch_analyze`. Uses the tiny local fixture unless `--model` names a real
+checkpoint.
+"""
+import argparse
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from common import MODEL_DIR, latency_summary, rss_mb, write_report
+from fixtures import ensure_tiny_model, journal_texts, texts_of_length
+
+sys.path.insert(0, MODEL_DIR)
+
+from analyzer_loader import load_emotion_analyzer
+
+
+def _parse_ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def timed(fn: Callable, repeats: int) -> List[float]:
+    fn()
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_tokenization(analyzer, word_counts: List[int], count: int, repeats: int) -> List[Dict]:
+    results = []
+    for words in word_counts:
+        texts = texts_of_length(count, words)
+        samples = timed(lambda: analyzer.tokenizer(texts, truncation=True, max_length=analyzer.max_length), repeats)
+        tokens = sum(len(ids) for ids in analyzer.tokenizer(texts, truncation=True, max_length=analyzer.max_length)['input_ids'])
+        median = sorted(samples)[len(samples) // 2]
+        results.append({
+            "words": words,
+            "texts": count,
+            **latency_summary(samples),
+            "texts_per_second": count / median,
+            "tokens_per_second": tokens / median,
+        })
+    return results
+
+
+def bench_forward(analyzer, batch_sizes: List[int], seq_lens: List[int], repeats: int) -> List[Dict]:
+    results = []
+    for seq_len in seq_lens:
+        for batch_size in batch_sizes:
+            batch = analyzer.tokenizer(
+                texts_of_length(batch_size, seq_len),
+                truncation=True,
+                max_length=seq_len,
+                padding="max_length",
+                return_tensors="np",
+            )
+            samples = timed(lambda: analyzer._forward(batch), repeats)
+            median = sorted(samples)[len(samples) // 2]
+            results.append({
+                "batch_size": batch_size,
+                "seq_len": seq_len,
+                **latency_summary(samples),
+                "per_text_ms": median / batch_size * 1000,
+                "texts_per_second": batch_size / median,
+            })
+    return results
+
+
+def bench_postprocess(analyzer, rows: int, repeats: int) -> Dict:
+    rng = np.random.default_rng(0)
+    labels = analyzer.labels
+    score_batch = [dict(zip(labels, row.tolist())) for row in rng.dirichlet(np.ones(len(labels)), size=rows)]
+    texts = ["benchmark"] * rows
+
+    scalar = timed(lambda: [analyzer._build_result(text, scores) for text, scores in zip(texts, score_batch)], repeats)
+    vectorized = timed(lambda: analyzer._build_results(texts, score_batch), repeats)
+    scalar_us = sorted(scalar)[len(scalar) // 2] / rows * 1e6
+    vectorized_us = sorted(vectorized)[len(vectorized) // 2] / rows * 1e6
+    return {
+        "rows": rows,
+        "scalar_per_row_us": scalar_us,
+        "vectorized_per_row_us": vectorized_us,
+        "speedup": scalar_us / vectorized_us if vectorized_us else None,
+    }
+
+
+def bench_end_to_end(analyzer, count: int, repeats: int) -> Dict:
+    texts = journal_texts(count, seed=1)
+    samples = timed(lambda: analyzer.batch_analyze(texts), repeats)
+    median = sorted(samples)[len(samples) // 2]
+    return {"texts": count, **latency_summary(samples), "texts_per_second": count / median}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EmotionAnalyzer microbenchmarks")
+    parser.add_argument("--model", default=None, help="Model name or directory (default: tiny local fixture)")
+    parser.add_argument("--batch-sizes", default="1,4,16,32")
+    parser.add_argument("--seq-lens", default="16,64,128,256")
+    parser.add_argument("--texts", type=int, default=256, help="Texts for tokenization and end-to-end runs")
+    parser.add_argument("--postprocess-rows", type=int, default=4096)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=0, help="Torch intra-op threads (0 keeps the default)")
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    import torch
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    EmotionAnalyzer = load_emotion_analyzer()
+    model = args.model or ensure_tiny_model()
+    started = time.perf_counter()
+    analyzer = EmotionAnalyzer(model_name=model)
+    load_seconds = time.perf_counter() - started
+
+    report = {
+        "benchmark": "model",
+        "config": {**vars(args), "model": model},
+        "load_seconds": load_seconds,
+        "tokenization": bench_tokenization(analyzer, _parse_ints(args.seq_lens), args.texts, args.repeats),
+        "forward": bench_forward(analyzer, _parse_ints(args.batch_sizes), _parse_ints(args.seq_lens), args.repeats),
+        "postprocess": bench_postprocess(analyzer, args.postprocess_rows, args.repeats),
+        "end_to_end": bench_end_to_end(analyzer, args.texts, max(1, args.repeats // 2)),
+        "memory": rss_mb(),
+    }
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/bench_suggestions.py
+"""
+Per-call cost of coping-suggestion generation
+
+    python benchmarks/bench_suggestions.py --iterations 20000
+
+Compares rendering one mood from the precompiled catalog (what /predict
+does) against recompiling every mood per call (what it used to do), and
+reports friend-index lookups against the in-memory Firestore.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from common import BACKEND_DIR, write_report
+
+sys.path.insert(0, BACKEND_DIR)
+
+from friends import FriendIndex
+from memory_firestore import InMemoryFirestore
+from repository import InMemoryRepository
+from suggestions import SuggestionCatalog
+
+FRIENDS = [
+    {"name": "Pratik", "favorite_show": "Silo", "last_talked": "2 days ago", "phone": "+1234567890"},
+    {"name": "Maya", "favorite_show": "The Bear", "last_talked": "1 week ago", "phone": "+1234567891"},
+]
+
+
+def per_call_us(fn, iterations: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark coping-suggestion generation")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    catalog = SuggestionCatalog()
+
+    def rebuild_all_moods():
+        # Old behaviour: build every mood's suggestions, keep one
+        fresh = SuggestionCatalog()
+        return {mood: fresh.render(mood, FRIENDS) for mood in fresh.moods}["okay"]
+
+    db = InMemoryFirestore()
+    for i in range(args.users):
+        db.collection('users').document(f"user-{i}").set({'friends': FRIENDS})
+    repository = InMemoryRepository(db)
+    index = FriendIndex(lambda: repository, FRIENDS)
+    loop = asyncio.new_event_loop()
+    user_ids = [f"user-{i}" for i in range(args.users)]
+    for user_id in user_ids:
+        loop.run_until_complete(index.get(user_id))
+    counter = iter(range(10 ** 12))
+
+    def cold_lookup():
+        index.invalidate()
+        return loop.run_until_complete(index.get(user_ids[next(counter) % args.users]))
+
+    report = {
+        "benchmark": "suggestions",
+        "iterations": args.iterations,
+        "render_one_mood_us": per_call_us(lambda: catalog.render("okay", FRIENDS), args.iterations),
+        "rebuild_all_moods_us": per_call_us(rebuild_all_moods, args.iterations),
+        # Hits never await, so they are timed without the event loop round trip
+        "friend_index_hit_us": per_call_us(lambda: index.cached(user_ids[next(counter) % args.users]), args.iterations),
+        "friend_index_miss_us": per_call_us(cold_lookup, args.iterations),
+        "suggestions_with_cached_friends_us": per_call_us(
+            lambda: catalog.render("okay", index.cached(user_ids[0])), args.iterations
+        ),
+    }
+    report["speedup"] = report["rebuild_all_moods_us"] / report["render_one_mood_us"]
+    loop.close()
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
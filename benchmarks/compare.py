@@ -0,0 +1,106 @@
+# benchmarks/compare.py
+"""
+Compare two benchmark reports
+
+    python benchmarks/compare.py baseline.json candidate.json --threshold 10
+
+Prints every numeric metric present in both reports with its relative
+change. Latency, time and memory metrics are better when lower; throughput,
+speedup and hit ratios when higher. With `--fail-on-regression` the exit
+status is 1 when any of them got worse by more than `--threshold` percent.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Optional
+
+HIGHER_IS_BETTER = ("per_second", "throughput", "speedup", "hit_ratio")
+LOWER_IS_BETTER = ("_ms", "_us", "_seconds", "_mb")
+# Sections that describe the run rather than measure it
+SKIPPED = ("environment", "config")
+
+
+def flatten(report, prefix: str = "") -> Dict[str, float]:
+    """`a.b.0.c`-style paths to every numeric leaf"""
+    values = {}
+    if isinstance(report, dict):
+        items = report.items()
+    elif isinstance(report, list):
+        items = ((_list_key(item, index), item) for index, item in enumerate(report))
+    else:
+        if isinstance(report, (int, float)) and not isinstance(report, bool):
+            values[prefix] = float(report)
+        return values
+    for key, value in items:
+        if not prefix and key in SKIPPED:
+            continue
+        values.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    return values
+
+
+def _list_key(item, index: int) -> str:
+    """Label grid rows by their parameters so reordering does not misalign them"""
+    if isinstance(item, dict):
+        params = [f"{name}={item[name]}" for name in ("batch_size", "seq_len", "words") if name in item]
+        if params:
+            return "[" + ",".join(params) + "]"
+    return str(index)
+
+
+def direction(metric: str) -> Optional[int]:
+    """+1 when higher is better, -1 when lower is better, None when neutral"""
+    name = metric.rsplit(".", 1)[-1]
+    if any(marker in name for marker in HIGHER_IS_BETTER):
+        return 1
+    if name.endswith(LOWER_IS_BETTER):
+        return -1
+    return None
+
+
+def compare(baseline: Dict, candidate: Dict, threshold: float) -> Dict:
+    before, after = flatten(baseline), flatten(candidate)
+    rows, regressions = [], []
+    for metric in sorted(set(before) & set(after)):
+        old, new = before[metric], after[metric]
+        change = (new - old) / abs(old) * 100 if old else None
+        sign = direction(metric)
+        status = ""
+        if change is not None and sign is not None and abs(change) > threshold:
+            status = "better" if change * sign > 0 else "WORSE"
+            if status == "WORSE":
+                regressions.append(metric)
+        rows.append((metric, old, new, change, status))
+    return {"rows": rows, "regressions": regressions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark JSON reports")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent change that counts")
+    parser.add_argument("--only-changed", action="store_true", help="Hide metrics within the threshold")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    result = compare(baseline, candidate, args.threshold)
+    width = max((len(row[0]) for row in result["rows"]), default=10)
+    print(f"{'metric':<{width}}  {'baseline':>12}  {'candidate':>12}  {'change':>9}")
+    for metric, old, new, change, status in result["rows"]:
+        if args.only_changed and not status:
+            continue
+        change_text = f"{change:+8.1f}%" if change is not None else "       -"
+        print(f"{metric:<{width}}  {old:>12.4g}  {new:>12.4g}  {change_text}  {status}")
+
+    if result["regressions"]:
+        print(f"\n{len(result['regressions'])} metrics regressed by more than {args.threshold}%")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
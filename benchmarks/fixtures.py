@@ -0,0 +1,141 @@
+# benchmarks/fixtures.py
+"""
+Offline fixtures: a synthetic journal corpus and a tiny local emotion model
+
+    python benchmarks/fixtures.py --output-dir benchmarks/.fixtures/tiny-emotion
+
+The model is a randomly initialised two-layer DistilBERT with the same seven
+labels as the production classifier and a word-level tokenizer built from
+the corpus vocabulary. Its scores are meaningless, but it exercises the same
+tokenizer, padding, batching and post-processing code paths, loads in well
+under a second and needs no network access.
+"""
+import argparse
+import os
+import random
+import re
+from typing import List
+
+from common import BENCH_DIR
+
+DEFAULT_FIXTURE_DIR = os.path.join(BENCH_DIR, ".fixtures", "tiny-emotion")
+
+# Same label set as j-hartmann/emotion-english-distilroberta-base
+EMOTION_LABELS = ['anger', 'disgust', 'fear', 'joy', 'neutral', 'sadness', 'surprise']
+
+SENTENCES = [
+    "I feel really sad today and I don't know why.",
+    "Everything seems overwhelming at work this week.",
+    "Had coffee with an old friend and it was great.",
+    "I'm so angry about how the meeting went, nobody listened to me.",
+    "Nervous about tomorrow's exam, I can't stop thinking about it.",
+    "Just a normal day, nothing special happened.",
+    "Wow, I did not expect that surprise party at all!",
+    "I went for a long walk and felt calmer afterwards.",
+    "My sister called and we laughed for an hour.",
+    "I couldn't sleep last night because my mind kept racing.",
+    "Work was frustrating but I finished the report.",
+    "I'm grateful for my friends and the time we spend together.",
+    "The weather was grey and I stayed inside all day.",
+    "I feel proud that I finally started running again.",
+    "Something about today made me feel lonely.",
+    "We watched a new show and I loved every episode.",
+    "I'm worried about my family and their health.",
+    "Cooking dinner helped me relax after a long day.",
+    "I snapped at a coworker and I regret it.",
+    "Honestly I feel fine, a little tired maybe.",
+]
+
+MOODS = ['excellent', 'good', 'okay', 'struggling', 'difficult']
+
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+# Same split as the tokenizers `Whitespace` pre-tokenizer
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]+")
+
+
+def journal_texts(count: int, seed: int = 0, min_words: int = 5, max_words: int = 150) -> List[str]:
+    """`count` journal entries of random length, reproducible for a given seed"""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        target = rng.randint(min_words, max_words)
+        words: List[str] = []
+        while len(words) < target:
+            words.extend(rng.choice(SENTENCES).split())
+        texts.append(" ".join(words[:target]))
+    return texts
+
+
+def texts_of_length(count: int, words: int, seed: int = 0) -> List[str]:
+    """`count` entries of exactly `words` words"""
+    return journal_texts(count, seed=seed, min_words=words, max_words=words)
+
+
+def vocabulary() -> List[str]:
+    words = sorted({token for sentence in SENTENCES for token in _WORD_PATTERN.findall(sentence.lower())})
+    return SPECIAL_TOKENS + words
+
+
+def make_tiny_model(output_dir: str = DEFAULT_FIXTURE_DIR, seed: int = 0, max_length: int = 512) -> str:
+    """Write the tiny model and tokenizer to `output_dir` and return it"""
+    import torch
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors
+    from transformers import DistilBertConfig, DistilBertForSequenceClassification, PreTrainedTokenizerFast
+
+    vocab = {token: index for index, token in enumerate(vocabulary())}
+    tokenizer = Tokenizer(models.WordLevel(vocab=vocab, unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.Lowercase()
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]",
+        pair="[CLS] $A [SEP] $B [SEP]",
+        special_tokens=[("[CLS]", vocab["[CLS]"]), ("[SEP]", vocab["[SEP]"])],
+    )
+    fast_tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        unk_token="[UNK]",
+        pad_token="[PAD]",
+        cls_token="[CLS]",
+        sep_token="[SEP]",
+        mask_token="[MASK]",
+        model_max_length=max_length,
+        model_input_names=["input_ids", "attention_mask"],
+    )
+
+    torch.manual_seed(seed)
+    config = DistilBertConfig(
+        vocab_size=len(vocab),
+        max_position_embeddings=max_length,
+        n_layers=2,
+        n_heads=2,
+        dim=64,
+        hidden_dim=128,
+        num_labels=len(EMOTION_LABELS),
+        id2label=dict(enumerate(EMOTION_LABELS)),
+        label2id={label: index for index, label in enumerate(EMOTION_LABELS)},
+    )
+    model = DistilBertForSequenceClassification(config)
+
+    os.makedirs(output_dir, exist_ok=True)
+    fast_tokenizer.save_pretrained(output_dir)
+    model.save_pretrained(output_dir, safe_serialization=True)
+    return output_dir
+
+
+def ensure_tiny_model(output_dir: str = DEFAULT_FIXTURE_DIR) -> str:
+    """Build the fixture once; later runs reuse it"""
+    if not os.path.exists(os.path.join(output_dir, "config.json")):
+        make_tiny_model(output_dir)
+    return output_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the tiny offline emotion model fixture")
+    parser.add_argument("--output-dir", default=DEFAULT_FIXTURE_DIR)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(make_tiny_model(args.output_dir, seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# benchmarks/load_test.py
+"""
+In-process load test of the FastAPI backend
+
+    python benchmarks/load_test.py --requests 2000 --concurrency 32 --output benchmarks/results/load.json
+
+Drives the real app through httpx's ASGI transport with Firestore and FCM
+replaced by their in-memory stand-ins (`NEUS_FIRESTORE=memory`,
+`NEUS_FCM_TRANSPORT=fake`) and the tiny local model fixture, so it runs
+offline on a CPU-only box. Reports p50/p95/p99 latency per endpoint,
+throughput, status codes, RSS and the server's own counters.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+from common import BACKEND_DIR, latency_summary, rss_mb, write_report
+from fixtures import MOODS, ensure_tiny_model, journal_texts
+
+
+def _parse_mix(value: str) -> List[Tuple[str, float]]:
+    mix = []
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+def configure_environment(args):
+    """Point the backend at the offline stand-ins before it is imported"""
+    os.environ.setdefault("NEUS_FIRESTORE", "memory")
+    os.environ.setdefault("NEUS_FCM_TRANSPORT", "fake")
+    os.environ.setdefault("NEUS_EMOTION_MODEL", args.model or ensure_tiny_model())
+    os.environ.setdefault("NEUS_WARMUP_BUCKETS", "16,64")
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+
+async def wait_until_ready(api, timeout: float):
+    deadline = time.monotonic() + timeout
+    while not api.startup_state.is_ready():
+        if api.startup_state.errors:
+            raise RuntimeError(f"Backend failed to start: {api.startup_state.errors}")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Backend not ready after {timeout}s: {api.startup_state.report()}")
+        await asyncio.sleep(0.05)
+
+
+async def run_load(api, args) -> Dict:
+    import httpx
+
+    rng = random.Random(args.seed)
+    corpus = journal_texts(args.corpus_size, seed=args.seed)
+    users = [f"load-user-{i}" for i in range(args.users)]
+    mix = _parse_mix(args.mix)
+    names, weights = [name for name, _ in mix], [weight for _, weight in mix]
+
+    def build_request():
+        scenario = rng.choices(names, weights)[0]
+        user_id = rng.choice(users)
+        if scenario == "predict":
+            journal = rng.choice(corpus) if rng.random() >= args.unique_ratio else f"{rng.choice(corpus)} #{rng.random()}"
+            return scenario, "POST", "/predict", {"mood": rng.choice(MOODS), "journal": journal, "user_id": user_id}
+        if scenario == "history":
+            return scenario, "GET", f"/mood-history/{user_id}?limit={args.history_limit}", None
+        if scenario == "trend":
+            return scenario, "GET", f"/mood-trend/{user_id}", None
+        if scenario == "friends":
+            return scenario, "GET", f"/friends/{user_id}", None
+        raise ValueError(f"Unknown scenario: {scenario}")
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    async with api.app.router.lifespan_context(api.app):
+        ready_started = time.perf_counter()
+        await wait_until_ready(api, args.ready_timeout)
+        ready_seconds = time.perf_counter() - ready_started
+
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as client:
+            async def send(record: bool):
+                scenario, method, path, body = build_request()
+                started = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                elapsed = time.perf_counter() - started
+                if record:
+                    latencies[scenario].append(elapsed)
+                    statuses[scenario][response.status_code] += 1
+
+            for _ in range(args.warmup):
+                await send(record=False)
+
+            remaining = args.requests
+            rss_before = rss_mb()
+
+            async def worker():
+                nonlocal remaining
+                while remaining > 0:
+                    remaining -= 1
+                    await send(record=True)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            wall_seconds = time.perf_counter() - started
+
+            server = {
+                "inference": (await client.get("/inference/stats")).json(),
+                "mood_history_cache": (await client.get("/mood-history-cache/stats")).json(),
+                "friend_index": api.friend_index.stats(),
+                "firestore_reads": getattr(api.db, "reads", None),
+                "firestore_writes": getattr(api.db, "writes", None),
+            }
+
+    everything = [latency for samples in latencies.values() for latency in samples]
+    return {
+        "startup_seconds": ready_seconds,
+        "wall_seconds": wall_seconds,
+        "throughput_rps": len(everything) / wall_seconds if wall_seconds else 0.0,
+        "latency": latency_summary(everything),
+        "endpoints": {
+            scenario: {
+                **latency_summary(samples),
+                "throughput_rps": len(samples) / wall_seconds if wall_seconds else 0.0,
+                "status_codes": {str(code): count for code, count in sorted(statuses[scenario].items())},
+            }
+            for scenario, samples in sorted(latencies.items())
+        },
+        "memory": {"before": rss_before, "after": rss_mb()},
+        "server": server,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process load test of the backend API")
+    parser.add_argument("--model", default=None, help="Model name or directory (default: tiny local fixture)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=50, help="Unrecorded requests sent first")
+    parser.add_argument("--mix", default="predict=0.6,history=0.3,trend=0.05,friends=0.05",
+                        help="Scenario weights: predict, history, trend, friends")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--corpus-size", type=int, default=500)
+    parser.add_argument("--unique-ratio", type=float, default=0.5,
+                        help="Share of journals made unique (the rest can hit the result cache)")
+    parser.add_argument("--history-limit", type=int, default=10)
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    configure_environment(args)
+    import app as api
+
+    report = {
+        "benchmark": "load",
+        "config": {
+            **vars(args),
+            **{name: value for name, value in os.environ.items() if name.startswith("NEUS_")},
+        },
+        **asyncio.run(run_load(api, args)),
+    }
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
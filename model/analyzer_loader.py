@@ -0,0 +1,29 @@
+# model/analyzer_loader.py
+"""
+Import `EmotionAnalyzer` from emotion-analyzer.py
+
+The module's file name is not a valid identifier, so it cannot be imported
+with a plain `import`. Scripts here, the benchmarks and anything else that
+needs the analyzer go through `load_emotion_analyzer`. The module is
+loaded once per process, so every caller gets the same class.
+"""
+import importlib.util
+import os
+import sys
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE_NAME = "emotion_analyzer"
+
+
+def load_emotion_analyzer():
+    """The EmotionAnalyzer class, loading its module on first use"""
+    module = sys.modules.get(MODULE_NAME)
+    if module is None:
+        if MODEL_DIR not in sys.path:
+            sys.path.insert(0, MODEL_DIR)
+        spec = importlib.util.spec_from_file_location(MODULE_NAME, os.path.join(MODEL_DIR, "emotion-analyzer.py"))
+        module = importlib.util.module_from_spec(spec)
+        # Registered only once it has loaded, so a failed import is retried
+        spec.loader.exec_module(module)
+        sys.modules[MODULE_NAME] = module
+    return module.EmotionAnalyzer
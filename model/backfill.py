@@ -0,0 +1,475 @@
+# model/backfill.py
+"""
+Recompute `emotion_scores` for stored mood entries after a model change
+
+    # From a JSONL export to a JSONL file of {"id", "emotion_scores"}
+    python backfill.py --input entries.jsonl --output scores.jsonl --workers 4
+
+    # Straight from Firestore, writing the scores back in batches
+    python backfill.py --collection mood_entries --write-back --workers 4
+
+Entries are streamed, analyzed in chunks by a pool of worker processes (each
+with its own EmotionAnalyzer) and written in input order. Progress is
+checkpointed after every written chunk; rerunning the same command resumes
+after the last one. Entries that cannot be scored or written (e.g. deleted
+since they were read) are skipped and listed in the `--errors` file. Live
+rows/sec and ETA go to stderr.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from analyzer_loader import load_emotion_analyzer
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+# (document id, journal text)
+Entry = Tuple[str, str]
+# (document id, error message)
+Failure = Tuple[str, str]
+
+
+# Sources
+
+class JsonlSource:
+    """Entries from a JSONL export, one document per line"""
+
+    def __init__(self, path: str, id_field: str = "id", text_field: str = "journal"):
+        self.path = path
+        self.id_field = id_field
+        self.text_field = text_field
+
+    def describe(self) -> str:
+        return f"jsonl:{os.path.abspath(self.path)}"
+
+    def count(self) -> Optional[int]:
+        with open(self.path, "rb") as f:
+            return sum(1 for line in f if line.strip())
+
+    def read(self, checkpoint: Dict) -> Iterator[Entry]:
+        with open(self.path, encoding="utf-8") as f:
+            lines = (line for line in f if line.strip())
+            for line in islice(lines, checkpoint.get("rows", 0), None):
+                record = json.loads(line)
+                yield str(record[self.id_field]), record.get(self.text_field) or ""
+
+
+class FirestoreSource:
+    """Entries of a Firestore collection, paged in document-ID order"""
+
+    def __init__(self, db, collection: str, text_field: str = "journal", page_size: int = 1000):
+        self.db = db
+        self.collection = collection
+        self.text_field = text_field
+        self.page_size = page_size
+
+    def describe(self) -> str:
+        return f"firestore:{self.collection}"
+
+    def count(self) -> Optional[int]:
+        try:
+            return int(self.db.collection(self.collection).count().get()[0][0].value)
+        except Exception as e:
+            logger.info(f"Collection size unavailable, no ETA: {e}")
+            return None
+
+    def read(self, checkpoint: Dict) -> Iterator[Entry]:
+        from google.cloud.firestore import FieldPath
+
+        last_id = checkpoint.get("last_id")
+        while True:
+            query = self.db.collection(self.collection)\
+                        .order_by(FieldPath.document_id())\
+                        .select([self.text_field])\
+                        .limit(self.page_size)
+            if last_id is not None:
+                query = query.start_after({FieldPath.document_id(): last_id})
+            page = list(query.stream())
+            for doc in page:
+                # DocumentSnapshot.get raises KeyError for a missing field
+                yield doc.id, (doc.to_dict() or {}).get(self.text_field) or ""
+            if len(page) < self.page_size:
+                return
+            last_id = page[-1].id
+
+
+# Sinks
+
+class JsonlSink:
+    """Appends `{"id", "emotion_scores"}` lines; truncates to the checkpoint on resume"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def open(self, checkpoint: Dict):
+        self._file = open(self.path, "a+b")
+        offset = checkpoint.get("output_offset", 0)
+        # Drop lines written after the last checkpoint
+        self._file.truncate(offset)
+        self._file.seek(offset)
+
+    def write(self, rows: List[Tuple[str, Dict]], model_id: str) -> List[Failure]:
+        for doc_id, scores in rows:
+            self._file.write((json.dumps({"id": doc_id, "emotion_scores": scores, "emotion_model": model_id}) + "\n").encode())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return []
+
+    def position(self) -> Dict:
+        return {"output_offset": self._file.tell()}
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class FirestoreSink:
+    """
+    Updates each document's `emotion_scores` with batched writes
+
+    A document deleted since it was read fails its whole batch; that batch
+    is then written one document at a time and the missing ones reported.
+    """
+
+    def __init__(self, db, collection: str):
+        self.db = db
+        self.collection = collection
+
+    def open(self, checkpoint: Dict):
+        pass
+
+    def write(self, rows: List[Tuple[str, Dict]], model_id: str) -> List[Failure]:
+        from google.api_core.exceptions import NotFound
+
+        failures: List[Failure] = []
+        for start in range(0, len(rows), MAX_BATCH_WRITES):
+            chunk = rows[start:start + MAX_BATCH_WRITES]
+            batch = self.db.batch()
+            for doc_id, scores in chunk:
+                reference = self.db.collection(self.collection).document(doc_id)
+                batch.update(reference, {"emotion_scores": scores, "emotion_model": model_id})
+            try:
+                batch.commit()
+            except NotFound:
+                failures += self._update_each(chunk, model_id)
+        return failures
+
+    def _update_each(self, rows: List[Tuple[str, Dict]], model_id: str) -> List[Failure]:
+        from google.api_core.exceptions import NotFound
+
+        failures: List[Failure] = []
+        for doc_id, scores in rows:
+            try:
+                self.db.collection(self.collection).document(doc_id)\
+                    .update({"emotion_scores": scores, "emotion_model": model_id})
+            except NotFound as e:
+                failures.append((doc_id, f"NotFound: {e}"))
+        return failures
+
+    def position(self) -> Dict:
+        return {}
+
+    def close(self):
+        pass
+
+
+class ErrorLog:
+    """
+    Appends `{"id", "error"}` lines for entries that were skipped
+
+    Truncated to the checkpoint on resume, like `JsonlSink`. Without a path
+    failures are only logged.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._file = None
+
+    def open(self, checkpoint: Dict):
+        if self.path is None:
+            return
+        self._file = open(self.path, "a+b")
+        offset = checkpoint.get("errors_offset", 0)
+        self._file.truncate(offset)
+        self._file.seek(offset)
+
+    def write(self, failures: List[Failure]):
+        for doc_id, error in failures:
+            logger.warning(f"Skipping {doc_id}: {error}")
+        if self._file is None:
+            return
+        for doc_id, error in failures:
+            self._file.write((json.dumps({"id": doc_id, "error": error}) + "\n").encode())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def position(self) -> Dict:
+        return {"errors_offset": self._file.tell()} if self._file is not None else {}
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+# Worker processes
+
+_analyzer = None
+
+
+def _init_worker(analyzer_kwargs: Dict, threads: int):
+    global _analyzer
+    import torch
+
+    if threads:
+        torch.set_num_threads(threads)
+    logging.basicConfig(level=logging.WARNING)
+    _analyzer = load_emotion_analyzer()(**analyzer_kwargs)
+
+
+def _analyze_chunk(texts: List[str]) -> List[Tuple[Optional[Dict], Optional[str]]]:
+    """
+    `(emotion scores, None)` per text, or `(None, error)` for a text that
+    failed; empty journals get `{}` like /predict stores
+    """
+    results: List[Tuple[Optional[Dict], Optional[str]]] = [({}, None) for _ in texts]
+    indexes = [index for index, text in enumerate(texts) if text]
+    if indexes:
+        # batch_analyze retries a failed batch text by text, so errors are per text
+        analyses = _analyzer.batch_analyze([texts[index] for index in indexes])
+        for index, analysis in zip(indexes, analyses):
+            if 'error' in analysis:
+                results[index] = (None, f"Analysis failed: {analysis['error']}")
+            else:
+                results[index] = (analysis['emotion_scores'], None)
+    return results
+
+
+# Checkpoints
+
+def load_checkpoint(path: str, source: str, model_id: str, restart: bool) -> Dict:
+    if restart or not os.path.exists(path):
+        return {"source": source, "model": model_id, "rows": 0}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("source") != source or checkpoint.get("model") != model_id:
+        raise SystemExit(
+            f"Checkpoint {path} belongs to {checkpoint.get('source')} / {checkpoint.get('model')}; "
+            f"pass --restart to start over"
+        )
+    return checkpoint
+
+
+def save_checkpoint(path: str, checkpoint: Dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+class Progress:
+    """Rows/sec and ETA on stderr, at most once per `interval` seconds"""
+
+    def __init__(self, total: Optional[int], done: int, interval: float = 2.0):
+        self.total = total
+        self.start_rows = done
+        self.started = time.monotonic()
+        self.interval = interval
+        self._last = 0.0
+
+    def update(self, done: int, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        rate = (done - self.start_rows) / max(now - self.started, 1e-9)
+        line = f"\r{done} rows  {rate:,.1f} rows/s"
+        if self.total:
+            remaining = max(self.total - done, 0)
+            eta = remaining / rate if rate else float("inf")
+            line += f"  {100 * done / self.total:5.1f}%  ETA {_format_duration(eta)}"
+        sys.stderr.write(line + ("\n" if force else ""))
+        sys.stderr.flush()
+
+
+def _format_duration(seconds: float) -> str:
+    if seconds == float("inf"):
+        return "--:--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def run_backfill(source, sink, checkpoint_path: str, analyzer_kwargs: Dict, model_id: str,
+                 workers: int = 2, threads_per_worker: int = 0, chunk_size: int = 256,
+                 restart: bool = False, limit: Optional[int] = None, errors_path: Optional[str] = None) -> Dict:
+    """
+    Analyze every entry of `source` and write the scores to `sink`
+
+    Chunks are written strictly in input order, so the checkpoint (rows done,
+    last document ID, output offsets) always describes a finished prefix.
+    Entries that fail to score or write are appended to `errors_path` and
+    skipped, so one bad entry cannot stall the job on every resume.
+    """
+    checkpoint = load_checkpoint(checkpoint_path, source.describe(), model_id, restart)
+    if checkpoint["rows"]:
+        logger.info(f"Resuming after {checkpoint['rows']} rows")
+    total = source.count()
+    if limit is not None:
+        total = min(total, checkpoint["rows"] + limit) if total is not None else checkpoint["rows"] + limit
+    progress = Progress(total, checkpoint["rows"])
+
+    entries = source.read(checkpoint)
+    if limit is not None:
+        entries = islice(entries, limit)
+
+    sink.open(checkpoint)
+    errors = ErrorLog(errors_path)
+    errors.open(checkpoint)
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    context = multiprocessing.get_context("spawn")
+    pending = {}
+    completed = {}
+    next_submit = next_write = 0
+    started = time.monotonic()
+    rows = failed = 0
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(analyzer_kwargs, threads)) as pool:
+            exhausted = False
+            while True:
+                # Keep two chunks per worker queued; the source is read lazily
+                while not exhausted and len(pending) + len(completed) < 2 * workers:
+                    chunk = list(islice(entries, chunk_size))
+                    if not chunk:
+                        exhausted = True
+                        break
+                    future = pool.submit(_analyze_chunk, [text for _, text in chunk])
+                    pending[future] = (next_submit, chunk)
+                    next_submit += 1
+                if not pending and not completed:
+                    break
+
+                if pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index, chunk = pending.pop(future)
+                        completed[index] = (chunk, future.result())
+
+                while next_write in completed:
+                    chunk, results = completed.pop(next_write)
+                    scored = [(doc_id, scores) for (doc_id, _), (scores, error) in zip(chunk, results) if error is None]
+                    failures = [(doc_id, error) for (doc_id, _), (_, error) in zip(chunk, results) if error is not None]
+                    failures += sink.write(scored, model_id)
+                    if failures:
+                        errors.write(failures)
+                        failed += len(failures)
+                    next_write += 1
+                    rows += len(chunk)
+                    checkpoint["rows"] += len(chunk)
+                    checkpoint["last_id"] = chunk[-1][0]
+                    checkpoint.update(sink.position())
+                    checkpoint.update(errors.position())
+                    save_checkpoint(checkpoint_path, checkpoint)
+                    progress.update(checkpoint["rows"])
+    finally:
+        sink.close()
+        errors.close()
+        progress.update(checkpoint["rows"], force=True)
+
+    elapsed = time.monotonic() - started
+    return {
+        "rows": rows,
+        "total_rows": checkpoint["rows"],
+        "failed_rows": failed,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": rows / elapsed if elapsed else 0.0,
+        "checkpoint": checkpoint_path,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute emotion_scores for stored mood entries")
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument("--input", help="JSONL export of mood entries")
+    source_group.add_argument("--collection", help="Firestore collection to read (e.g. mood_entries)")
+    parser.add_argument("--output", help="JSONL file for {id, emotion_scores} rows")
+    parser.add_argument("--write-back", action="store_true", help="Update the documents in Firestore")
+    parser.add_argument("--target-collection", default="mood_entries", help="Collection --write-back updates")
+    parser.add_argument("--credentials", default=os.getenv("NEUS_FIREBASE_CREDENTIALS"),
+                        help="Firebase service account key (default: application default credentials)")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--text-field", default="journal")
+    parser.add_argument("--model", default="j-hartmann/emotion-english-distilroberta-base")
+    parser.add_argument("--engine", default="torch", choices=["torch", "onnx"])
+    parser.add_argument("--onnx-dir", default=None)
+    parser.add_argument("--long-text", action="store_true", help="Score long journals as windows")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="Default: cores / workers")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--chunk-size", type=int, default=256, help="Entries per work unit and checkpoint")
+    parser.add_argument("--checkpoint", default="backfill.checkpoint.json")
+    parser.add_argument("--errors", default="backfill.errors.jsonl", help="JSONL file of {id, error} for skipped entries")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many entries")
+    args = parser.parse_args()
+
+    if not args.output and not args.write_back:
+        parser.error("Pass --output and/or --write-back")
+    if args.output and args.write_back:
+        parser.error("Pick one of --output or --write-back")
+
+    logging.basicConfig(level=logging.INFO)
+    sys.path.insert(0, MODEL_DIR)
+    from result_cache import model_fingerprint
+
+    db = None
+    if args.collection or args.write_back:
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(args.credentials) if args.credentials else None)
+        db = firestore.client()
+
+    source = FirestoreSource(db, args.collection, args.text_field) if args.collection \
+        else JsonlSource(args.input, args.id_field, args.text_field)
+    sink = FirestoreSink(db, args.target_collection) if args.write_back else JsonlSink(args.output)
+
+    analyzer_kwargs = {
+        "model_name": args.model,
+        "engine": args.engine,
+        "onnx_dir": args.onnx_dir,
+        "batch_size": args.batch_size,
+        "long_text": args.long_text,
+    }
+    # Same identity the analyzer's result cache uses
+    engine_id = "onnx-int8" if args.engine == "onnx" else args.engine
+    if args.long_text:
+        engine_id += "+windows-256-2048"
+    model_id = model_fingerprint(args.onnx_dir or args.model if args.engine == "onnx" else args.model, engine_id)
+
+    report = run_backfill(
+        source, sink, args.checkpoint, analyzer_kwargs, model_id,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+        chunk_size=args.chunk_size,
+        restart=args.restart,
+        limit=args.limit,
+        errors_path=args.errors,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
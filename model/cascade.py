@@ -0,0 +1,370 @@
+# model/cascade.py
+"""
+Two-tier emotion scoring: a hashed n-gram classifier first, the transformer on demand
+
+    # Fit the first stage on the transformer's scores for unlabeled journals
+    python cascade.py train --input journals.jsonl --output cascade.npz
+
+    # Accuracy / throughput per confidence threshold on a held-out set
+    python cascade.py evaluate --cascade cascade.npz --input heldout.jsonl
+
+The first stage is a linear model over hashed word n-grams, trained on the
+transformer's soft scores. When its top probability reaches the threshold
+its scores are used as they are; every other text is escalated to the
+transformer.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9']+|[!?]")
+DEFAULT_THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.01]
+
+
+class HashedNgramClassifier:
+    """
+    Softmax regression over signed, hashed word n-grams
+
+    Features are the word n-grams of the lowercased text hashed into
+    `num_features` buckets (crc32, so hashes are stable across processes),
+    each row L2-normalized. Scoring a journal costs a few microseconds per
+    token and no tokenizer or model download.
+    """
+
+    def __init__(self, labels: Sequence[str], num_features: int = 1 << 18, ngram_range: Tuple[int, int] = (1, 2)):
+        if num_features & (num_features - 1):
+            raise ValueError("num_features must be a power of two")
+        self.labels = list(labels)
+        self.num_features = num_features
+        self.ngram_range = tuple(ngram_range)
+        self.weights = np.zeros((num_features, len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+
+    def _hash_text(self, text: str) -> Dict[int, float]:
+        tokens = _TOKEN.findall(text.lower())
+        mask = self.num_features - 1
+        features: Dict[int, float] = {}
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for start in range(len(tokens) - n + 1):
+                digest = zlib.crc32(" ".join(tokens[start:start + n]).encode())
+                index = digest & mask
+                # The top bit picks a sign so collisions tend to cancel out
+                features[index] = features.get(index, 0.0) + (1.0 if digest & 0x80000000 else -1.0)
+        return features
+
+    def featurize(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sparse (row, column, value) triplets of the L2-normalized feature rows"""
+        rows: List[int] = []
+        columns: List[int] = []
+        values: List[float] = []
+        for row, text in enumerate(texts):
+            features = self._hash_text(text)
+            norm = sum(value * value for value in features.values()) ** 0.5
+            for index, value in features.items():
+                if value:
+                    rows.append(row)
+                    columns.append(index)
+                    values.append(value / norm)
+        return (
+            np.asarray(rows, dtype=np.int64),
+            np.asarray(columns, dtype=np.int64),
+            np.asarray(values, dtype=np.float32),
+        )
+
+    def _logits(self, num_rows: int, rows: np.ndarray, columns: np.ndarray, values: np.ndarray) -> np.ndarray:
+        logits = np.tile(self.bias, (num_rows, 1))
+        np.add.at(logits, rows, values[:, None] * self.weights[columns])
+        return logits
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """Label probabilities, one row per text"""
+        logits = self._logits(len(texts), *self.featurize(texts))
+        return _softmax(logits)
+
+    def fit(self, texts: Sequence[str], targets: np.ndarray, epochs: int = 5, learning_rate: float = 0.2,
+            batch_size: int = 256, seed: int = 42) -> List[float]:
+        """
+        Train on soft `targets` (rows of label probabilities) with minibatch SGD
+
+        Rows of `targets` that do not sum to 1 (multi-label teachers) are
+        normalized first. The learning rate decays linearly to zero.
+
+        Returns:
+            List[float]: Mean cross-entropy per epoch
+        """
+        targets = np.asarray(targets, dtype=np.float32)
+        targets = targets / np.maximum(targets.sum(axis=1, keepdims=True), 1e-12)
+        features = [self.featurize([text]) for text in texts]
+        rng = np.random.default_rng(seed)
+        total_steps = epochs * -(-len(texts) // batch_size)
+        step = 0
+        losses = []
+        for epoch in range(epochs):
+            order = rng.permutation(len(texts))
+            epoch_loss = 0.0
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                rows = np.concatenate([np.full(len(features[i][0]), row, dtype=np.int64) for row, i in enumerate(batch)])
+                columns = np.concatenate([features[i][1] for i in batch])
+                values = np.concatenate([features[i][2] for i in batch])
+
+                probabilities = _softmax(self._logits(len(batch), rows, columns, values))
+                batch_targets = targets[batch]
+                epoch_loss += float(-(batch_targets * np.log(np.maximum(probabilities, 1e-12))).sum())
+
+                rate = learning_rate * (1 - step / total_steps)
+                delta = probabilities - batch_targets
+                np.add.at(self.weights, columns, -rate * values[:, None] * delta[rows])
+                self.bias -= rate * delta.mean(axis=0)
+                step += 1
+            losses.append(epoch_loss / len(texts))
+            logger.info(f"Epoch {epoch + 1}/{epochs}: loss {losses[-1]:.4f}")
+        return losses
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the trained weights, for cache keys"""
+        digest = hashlib.sha256(self.weights.tobytes())
+        digest.update(self.bias.tobytes())
+        return digest.hexdigest()[:12]
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path,
+            weights=self.weights,
+            bias=self.bias,
+            labels=np.asarray(self.labels),
+            ngram_range=np.asarray(self.ngram_range),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "HashedNgramClassifier":
+        with np.load(path) as data:
+            classifier = cls(data["labels"].tolist(), data["weights"].shape[0], tuple(data["ngram_range"].tolist()))
+            classifier.weights = data["weights"]
+            classifier.bias = data["bias"]
+        return classifier
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class ModelCascade:
+    """
+    Routes texts between the first stage and the transformer
+
+    `route` answers the texts whose first-stage confidence reaches
+    `threshold` and returns None for the rest; callers score those with the
+    transformer and report the time through `record_escalated`. Counters
+    and per-tier latency are kept for `stats()`.
+    """
+
+    def __init__(self, first_stage: HashedNgramClassifier, threshold: float = 0.9):
+        self.first_stage = first_stage
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._texts = 0
+        self._escalated = 0
+        self._first_stage_seconds = 0.0
+        self._transformer_texts = 0
+        self._transformer_seconds = 0.0
+
+    @classmethod
+    def load(cls, path: str, threshold: float = 0.9) -> "ModelCascade":
+        return cls(HashedNgramClassifier.load(path), threshold)
+
+    @property
+    def engine_id(self) -> str:
+        """Suffix for result-cache fingerprints: cascaded scores differ from the transformer's"""
+        return f"+cascade-{self.first_stage.fingerprint}-{self.threshold:g}"
+
+    def route(self, texts: Sequence[str]) -> List[Optional[Dict[str, float]]]:
+        """First-stage scores (in label order) for confident texts, None for texts to escalate"""
+        if not texts:
+            return []
+        started = time.perf_counter()
+        probabilities = self.first_stage.predict_proba(texts)
+        labels = self.first_stage.labels
+        answers: List[Optional[Dict[str, float]]] = []
+        escalated = 0
+        for row in probabilities:
+            if row.max() >= self.threshold:
+                answers.append({label: float(score) for label, score in zip(labels, row)})
+            else:
+                answers.append(None)
+                escalated += 1
+        with self._lock:
+            self._texts += len(texts)
+            self._escalated += escalated
+            self._first_stage_seconds += time.perf_counter() - started
+        return answers
+
+    def record_escalated(self, count: int, seconds: float):
+        with self._lock:
+            self._transformer_texts += count
+            self._transformer_seconds += seconds
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "texts": self._texts,
+                "answered_first_stage": self._texts - self._escalated,
+                "escalated": self._escalated,
+                "escalation_rate": self._escalated / self._texts if self._texts else 0.0,
+                "first_stage_ms_per_text": self._first_stage_seconds / self._texts * 1000 if self._texts else 0.0,
+                "transformer_ms_per_text": (
+                    self._transformer_seconds / self._transformer_texts * 1000 if self._transformer_texts else 0.0
+                ),
+            }
+
+
+def tradeoff_curve(
+    first_stage_probabilities: np.ndarray,
+    transformer_predictions: List[str],
+    labels: List[str],
+    first_stage_seconds: float,
+    transformer_seconds: float,
+    gold: Optional[List[str]] = None,
+    thresholds: Sequence[float] = DEFAULT_THRESHOLDS,
+) -> List[Dict]:
+    """
+    Accuracy and throughput of the cascade at each threshold
+
+    Accuracy is against `gold` when given, otherwise agreement with the
+    transformer's top emotion. Throughput is estimated from the measured
+    per-text cost of each tier: every text pays for the first stage and
+    escalated texts also pay for the transformer.
+    """
+    count = len(transformer_predictions)
+    first_stage_predictions = np.asarray(labels)[first_stage_probabilities.argmax(axis=1)]
+    confidence = first_stage_probabilities.max(axis=1)
+    reference = np.asarray(gold if gold is not None else transformer_predictions)
+    first_stage_cost = first_stage_seconds / count
+    transformer_cost = transformer_seconds / count
+    curve = []
+    for threshold in thresholds:
+        answered = confidence >= threshold
+        predictions = np.where(answered, first_stage_predictions, np.asarray(transformer_predictions))
+        escalation_rate = float(1 - answered.mean())
+        seconds_per_text = first_stage_cost + escalation_rate * transformer_cost
+        curve.append({
+            "threshold": threshold,
+            "escalation_rate": escalation_rate,
+            "accuracy": float((predictions == reference).mean()),
+            "first_stage_accuracy": float((first_stage_predictions[answered] == reference[answered]).mean()) if answered.any() else None,
+            "texts_per_sec": 1 / seconds_per_text if seconds_per_text else 0.0,
+            "speedup": transformer_cost / seconds_per_text if seconds_per_text else 0.0,
+        })
+    return curve
+
+
+def _load_texts(path: str, text_column: str, label_column: Optional[str]) -> Tuple[List[str], Optional[List[str]]]:
+    from token_dataset import iter_records
+
+    records = [(text, label) for text, label in iter_records(path, text_column, label_column) if text.strip()]
+    texts = [text for text, _ in records]
+    labels = [label for _, label in records]
+    return texts, labels if label_column and all(label is not None for label in labels) else None
+
+
+def _transformer_scores(model_name: str, texts: List[str], batch_size: int) -> Tuple[np.ndarray, List[str], float]:
+    """Transformer score matrix in label order, plus the seconds it took"""
+    from analyzer_loader import load_emotion_analyzer
+
+    analyzer = load_emotion_analyzer()(model_name=model_name, batch_size=batch_size)
+    started = time.perf_counter()
+    scores = analyzer.score_texts(texts)
+    seconds = time.perf_counter() - started
+    matrix = np.asarray([[emotion_scores[label] for label in analyzer.labels] for emotion_scores in scores], dtype=np.float32)
+    return matrix, analyzer.labels, seconds
+
+
+def evaluate(first_stage: HashedNgramClassifier, texts: List[str], model_name: str, batch_size: int = 32,
+             gold: Optional[List[str]] = None, thresholds: Sequence[float] = DEFAULT_THRESHOLDS) -> Dict:
+    """Score `texts` with both tiers and report the trade-off curve"""
+    matrix, labels, transformer_seconds = _transformer_scores(model_name, texts, batch_size)
+    if labels != first_stage.labels:
+        raise ValueError(f"First stage labels {first_stage.labels} do not match the model's {labels}")
+    started = time.perf_counter()
+    probabilities = first_stage.predict_proba(texts)
+    first_stage_seconds = time.perf_counter() - started
+    transformer_predictions = [labels[i] for i in matrix.argmax(axis=1)]
+    return {
+        "samples": len(texts),
+        "reference": "gold" if gold is not None else "transformer",
+        "first_stage_ms_per_text": first_stage_seconds / len(texts) * 1000,
+        "transformer_ms_per_text": transformer_seconds / len(texts) * 1000,
+        "curve": tradeoff_curve(probabilities, transformer_predictions, labels, first_stage_seconds,
+                                transformer_seconds, gold, thresholds),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or evaluate the first stage of the emotion cascade")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = commands.add_parser("train", help="Fit the first stage on transformer scores")
+    train_parser.add_argument("--input", required=True, help="CSV or JSONL file of journal text")
+    train_parser.add_argument("--output", required=True, help="Where to save the first stage (.npz)")
+    train_parser.add_argument("--num-features", type=int, default=1 << 18)
+    train_parser.add_argument("--max-ngram", type=int, default=2)
+    train_parser.add_argument("--epochs", type=int, default=5)
+    train_parser.add_argument("--learning-rate", type=float, default=0.2)
+    train_parser.add_argument("--eval-fraction", type=float, default=0.1, help="Held out for the trade-off curve")
+
+    evaluate_parser = commands.add_parser("evaluate", help="Accuracy / throughput per threshold")
+    evaluate_parser.add_argument("--cascade", required=True, help="First stage saved by `train`")
+    evaluate_parser.add_argument("--input", required=True, help="Held-out CSV or JSONL file")
+    evaluate_parser.add_argument("--label-column", default="", help="Gold labels; agreement with the transformer otherwise")
+    evaluate_parser.add_argument("--thresholds", default=",".join(str(t) for t in DEFAULT_THRESHOLDS))
+
+    for command in (train_parser, evaluate_parser):
+        command.add_argument("--model", default="j-hartmann/emotion-english-distilroberta-base")
+        command.add_argument("--text-column", default="text")
+        command.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "train":
+        texts, _ = _load_texts(args.input, args.text_column, None)
+        order = np.random.default_rng(42).permutation(len(texts))
+        eval_size = int(len(texts) * args.eval_fraction)
+        eval_texts = [texts[i] for i in order[:eval_size]]
+        train_texts = [texts[i] for i in order[eval_size:]]
+
+        targets, labels, _ = _transformer_scores(args.model, train_texts, args.batch_size)
+        first_stage = HashedNgramClassifier(labels, args.num_features, (1, args.max_ngram))
+        started = time.perf_counter()
+        losses = first_stage.fit(train_texts, targets, epochs=args.epochs, learning_rate=args.learning_rate)
+        first_stage.save(args.output)
+        report = {
+            "train_samples": len(train_texts),
+            "train_seconds": round(time.perf_counter() - started, 3),
+            "losses": losses,
+            "output": args.output,
+        }
+        if eval_texts:
+            report["evaluation"] = evaluate(first_stage, eval_texts, args.model, args.batch_size)
+    else:
+        texts, gold = _load_texts(args.input, args.text_column, args.label_column or None)
+        thresholds = [float(t) for t in args.thresholds.split(",") if t.strip()]
+        report = evaluate(HashedNgramClassifier.load(args.cascade), texts, args.model, args.batch_size, gold, thresholds)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
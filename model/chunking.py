@@ -0,0 +1,136 @@
+# model/chunking.py
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Sentence boundaries: after terminal punctuation, or at line breaks
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_BREAK.split(text) if sentence and sentence.strip()]
+
+
+class WindowPlan:
+    """Windows a text is scored in, with the token count of each"""
+
+    def __init__(self, windows: List[str], tokens: List[int], total_tokens: int, truncated: bool):
+        self.windows = windows
+        self.tokens = tokens
+        self.total_tokens = total_tokens
+        self.truncated = truncated
+
+    def report(self) -> Dict:
+        return {
+            "windows": len(self.windows),
+            "tokens": self.total_tokens,
+            "truncated": self.truncated,
+        }
+
+
+class LongTextChunker:
+    """
+    Sentence-aware sliding windows for long journal entries.
+
+    Sentences are packed greedily into windows of at most `window_tokens`
+    tokens (special tokens included), and each window repeats the last
+    `overlap_sentences` sentences of the previous one for context. A
+    sentence longer than a window is split on token boundaries. Tokens past
+    `max_tokens` are dropped, which bounds the work one request can cause.
+    """
+
+    def __init__(self, tokenizer, window_tokens: int = 256, max_tokens: int = 2048, overlap_sentences: int = 1):
+        self.tokenizer = tokenizer
+        self.window_tokens = window_tokens
+        self.max_tokens = max_tokens
+        self.overlap_sentences = max(0, overlap_sentences)
+        special = tokenizer.num_special_tokens_to_add(pair=False) if hasattr(tokenizer, "num_special_tokens_to_add") else 2
+        self.budget = max(1, window_tokens - special)
+
+    def plan(self, text: str) -> WindowPlan:
+        """Split `text` into windows; a text that fits one window is left as is"""
+        sentences = split_sentences(text)
+        if not sentences:
+            return WindowPlan([text], [0], 0, False)
+        ids = self.tokenizer(sentences, add_special_tokens=False)["input_ids"]
+
+        # Apply the per-request token cap, then break up over-long sentences
+        pieces: List[str] = []
+        counts: List[int] = []
+        total, truncated = 0, False
+        for sentence, sentence_ids in zip(sentences, ids):
+            remaining = self.max_tokens - total
+            if remaining <= 0:
+                truncated = True
+                break
+            if len(sentence_ids) > remaining:
+                sentence_ids = sentence_ids[:remaining]
+                sentence = self.tokenizer.decode(sentence_ids, skip_special_tokens=True)
+                truncated = True
+            total += len(sentence_ids)
+            if len(sentence_ids) <= self.budget:
+                pieces.append(sentence)
+                counts.append(len(sentence_ids))
+                continue
+            for start in range(0, len(sentence_ids), self.budget):
+                chunk = sentence_ids[start:start + self.budget]
+                pieces.append(self.tokenizer.decode(chunk, skip_special_tokens=True))
+                counts.append(len(chunk))
+
+        if total <= self.budget and not truncated:
+            return WindowPlan([text], [total], total, False)
+
+        windows: List[str] = []
+        window_tokens: List[int] = []
+        current: List[int] = []
+        current_tokens = 0
+        for index, count in enumerate(counts):
+            if current and current_tokens + count > self.budget:
+                windows.append(" ".join(pieces[i] for i in current))
+                window_tokens.append(current_tokens)
+                # Carry the tail of the window over as context, if it leaves room
+                carry = current[-self.overlap_sentences:] if self.overlap_sentences else []
+                while carry and sum(counts[i] for i in carry) + count > self.budget:
+                    carry = carry[1:]
+                current, current_tokens = list(carry), sum(counts[i] for i in carry)
+            current.append(index)
+            current_tokens += count
+        if current:
+            windows.append(" ".join(pieces[i] for i in current))
+            window_tokens.append(current_tokens)
+        return WindowPlan(windows, window_tokens, total, truncated)
+
+
+def aggregate_window_scores(
+    window_scores: List[Dict[str, float]],
+    weights: Optional[List[float]] = None,
+    peak_weight: float = 0.25,
+    normalize: Optional[bool] = None,
+) -> Dict[str, float]:
+    """
+    Combine per-window `label -> score` dicts into one distribution
+
+    The result blends the token-length-weighted mean of the windows with the
+    per-label peak over windows (`peak_weight` of it), so one strongly
+    emotional passage is not averaged away by a long neutral entry. With
+    `normalize` (single-label models) the result sums to 1; by default it is
+    inferred from whether the window scores already do. Labels keep the
+    windows' order, which is label order like the pipeline output.
+    """
+    if len(window_scores) == 1:
+        return dict(window_scores[0])
+    labels = list(window_scores[0])
+    matrix = np.array([[scores.get(label, 0.0) for label in labels] for scores in window_scores], dtype=np.float64)
+    weights = np.asarray(weights if weights is not None else [1.0] * len(window_scores), dtype=np.float64)
+    if weights.sum() <= 0:
+        weights = np.ones(len(window_scores))
+
+    if normalize is None:
+        normalize = bool(np.allclose(matrix.sum(axis=1), 1.0, atol=1e-3))
+
+    mean = weights @ matrix / weights.sum()
+    combined = (1 - peak_weight) * mean + peak_weight * matrix.max(axis=0)
+    if normalize and combined.sum() > 0:
+        combined = combined / combined.sum()
+    return {label: float(score) for label, score in zip(labels, combined)}
@@ -0,0 +1,445 @@
+# model/distill.py
+"""
+Distil the emotion model into a small CPU student
+
+    python distill.py --input journals.jsonl --output-dir student --layers 4 --epochs 3
+
+The teacher (default `j-hartmann/emotion-english-distilroberta-base`) labels
+unlabeled journal text with soft scores once. A student with fewer layers,
+sharing the teacher's tokenizer and labels and by default its width, starts
+from the teacher's embeddings and a spread of its layers and is then trained
+on them. `--hidden-size` makes it narrower too, but then it starts from
+scratch. The student directory loads into `EmotionAnalyzer(model_name=...)`
+and the backend (`NEUS_EMOTION_MODEL`) like any other checkpoint, and the
+run ends with a teacher-vs-student report.
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import re
+import resource
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from analyzer_loader import load_emotion_analyzer
+from token_dataset import DynamicPaddingCollator, MemmapTokenDataset, is_tokenized, iter_records, tokenize_to_memmap
+
+logger = logging.getLogger(__name__)
+
+TEACHER_LOGITS_FILENAME = "teacher_logits.npy"
+TEACHER_META_FILENAME = "teacher.json"
+REPORT_FILENAME = "distillation_report.json"
+
+_LAYER_INDEX = re.compile(r"\.layer\.(\d+)\.")
+
+
+def student_config(teacher_config, num_layers: int = 4, hidden_size: Optional[int] = None,
+                   num_heads: Optional[int] = None, intermediate_size: Optional[int] = None):
+    """
+    The teacher's config with fewer layers; labels and vocabulary are kept
+
+    Width, heads and feed-forward size stay the teacher's unless given, so
+    `init_from_teacher` can copy its weights. A narrower `hidden_size`
+    defaults the feed-forward size to four times it.
+    """
+    config = copy.deepcopy(teacher_config)
+    config.num_hidden_layers = num_layers
+    # DistilBERT calls the feed-forward width `hidden_dim`
+    ffn_attribute = "intermediate_size" if hasattr(config, "intermediate_size") else "hidden_dim"
+    if hidden_size and hidden_size != config.hidden_size:
+        config.hidden_size = hidden_size
+        setattr(config, ffn_attribute, intermediate_size or 4 * hidden_size)
+    elif intermediate_size:
+        setattr(config, ffn_attribute, intermediate_size)
+    if num_heads:
+        config.num_attention_heads = num_heads
+    config._name_or_path = ""
+    return config
+
+
+def init_from_teacher(student, teacher) -> int:
+    """
+    Copy matching weights from the teacher into the student
+
+    Student layer `j` takes evenly spaced teacher layer `round(j * (T - 1) / (S - 1))`,
+    so the student starts from the teacher's embeddings, a spread of its
+    layers and its classifier. Only tensors of identical shape are copied,
+    which in practice means the student must keep the teacher's hidden size;
+    a narrower student copies nothing and starts from random weights.
+
+    Returns:
+        int: Number of tensors copied
+    """
+    teacher_layers = teacher.config.num_hidden_layers
+    student_layers = student.config.num_hidden_layers
+    spread = np.linspace(0, teacher_layers - 1, student_layers).round().astype(int) if student_layers > 1 else [0]
+    teacher_state = teacher.state_dict()
+    student_state = student.state_dict()
+    copied = 0
+    for name, tensor in student_state.items():
+        source = _LAYER_INDEX.sub(lambda m: f".layer.{spread[int(m.group(1))]}.", name)
+        if source in teacher_state and teacher_state[source].shape == tensor.shape:
+            student_state[name] = teacher_state[source].clone()
+            copied += 1
+    student.load_state_dict(student_state)
+    return copied
+
+
+def distillation_loss(student_logits, teacher_logits, temperature: float = 2.0, multi_label: bool = False):
+    """Soft-label loss at `temperature`, scaled by T² so gradients keep their size"""
+    import torch.nn.functional as F
+
+    student_logits = student_logits / temperature
+    teacher_logits = teacher_logits / temperature
+    if multi_label:
+        loss = F.binary_cross_entropy_with_logits(student_logits, teacher_logits.sigmoid())
+    else:
+        loss = F.kl_div(F.log_softmax(student_logits, dim=-1), F.softmax(teacher_logits, dim=-1), reduction="batchmean")
+    return loss * temperature ** 2
+
+
+def compute_teacher_logits(teacher, dataset: MemmapTokenDataset, output_dir: str, teacher_name: str,
+                           batch_size: int = 64) -> np.ndarray:
+    """
+    Teacher logits for every sample, computed once and kept next to the tokens
+
+    Samples are scored in length order so each batch pads to a similar
+    length. The result is memory-mapped rather than loaded.
+    """
+    import torch
+
+    logits_path = os.path.join(output_dir, TEACHER_LOGITS_FILENAME)
+    meta_path = os.path.join(output_dir, TEACHER_META_FILENAME)
+    # Tied to the exact tokens: a re-tokenized corpus (new source or
+    # max_length) can keep its row count but not its logits
+    meta = {
+        "teacher": teacher_name,
+        "num_samples": len(dataset),
+        "tokens": {key: dataset.meta.get(key) for key in ("source", "tokenizer", "max_length", "num_tokens")},
+    }
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            cached = json.load(f)
+        if cached == meta:
+            return np.load(logits_path, mmap_mode="r")
+        # The meta file marks complete logits, so drop it before rewriting them
+        os.remove(meta_path)
+
+    collator = DynamicPaddingCollator(dataset.pad_token_id)
+    logits = np.lib.format.open_memmap(logits_path, mode="w+", dtype=np.float32,
+                                       shape=(len(dataset), teacher.config.num_labels))
+    order = np.argsort(dataset.lengths, kind="stable")
+    started = time.perf_counter()
+    teacher.eval()
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            batch = collator([dataset[int(i)] for i in indices])
+            batch.pop("labels", None)
+            logits[indices] = teacher(**batch).logits.float().numpy()
+            if start // batch_size % 100 == 0:
+                logger.info(f"Teacher scored {min(start + batch_size, len(order))}/{len(order)} samples")
+    logits.flush()
+    logger.info(f"Teacher labels computed in {time.perf_counter() - started:.1f}s")
+
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    return np.load(logits_path, mmap_mode="r")
+
+
+class DistillationDataset:
+    """Token samples of `indices` paired with their teacher logits"""
+
+    def __init__(self, tokens: MemmapTokenDataset, teacher_logits: np.ndarray, indices: np.ndarray):
+        self.tokens = tokens
+        self.teacher_logits = teacher_logits
+        self.indices = indices
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return self.tokens.lengths[self.indices]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        sample = int(self.indices[idx])
+        return {
+            "input_ids": self.tokens[sample]["input_ids"],
+            "teacher_logits": np.asarray(self.teacher_logits[sample], dtype=np.float32),
+        }
+
+
+class DistillationCollator(DynamicPaddingCollator):
+    """Dynamic padding plus the stacked teacher logits"""
+
+    def __call__(self, features: List[Dict]) -> Dict:
+        import torch
+
+        batch = super().__call__(features)
+        batch["teacher_logits"] = torch.from_numpy(np.stack([feature["teacher_logits"] for feature in features]))
+        return batch
+
+
+def macro_f1(predicted: List[str], reference: List[str]) -> float:
+    """Unweighted mean F1 over the labels present in either list"""
+    predicted = np.asarray(predicted)
+    reference = np.asarray(reference)
+    scores = []
+    for label in np.union1d(predicted, reference):
+        true_positive = np.sum((predicted == label) & (reference == label))
+        precision_denominator = np.sum(predicted == label)
+        recall_denominator = np.sum(reference == label)
+        if true_positive == 0:
+            scores.append(0.0)
+            continue
+        precision = true_positive / precision_denominator
+        recall = true_positive / recall_denominator
+        scores.append(float(2 * precision * recall / (precision + recall)))
+    return float(np.mean(scores)) if scores else 0.0
+
+
+def profile_analyzer(model_name: str, texts: List[str], batch_size: int = 32, latency_samples: int = 200) -> Dict:
+    """
+    Load `model_name` into `EmotionAnalyzer` and measure it on `texts`
+
+    Returns the top emotion per text, single-text latency percentiles,
+    batched throughput and the model's size.
+    """
+    EmotionAnalyzer = load_emotion_analyzer()
+    analyzer = EmotionAnalyzer(model_name=model_name, batch_size=batch_size)
+
+    started = time.perf_counter()
+    scores = analyzer.score_texts(texts)
+    batch_seconds = time.perf_counter() - started
+
+    sample = texts[:latency_samples]
+    analyzer.analyze_emotion(sample[0])
+    latencies = []
+    for text in sample:
+        started = time.perf_counter()
+        analyzer.analyze_emotion(text)
+        latencies.append(time.perf_counter() - started)
+
+    parameters = list(analyzer.model.parameters())
+    return {
+        "predictions": [max(emotion_scores, key=emotion_scores.get) for emotion_scores in scores],
+        "report": {
+            "parameters": sum(p.numel() for p in parameters),
+            "weights_mb": sum(p.numel() * p.element_size() for p in parameters) / 2 ** 20,
+            "latency_p50_ms": float(np.percentile(latencies, 50)) * 1000,
+            "latency_p95_ms": float(np.percentile(latencies, 95)) * 1000,
+            "batch_texts_per_sec": len(texts) / batch_seconds if batch_seconds else 0.0,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        },
+    }
+
+
+def compare_models(teacher_name: str, student_dir: str, texts: List[str], gold: Optional[List[str]] = None,
+                   batch_size: int = 32, latency_samples: int = 200) -> Dict:
+    """
+    Teacher-vs-student agreement, macro-F1, latency and memory on `texts`
+
+    Macro-F1 is measured against the teacher's top emotion, and against
+    `gold` labels when given. Peak RSS is cumulative for the process, so the
+    student is profiled first.
+    """
+    student = profile_analyzer(student_dir, texts, batch_size, latency_samples)
+    teacher = profile_analyzer(teacher_name, texts, batch_size, latency_samples)
+    agreement = float(np.mean(np.asarray(student["predictions"]) == np.asarray(teacher["predictions"])))
+    report = {
+        "eval_samples": len(texts),
+        "agreement": agreement,
+        "student_macro_f1_vs_teacher": macro_f1(student["predictions"], teacher["predictions"]),
+        "teacher": teacher["report"],
+        "student": student["report"],
+    }
+    if gold is not None:
+        report["teacher"]["macro_f1"] = macro_f1(teacher["predictions"], gold)
+        report["student"]["macro_f1"] = macro_f1(student["predictions"], gold)
+    report["speedup_p50"] = report["teacher"]["latency_p50_ms"] / max(report["student"]["latency_p50_ms"], 1e-9)
+    report["size_ratio"] = report["student"]["parameters"] / report["teacher"]["parameters"]
+    return report
+
+
+def distill_model(
+    training_data_path: str,
+    output_model_path: str,
+    teacher_name: str = "j-hartmann/emotion-english-distilroberta-base",
+    text_column: str = "text",
+    num_layers: int = 4,
+    hidden_size: Optional[int] = None,
+    num_heads: Optional[int] = None,
+    temperature: float = 2.0,
+    epochs: int = 3,
+    batch_size: int = 32,
+    learning_rate: float = 3e-4,
+    max_length: int = 512,
+    eval_fraction: float = 0.05,
+    max_eval_samples: int = 2000,
+    eval_data_path: Optional[str] = None,
+    eval_label_column: str = "emotion",
+    tokenized_dir: Optional[str] = None,
+    seed: int = 42,
+) -> Dict:
+    """
+    Train a small student on the teacher's soft labels for unlabeled text
+
+    The corpus is tokenized once with the teacher's tokenizer (reused while
+    the source is unchanged) and the teacher's logits are cached beside it.
+    A held-out slice of the corpus, or `eval_data_path` when given, is used
+    for the final comparison.
+
+    Returns:
+        Dict: Training and teacher-vs-student report (also saved as
+        `distillation_report.json` in the output directory)
+    """
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer, Trainer, TrainingArguments
+    from transformers.trainer_pt_utils import LengthGroupedSampler
+
+    tokenizer = AutoTokenizer.from_pretrained(teacher_name)
+    teacher = AutoModelForSequenceClassification.from_pretrained(teacher_name)
+    multi_label = teacher.config.problem_type == "multi_label_classification"
+
+    tokenized_dir = tokenized_dir or os.path.join(output_model_path, "tokenized")
+    if not is_tokenized(tokenized_dir, training_data_path, tokenizer.name_or_path, max_length):
+        tokenize_to_memmap(training_data_path, tokenizer, tokenized_dir, text_column=text_column,
+                           label_column=None, max_length=max_length)
+    tokens = MemmapTokenDataset(tokenized_dir)
+    teacher_logits = compute_teacher_logits(teacher, tokens, tokenized_dir, teacher_name)
+
+    indices = np.random.default_rng(seed).permutation(len(tokens))
+    eval_size = 0 if eval_data_path else min(max_eval_samples, int(len(tokens) * eval_fraction))
+    eval_indices, train_indices = np.sort(indices[:eval_size]), indices[eval_size:]
+    train_dataset = DistillationDataset(tokens, teacher_logits, train_indices)
+
+    config = student_config(teacher.config, num_layers, hidden_size, num_heads)
+    student = AutoModelForSequenceClassification.from_config(config)
+    copied = init_from_teacher(student, teacher)
+    if not copied:
+        logger.warning("No teacher tensor matches the student's shapes; the student starts from random weights")
+    logger.info(f"Student: {sum(p.numel() for p in student.parameters())} parameters, "
+                f"{copied} tensors initialised from the teacher")
+    del teacher
+
+    class DistillationTrainer(Trainer):
+        """Soft-label loss, with batches grouped by the precomputed lengths"""
+
+        def _get_train_sampler(self):
+            return LengthGroupedSampler(
+                self.args.train_batch_size * self.args.gradient_accumulation_steps,
+                lengths=self.train_dataset.lengths.tolist()
+            )
+
+        def compute_loss(self, model, inputs, return_outputs=False):
+            targets = inputs.pop("teacher_logits")
+            outputs = model(**inputs)
+            loss = distillation_loss(outputs.logits, targets, temperature, multi_label)
+            return (loss, outputs) if return_outputs else loss
+
+    training_args = TrainingArguments(
+        output_dir=output_model_path,
+        num_train_epochs=epochs,
+        per_device_train_batch_size=batch_size,
+        learning_rate=learning_rate,
+        warmup_ratio=0.06,
+        weight_decay=0.01,
+        logging_dir='./logs',
+        logging_steps=50,
+        save_strategy="no",
+        remove_unused_columns=False,
+        report_to=[],
+        seed=seed,
+    )
+    trainer = DistillationTrainer(
+        model=student,
+        args=training_args,
+        train_dataset=train_dataset,
+        data_collator=DistillationCollator(tokenizer.pad_token_id),
+    )
+    started = time.perf_counter()
+    train_output = trainer.train()
+    train_seconds = time.perf_counter() - started
+
+    student.save_pretrained(output_model_path)
+    tokenizer.save_pretrained(output_model_path)
+    logger.info(f"Student saved to {output_model_path}")
+    del trainer, student
+
+    if eval_data_path:
+        records = list(iter_records(eval_data_path, text_column, eval_label_column))
+        texts = [text for text, _ in records]
+        gold = [label for _, label in records] if all(label is not None for _, label in records) else None
+    else:
+        wanted = set(eval_indices.tolist())
+        texts = [text for i, (text, _) in enumerate(iter_records(training_data_path, text_column, None)) if i in wanted]
+        gold = None
+
+    report = {
+        "teacher_model": teacher_name,
+        "student_model": output_model_path,
+        "student_config": {"layers": config.num_hidden_layers, "hidden_size": config.hidden_size,
+                           "heads": config.num_attention_heads},
+        "tensors_from_teacher": copied,
+        "temperature": temperature,
+        "train_samples": len(train_dataset),
+        "train_seconds": round(train_seconds, 1),
+        "train_loss": train_output.training_loss,
+    }
+    if texts:
+        report.update(compare_models(teacher_name, output_model_path, texts, gold, batch_size))
+    with open(os.path.join(output_model_path, REPORT_FILENAME), "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Distillation report: {report}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distil the emotion model into a small student")
+    parser.add_argument("--input", required=True, help="CSV or JSONL file of unlabeled journal text")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--teacher", default="j-hartmann/emotion-english-distilroberta-base")
+    parser.add_argument("--text-column", default="text")
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--hidden-size", type=int, default=None,
+                        help="Default: the teacher's. A narrower student starts from scratch")
+    parser.add_argument("--heads", type=int, default=None, help="Default: the teacher's")
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=3e-4)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--eval-fraction", type=float, default=0.05, help="Held-out share of --input for the report")
+    parser.add_argument("--eval-data", default=None, help="Labeled CSV/JSONL to report on instead")
+    parser.add_argument("--eval-label-column", default="emotion")
+    parser.add_argument("--tokenized-dir", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = distill_model(
+        args.input,
+        args.output_dir,
+        teacher_name=args.teacher,
+        text_column=args.text_column,
+        num_layers=args.layers,
+        hidden_size=args.hidden_size,
+        num_heads=args.heads,
+        temperature=args.temperature,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        learning_rate=args.learning_rate,
+        max_length=args.max_length,
+        eval_fraction=args.eval_fraction,
+        eval_data_path=args.eval_data,
+        eval_label_column=args.eval_label_column,
+        tokenized_dir=args.tokenized_dir,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
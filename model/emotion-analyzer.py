@@ -3,9 +3,21 @@ import torch
 from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import pickle
 import logging
+import os
+import time
+
+from cascade import ModelCascade
+from chunking import LongTextChunker, aggregate_window_scores
+from onnx_engine import OnnxEmotionEngine
+from registry import ModelRegistry, is_mmap_loadable, load_mmap_model
+from result_cache import EmotionResultCache, model_fingerprint
+from postprocess import (
+    BALANCED_INSIGHT, DEFAULT_INSIGHT, DOMINANT_INSIGHTS, MIXED_INSIGHT,
+    EmotionPostprocessor, mood_category, sentiment_score
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -17,8 +29,53 @@ class EmotionAnalyzer:
     Uses DistilBERT fine-tuned on GoEmotions dataset
     """
     
-    def __init__(self, model_name: str = "j-hartmann/emotion-english-distilroberta-base"):
+    def __init__(
+        self,
+        model_name: str = "j-hartmann/emotion-english-distilroberta-base",
+        engine: str = "torch",
+        onnx_dir: Optional[str] = None,
+        quantized: bool = True,
+        cache_size: int = 0,
+        cache_ttl: float = 24 * 3600,
+        cache_path: Optional[str] = None,
+        batch_size: int = 32,
+        max_length: int = 512,
+        long_text: bool = False,
+        window_tokens: int = 256,
+        max_request_tokens: int = 2048,
+        cascade_path: Optional[str] = None,
+        cascade_threshold: float = 0.9
+    ):
         self.model_name = model_name
+        self.engine = engine
+        self.onnx_dir = onnx_dir
+        self.quantized = quantized
+        self.batch_size = batch_size
+        self.max_length = max_length
+        # Long-text mode: score sentence-aware windows instead of truncating
+        self.long_text = long_text
+        self.window_tokens = window_tokens
+        self.max_request_tokens = max_request_tokens
+        self.chunker: Optional[LongTextChunker] = None
+        self.labels: List[str] = []
+        self.postprocessor: Optional[EmotionPostprocessor] = None
+        # Cascade mode: a hashed n-gram first stage answers confident texts
+        self.cascade = ModelCascade.load(cascade_path, cascade_threshold) if cascade_path else None
+        self.cache = None
+        if cache_size > 0:
+            engine_id = ("onnx-int8" if quantized else "onnx-fp32") if engine == "onnx" else engine
+            if long_text:
+                # Windowed scores differ from truncated ones for long texts
+                engine_id += f"+windows-{window_tokens}-{max_request_tokens}"
+            if self.cascade:
+                engine_id += self.cascade.engine_id
+            fingerprint = model_fingerprint(onnx_dir or model_name if engine == "onnx" else model_name, engine_id)
+            self.cache = EmotionResultCache(
+                fingerprint,
+                max_entries=cache_size,
+                ttl_seconds=cache_ttl,
+                disk_path=cache_path
+            )
         self.tokenizer = None
         self.model = None
         self.pipeline = None
@@ -59,11 +116,28 @@ class EmotionAnalyzer:
     def load_model(self):
         """Load the pre-trained emotion analysis model"""
         try:
+            if self.engine == "onnx":
+                # ONNX Runtime path: pipeline-compatible, no torch model in memory
+                self.pipeline = OnnxEmotionEngine(self.onnx_dir or self.model_name, quantized=self.quantized)
+                self.tokenizer = self.pipeline.tokenizer
+                self.labels = list(self.pipeline.labels)
+                self._create_chunker()
+                logger.info("ONNX emotion model loaded successfully")
+                return
+            
             logger.info(f"Loading emotion model: {self.model_name}")
             
             # Load tokenizer and model
             self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
+            if is_mmap_loadable(self.model_name):
+                # Local safetensors checkpoint: map the weights instead of copying them
+                self.model = load_mmap_model(self.model_name)
+            else:
+                self.model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
+            self.model.eval()
+            config = self.model.config
+            self.labels = [config.id2label[i] for i in range(config.num_labels)]
+            self._create_chunker()
             
             # Create pipeline
             self.pipeline = pipeline(
@@ -79,6 +153,31 @@ class EmotionAnalyzer:
             logger.error(f"Error loading emotion model: {e}")
             raise
     
+    @classmethod
+    def from_registry(cls, root: str, version: Optional[str] = None, **kwargs) -> "EmotionAnalyzer":
+        """Analyzer for a registry version (the active one by default)"""
+        registry = ModelRegistry(root)
+        version = version or registry.active_version()
+        if version is None:
+            raise ValueError(f"No model versions in {root}")
+        return cls(model_name=registry.path(version), **kwargs)
+    
+    def _create_chunker(self):
+        if self.long_text:
+            self.chunker = LongTextChunker(
+                self.tokenizer,
+                window_tokens=min(self.window_tokens, self.max_length),
+                max_tokens=self.max_request_tokens
+            )
+    
+    @property
+    def multi_label(self) -> bool:
+        """True when labels are scored independently (sigmoid) rather than as one distribution"""
+        if self.engine == "onnx":
+            return self.pipeline.multi_label
+        config = self.model.config
+        return config.problem_type == "multi_label_classification" or config.num_labels == 1
+    
     def analyze_emotion(self, text: str) -> Dict:
         """
         Analyze emotion in text and return comprehensive results
@@ -90,39 +189,7 @@ class EmotionAnalyzer:
             Dict: Emotion analysis results
         """
         try:
-            # Get emotion predictions
-            emotions = self.pipeline(text)
-            
-            # Process results
-            emotion_scores = {}
-            dominant_emotion = None
-            max_score = 0
-            
-            for emotion in emotions:
-                emotion_name = emotion['label']
-                score = emotion['score']
-                emotion_scores[emotion_name] = score
-                
-                if score > max_score:
-                    max_score = score
-                    dominant_emotion = emotion_name
-            
-            # Calculate sentiment polarity
-            sentiment_score = self._calculate_sentiment_score(emotion_scores)
-            mood_category = self._determine_mood_category(emotion_scores, sentiment_score)
-            
-            # Generate insights
-            insights = self._generate_insights(emotion_scores, dominant_emotion, sentiment_score)
-            
-            return {
-                'dominant_emotion': dominant_emotion,
-                'confidence': max_score,
-                'emotion_scores': emotion_scores,
-                'sentiment_score': sentiment_score,
-                'mood_category': mood_category,
-                'insights': insights,
-                'text_length': len(text.split())
-            }
+            return self._build_results([text], self.score_texts([text]))[0]
             
         except Exception as e:
             logger.error(f"Error analyzing emotion: {e}")
@@ -135,61 +202,206 @@ class EmotionAnalyzer:
                 'mood_category': 'neutral'
             }
     
-    def _calculate_sentiment_score(self, emotion_scores: Dict) -> float:
-        """Calculate overall sentiment score from emotion scores"""
-        positive_emotions = ['joy', 'optimism', 'love', 'excitement', 'amusement', 'approval', 'caring', 'gratitude']
-        negative_emotions = ['sadness', 'disappointment', 'anger', 'annoyance', 'grief', 'fear', 'disgust']
+    def score_texts(self, texts: List[str], batch_size: Optional[int] = None) -> List[Dict[str, float]]:
+        """
+        Emotion scores for each text (in label order), served from the cache when possible
+        
+        The raw distributions `batch_analyze` builds its results from, for
+        callers that need only the scores (distillation, benchmarks).
+        
+        In long-text mode each text is split into sentence-aware windows
+        (capped at `max_request_tokens` in total), the windows of all texts
+        are scored together and each text's window scores are aggregated
+        into one distribution. In cascade mode only the texts the first stage
+        is not confident about reach the transformer.
+        """
+        results: List[Optional[Dict[str, float]]] = [None] * len(texts)
+        pending = []
+        for index, text in enumerate(texts):
+            cached = self.cache.get(text) if self.cache else None
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append(index)
+        if self.cascade and pending:
+            answers = self.cascade.route([texts[index] for index in pending])
+            for index, emotion_scores in zip(pending, answers):
+                if emotion_scores is not None:
+                    results[index] = emotion_scores
+                    if self.cache:
+                        self.cache.put(texts[index], emotion_scores)
+            pending = [index for index, emotion_scores in zip(pending, answers) if emotion_scores is None]
+        if not pending:
+            return results
+        
+        started = time.perf_counter()
+        if self.chunker is None:
+            scored = self._score_batches([texts[index] for index in pending], batch_size)
+        else:
+            plans = [self.chunker.plan(texts[index]) for index in pending]
+            window_scores = self._score_batches([window for plan in plans for window in plan.windows], batch_size)
+            scored = []
+            offset = 0
+            for plan in plans:
+                windows = window_scores[offset:offset + len(plan.windows)]
+                offset += len(plan.windows)
+                scored.append(aggregate_window_scores(windows, plan.tokens, normalize=not self.multi_label))
+        if self.cascade:
+            self.cascade.record_escalated(len(pending), time.perf_counter() - started)
+        
+        for index, emotion_scores in zip(pending, scored):
+            results[index] = emotion_scores
+            if self.cache:
+                self.cache.put(texts[index], emotion_scores)
+        return results
+    
+    def _score_batches(self, texts: List[str], batch_size: Optional[int] = None) -> List[Dict[str, float]]:
+        """
+        Emotion scores via length-bucketed batched inference
+        
+        Texts are tokenized once, sorted by token length so each batch pads
+        to a similar length, run `batch_size` at a time and returned in the
+        original order.
+        """
+        results: List[Optional[Dict[str, float]]] = [None] * len(texts)
+        encoding = self.tokenizer(
+            texts,
+            truncation=True,
+            max_length=self.max_length
+        )
+        input_ids = encoding['input_ids']
+        order = sorted(range(len(texts)), key=lambda i: len(input_ids[i]))
+        
+        batch_size = batch_size or self.batch_size
+        for start in range(0, len(order), batch_size):
+            chunk = order[start:start + batch_size]
+            features = [{name: encoding[name][i] for name in encoding.keys()} for i in chunk]
+            probabilities = self._forward(self.tokenizer.pad(features, padding=True, return_tensors='np'))
+            
+            for i, row in zip(chunk, probabilities):
+                # Label order, the same as the pipeline output
+                results[i] = {label: float(score) for label, score in zip(self.labels, row)}
+        
+        return results
+    
+    def _forward(self, batch) -> np.ndarray:
+        """Label probabilities for one padded batch"""
+        if self.engine == "onnx":
+            return self.pipeline.score_encoded(batch)
+        
+        with torch.inference_mode():
+            inputs = {name: torch.from_numpy(np.asarray(values)) for name, values in batch.items()}
+            logits = self.model(**inputs).logits.float()
         
-        positive_score = sum(emotion_scores.get(emotion, 0) for emotion in positive_emotions)
-        negative_score = sum(emotion_scores.get(emotion, 0) for emotion in negative_emotions)
+        if self.multi_label:
+            return torch.sigmoid(logits).numpy()
+        return torch.softmax(logits, dim=-1).numpy()
+    
+    def _build_result(self, text: str, emotion_scores: Dict[str, float]) -> Dict:
+        """Post-process one text's emotion scores into the full analysis"""
+        dominant_emotion = None
+        max_score = 0
+        
+        for emotion_name, score in emotion_scores.items():
+            if score > max_score:
+                max_score = score
+                dominant_emotion = emotion_name
+        
+        # Calculate sentiment polarity
+        sentiment_score = self._calculate_sentiment_score(emotion_scores)
+        mood_category = self._determine_mood_category(emotion_scores, sentiment_score)
         
-        # Normalize to [-1, 1] range
-        total_score = positive_score + negative_score
-        if total_score == 0:
-            return 0.0
+        # Generate insights
+        insights = self._generate_insights(emotion_scores, dominant_emotion, sentiment_score)
         
-        return (positive_score - negative_score) / total_score
+        return {
+            'dominant_emotion': dominant_emotion,
+            'confidence': max_score,
+            'emotion_scores': emotion_scores,
+            'sentiment_score': sentiment_score,
+            'mood_category': mood_category,
+            'insights': insights,
+            'text_length': len(text.split())
+        }
+    
+    def _build_results(self, texts: List[str], score_batch: List[Dict[str, float]]) -> List[Dict]:
+        """Post-process a whole batch of emotion scores in one vectorized pass"""
+        if not self.labels:
+            return [self._build_result(text, emotion_scores) for text, emotion_scores in zip(texts, score_batch)]
+        if self.postprocessor is None or self.postprocessor.labels != self.labels:
+            self.postprocessor = EmotionPostprocessor(self.labels)
+        
+        processed = self.postprocessor.process(self.postprocessor.to_matrix(score_batch))
+        results = []
+        for text, emotion_scores, result in zip(texts, score_batch, processed):
+            results.append({
+                'dominant_emotion': result['dominant_emotion'],
+                'confidence': result['confidence'],
+                'emotion_scores': emotion_scores,
+                'sentiment_score': result['sentiment_score'],
+                'mood_category': result['mood_category'],
+                'insights': result['insights'],
+                'text_length': len(text.split())
+            })
+        return results
+    
+    def _calculate_sentiment_score(self, emotion_scores: Dict) -> float:
+        """Calculate overall sentiment score from emotion scores"""
+        return sentiment_score(emotion_scores)
     
     def _determine_mood_category(self, emotion_scores: Dict, sentiment_score: float) -> str:
         """Determine mood category based on emotion analysis"""
-        if sentiment_score > 0.3:
-            return 'excellent' if sentiment_score > 0.6 else 'good'
-        elif sentiment_score > -0.3:
-            return 'okay'
-        else:
-            return 'difficult' if sentiment_score < -0.6 else 'struggling'
+        return mood_category(sentiment_score)
     
     def _generate_insights(self, emotion_scores: Dict, dominant_emotion: str, sentiment_score: float) -> List[str]:
         """Generate insights based on emotion analysis"""
         insights = []
         
         # Insight based on dominant emotion
-        if dominant_emotion in ['joy', 'optimism', 'love']:
-            insights.append("You're experiencing positive emotions. This is a great time to engage in activities you enjoy.")
-        elif dominant_emotion in ['sadness', 'disappointment', 'grief']:
-            insights.append("It seems you're going through a difficult time. Consider reaching out to someone you trust.")
-        elif dominant_emotion in ['anger', 'annoyance']:
-            insights.append("You might be feeling frustrated. Try some calming techniques like deep breathing.")
-        elif dominant_emotion in ['fear', 'nervousness']:
-            insights.append("Anxiety might be affecting you. Grounding techniques could help you feel more centered.")
+        for emotions, insight in DOMINANT_INSIGHTS:
+            if dominant_emotion in emotions:
+                insights.append(insight)
+                break
         
         # Insight based on sentiment score
         if abs(sentiment_score) < 0.2:
-            insights.append("Your emotions seem balanced today. This is a good time for reflection and planning.")
+            insights.append(BALANCED_INSIGHT)
         
         # Insight based on emotion diversity
         num_significant_emotions = sum(1 for score in emotion_scores.values() if score > 0.1)
         if num_significant_emotions > 5:
-            insights.append("You're experiencing a mix of emotions. This is completely normal and human.")
+            insights.append(MIXED_INSIGHT)
         
-        return insights if insights else ["Every feeling is valid. Take time to acknowledge what you're experiencing."]
+        return insights if insights else [DEFAULT_INSIGHT]
     
-    def batch_analyze(self, texts: List[str]) -> List[Dict]:
-        """Analyze multiple texts at once"""
-        return [self.analyze_emotion(text) for text in texts]
+    def batch_analyze(self, texts: List[str], batch_size: Optional[int] = None) -> List[Dict]:
+        """
+        Analyze multiple texts at once
+        
+        Args:
+            texts (List[str]): Input texts to analyze
+            batch_size (int, optional): Texts per forward pass, defaults to `self.batch_size`
+            
+        Returns:
+            List[Dict]: Emotion analysis results, in the same order as `texts`
+        """
+        if not texts:
+            return []
+        
+        try:
+            return self._build_results(texts, self.score_texts(texts, batch_size))
+        except Exception as e:
+            # Fall back to per-text analysis so one bad input only fails itself
+            logger.error(f"Batched analysis failed, retrying texts individually: {e}")
+            return [self.analyze_emotion(text) for text in texts]
     
     def get_mood_trend(self, analyses: List[Dict]) -> Dict:
-        """Analyze mood trend over time"""
+        """
+        Analyze mood trend over time
+        
+        Batch reference for `mood_trend.OnlineMoodTrend`, which produces the
+        same summary incrementally.
+        """
         if not analyses:
             return {'trend': 'neutral', 'average_sentiment': 0.0}
         
@@ -216,61 +428,65 @@ class EmotionAnalyzer:
         }
 
 # Fine-tuning script
-def fine_tune_model(training_data_path: str, output_model_path: str):
+def fine_tune_model(
+    training_data_path: str,
+    output_model_path: str,
+    text_column: str = 'text',
+    label_column: str = 'emotion',
+    max_length: int = 512,
+    tokenized_dir: Optional[str] = None
+):
     """
     Fine-tune the emotion model on custom mental health data
     
+    The corpus is tokenized once into memory-mapped files (reused on later
+    runs while the source file is unchanged), then trained with dynamic
+    per-batch padding and length-grouped batches.
+    
     Args:
-        training_data_path (str): Path to CSV file with 'text' and 'emotion' columns
+        training_data_path (str): Path to CSV or JSONL file with 'text' and 'emotion' columns
         output_model_path (str): Path to save the fine-tuned model
+        text_column (str): Column holding the journal text
+        label_column (str): Column holding the emotion label
+        max_length (int): Token cap per sample
+        tokenized_dir (str, optional): Where to keep the tokenized corpus
     """
     from transformers import TrainingArguments, Trainer
-    from torch.utils.data import Dataset
+    from transformers.trainer_pt_utils import LengthGroupedSampler
+    from token_dataset import DynamicPaddingCollator, MemmapTokenDataset, is_tokenized, tokenize_to_memmap
     
-    class EmotionDataset(Dataset):
-        def __init__(self, texts, labels, tokenizer, max_length=512):
-            self.texts = texts
-            self.labels = labels
-            self.tokenizer = tokenizer
-            self.max_length = max_length
-        
-        def __len__(self):
-            return len(self.texts)
+    class LengthGroupedTrainer(Trainer):
+        """Trainer that groups by the precomputed lengths instead of scanning the dataset"""
         
-        def __getitem__(self, idx):
-            text = str(self.texts[idx])
-            label = self.labels[idx]
-            
-            encoding = self.tokenizer(
-                text,
-                truncation=True,
-                padding='max_length',
-                max_length=self.max_length,
-                return_tensors='pt'
+        def _get_train_sampler(self):
+            return LengthGroupedSampler(
+                self.args.train_batch_size * self.args.gradient_accumulation_steps,
+                lengths=self.train_dataset.lengths.tolist()
             )
-            
-            return {
-                'input_ids': encoding['input_ids'].flatten(),
-                'attention_mask': encoding['attention_mask'].flatten(),
-                'labels': torch.tensor(label, dtype=torch.long)
-            }
-    
-    # Load training data
-    df = pd.read_csv(training_data_path)
     
-    # Initialize model and tokenizer
+    # Initialize tokenizer
     model_name = "distilbert-base-uncased"
     tokenizer = AutoTokenizer.from_pretrained(model_name)
+    
+    # Tokenize training data once
+    tokenized_dir = tokenized_dir or os.path.join(output_model_path, "tokenized")
+    if not is_tokenized(tokenized_dir, training_data_path, tokenizer.name_or_path, max_length):
+        tokenize_to_memmap(
+            training_data_path,
+            tokenizer,
+            tokenized_dir,
+            text_column=text_column,
+            label_column=label_column,
+            max_length=max_length
+        )
+    train_dataset = MemmapTokenDataset(tokenized_dir)
+    
+    # Initialize model
     model = AutoModelForSequenceClassification.from_pretrained(
         model_name, 
-        num_labels=len(df['emotion'].unique())
-    )
-    
-    # Create dataset
-    train_dataset = EmotionDataset(
-        df['text'].tolist(),
-        df['emotion'].factorize()[0].tolist(),
-        tokenizer
+        num_labels=len(train_dataset.label_names),
+        id2label=dict(enumerate(train_dataset.label_names)),
+        label2id={label: i for i, label in enumerate(train_dataset.label_names)}
     )
     
     # Training arguments
@@ -284,15 +500,15 @@ def fine_tune_model(training_data_path: str, output_model_path: str):
         logging_dir='./logs',
         logging_steps=10,
         save_steps=1000,
-        evaluation_strategy="steps",
-        eval_steps=1000,
+        group_by_length=True,
     )
     
     # Initialize trainer
-    trainer = Trainer(
+    trainer = LengthGroupedTrainer(
         model=model,
         args=training_args,
         train_dataset=train_dataset,
+        data_collator=DynamicPaddingCollator(tokenizer.pad_token_id),
         tokenizer=tokenizer,
     )
     
@@ -0,0 +1,249 @@
+# model/mood_trend.py
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Slope (sentiment per entry) beyond which a trend counts as moving
+TREND_THRESHOLD = 0.1
+
+
+def classify_trend(slope: float, num_entries: int) -> str:
+    """Same labels as EmotionAnalyzer.get_mood_trend"""
+    if num_entries <= 1:
+        return 'insufficient_data'
+    if slope > TREND_THRESHOLD:
+        return 'improving'
+    if slope < -TREND_THRESHOLD:
+        return 'declining'
+    return 'stable'
+
+
+class _Rollup:
+    """Count/sum/min/max of sentiment for one day or week"""
+
+    __slots__ = ('count', 'total', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float('inf')
+        self.maximum = float('-inf')
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def to_dict(self, period: str) -> Dict:
+        return {
+            'period': period,
+            'count': self.count,
+            'average_sentiment': self.total / self.count,
+            'min_sentiment': self.minimum,
+            'max_sentiment': self.maximum,
+        }
+
+
+class OnlineMoodTrend:
+    """
+    Constant-time, incrementally updated mood trend for one user.
+
+    Entries are indexed 0, 1, 2, ... in arrival order, exactly as
+    `EmotionAnalyzer.get_mood_trend` indexes its list, and the least-squares
+    slope is maintained with Welford-style running moments. Alongside the
+    batch-compatible summary it keeps a time-decayed average and bounded
+    daily/weekly rollups.
+    """
+
+    def __init__(self, half_life_days: float = 7.0, max_days: int = 90, max_weeks: int = 52):
+        self.half_life_seconds = half_life_days * 86400
+        self.max_days = max_days
+        self.max_weeks = max_weeks
+
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float('inf')
+        self.maximum = float('-inf')
+        self._mean_x = 0.0
+        self._mean_y = 0.0
+        self._co_moment = 0.0
+        self._m2_x = 0.0
+
+        self._decayed_sum = 0.0
+        self._decayed_weight = 0.0
+        self._last_time: Optional[float] = None
+
+        self.daily: "OrderedDict[str, _Rollup]" = OrderedDict()
+        self.weekly: "OrderedDict[str, _Rollup]" = OrderedDict()
+
+    def update(self, sentiment: float, timestamp: Optional[datetime] = None):
+        """Fold one entry into the trend in O(1)"""
+        sentiment = float(sentiment)
+        x = float(self.count)
+        self.count += 1
+        self.total += sentiment
+        self.minimum = min(self.minimum, sentiment)
+        self.maximum = max(self.maximum, sentiment)
+
+        dx = x - self._mean_x
+        self._mean_x += dx / self.count
+        self._mean_y += (sentiment - self._mean_y) / self.count
+        self._co_moment += dx * (sentiment - self._mean_y)
+        self._m2_x += dx * (x - self._mean_x)
+
+        if timestamp is not None:
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            self._update_decayed(sentiment, timestamp.timestamp())
+            self._update_rollups(sentiment, timestamp.date())
+
+    @property
+    def slope(self) -> float:
+        return self._co_moment / self._m2_x if self._m2_x else 0.0
+
+    @property
+    def decayed_average(self) -> Optional[float]:
+        return self._decayed_sum / self._decayed_weight if self._decayed_weight else None
+
+    def summary(self) -> Dict:
+        """The same dict EmotionAnalyzer.get_mood_trend returns for these entries"""
+        if not self.count:
+            return {'trend': 'neutral', 'average_sentiment': 0.0}
+        return {
+            'trend': classify_trend(self.slope, self.count),
+            'average_sentiment': self.total / self.count,
+            'num_entries': self.count,
+            'sentiment_range': [self.minimum, self.maximum],
+        }
+
+    def report(self) -> Dict:
+        """Summary plus slope, decayed average and rollups"""
+        return {
+            **self.summary(),
+            'slope': self.slope,
+            'decayed_average_sentiment': self.decayed_average,
+            'half_life_days': self.half_life_seconds / 86400,
+            'daily': [rollup.to_dict(day) for day, rollup in self.daily.items()],
+            'weekly': [rollup.to_dict(week) for week, rollup in self.weekly.items()],
+        }
+
+    def _update_decayed(self, sentiment: float, seconds: float):
+        if self._last_time is None:
+            self._decayed_sum, self._decayed_weight = sentiment, 1.0
+            self._last_time = seconds
+        elif seconds >= self._last_time:
+            decay = 0.5 ** ((seconds - self._last_time) / self.half_life_seconds)
+            self._decayed_sum = self._decayed_sum * decay + sentiment
+            self._decayed_weight = self._decayed_weight * decay + 1.0
+            self._last_time = seconds
+        else:
+            # A late entry: decay it instead of the running state
+            weight = 0.5 ** ((self._last_time - seconds) / self.half_life_seconds)
+            self._decayed_sum += sentiment * weight
+            self._decayed_weight += weight
+
+    def _update_rollups(self, sentiment: float, day: date):
+        iso_year, iso_week, _ = day.isocalendar()
+        for rollups, key, limit in (
+            (self.daily, day.isoformat(), self.max_days),
+            (self.weekly, f"{iso_year}-W{iso_week:02d}", self.max_weeks),
+        ):
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = rollups[key] = _Rollup()
+                # Keep periods in chronological order even for late entries
+                for later in [k for k in rollups if k > key]:
+                    rollups.move_to_end(later)
+            rollup.add(sentiment)
+            while len(rollups) > limit:
+                rollups.popitem(last=False)
+
+
+class _Seed:
+    """A trend being loaded from history, and the records that arrived meanwhile"""
+
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.records: List[Tuple[Optional[str], float, Optional[datetime]]] = []
+        self.trend: Optional[OnlineMoodTrend] = None
+
+
+class MoodTrendRegistry:
+    """
+    Per-user `OnlineMoodTrend`s, seeded from history and then updated on
+    every write
+
+    `loader(user_id)` is a coroutine returning `(timestamp, sentiment)` or
+    `(timestamp, sentiment, entry_id)` tuples oldest first. It runs the
+    first time a user's trend is requested, after the user was evicted
+    beyond `max_users`, and again once the trend is `ttl_seconds` old, to
+    pick up writes made by other API processes or flushed late. Concurrent
+    requests share one load. Records that arrive while a load runs are
+    applied after it, except ones the loader already returned (matched by
+    entry ID). Used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Awaitable[Iterable[Tuple]]],
+        max_users: int = 10000,
+        half_life_days: float = 7.0,
+        ttl_seconds: float = 300.0,
+    ):
+        self.loader = loader
+        self.max_users = max_users
+        self.half_life_days = half_life_days
+        self.ttl_seconds = ttl_seconds
+        self.seeded = 0
+        self._trends: "OrderedDict[str, Tuple[float, OnlineMoodTrend]]" = OrderedDict()
+        self._seeds: Dict[str, _Seed] = {}
+
+    async def get(self, user_id: str) -> OnlineMoodTrend:
+        entry = self._trends.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds:
+            self._trends.move_to_end(user_id)
+            return entry[1]
+        seed = self._seeds.get(user_id)
+        if seed is not None:
+            await seed.done.wait()
+            # None when that load failed: try again
+            return seed.trend if seed.trend is not None else await self.get(user_id)
+
+        seed = self._seeds[user_id] = _Seed()
+        try:
+            trend = OnlineMoodTrend(half_life_days=self.half_life_days)
+            loaded_ids = set()
+            for timestamp, sentiment, *entry_id in await self.loader(user_id):
+                trend.update(sentiment, timestamp)
+                if entry_id:
+                    loaded_ids.add(entry_id[0])
+            for entry_id, sentiment, timestamp in seed.records:
+                if entry_id is None or entry_id not in loaded_ids:
+                    trend.update(sentiment, timestamp)
+            self._trends[user_id] = (time.monotonic(), trend)
+            self._trends.move_to_end(user_id)
+            while len(self._trends) > self.max_users:
+                self._trends.popitem(last=False)
+            seed.trend = trend
+        finally:
+            self._seeds.pop(user_id, None)
+            seed.done.set()
+        self.seeded += 1
+        return trend
+
+    def record(self, user_id: str, sentiment: float, timestamp: Optional[datetime] = None,
+               entry_id: Optional[str] = None):
+        """Update the user's trend if it is loaded (or loading); otherwise it seeds on next read"""
+        seed = self._seeds.get(user_id)
+        if seed is not None:
+            seed.records.append((entry_id, sentiment, timestamp))
+            return
+        entry = self._trends.get(user_id)
+        if entry is not None:
+            entry[1].update(sentiment, timestamp)
+
+    def invalidate(self, user_id: str):
+        self._trends.pop(user_id, None)
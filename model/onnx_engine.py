@@ -0,0 +1,225 @@
+# model/onnx_engine.py
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FP32_FILENAME = "model.onnx"
+QUANTIZED_FILENAME = "model.int8.onnx"
+
+DEFAULT_PARITY_TEXTS = [
+    "I feel really sad today and I don't know why. Everything seems overwhelming.",
+    "Feeling great today! Had coffee with an old friend.",
+    "I'm so angry about how work went, nobody listened to me.",
+    "Nervous about tomorrow's exam, can't stop thinking about it.",
+    "Just a normal day, nothing special happened.",
+    "Wow, I did not expect that surprise party at all!",
+]
+
+
+class OnnxEmotionEngine:
+    """
+    ONNX Runtime execution path for the emotion classifier.
+
+    Callable like the transformers text-classification pipeline with
+    `return_all_scores=True`, so it can replace `EmotionAnalyzer.pipeline`
+    or the backend's `emotion_model` without touching the callers.
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        quantized: bool = True,
+        num_threads: Optional[int] = None,
+        max_length: int = 512,
+    ):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        self.model_dir = model_dir
+        self.quantized = quantized
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        config = AutoConfig.from_pretrained(model_dir)
+        self.labels = [config.id2label[i] for i in range(config.num_labels)]
+        self.multi_label = (
+            config.problem_type == "multi_label_classification" or config.num_labels == 1
+        )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        model_path = os.path.join(model_dir, QUANTIZED_FILENAME if quantized else FP32_FILENAME)
+        logger.info(f"Loading ONNX emotion model: {model_path}")
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def score_batch(self, texts: List[str]) -> np.ndarray:
+        """Return a (len(texts), num_labels) matrix of label probabilities"""
+        encoding = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np",
+        )
+        return self.score_encoded(encoding)
+
+    def score_encoded(self, encoding) -> np.ndarray:
+        """Label probabilities for an already tokenized and padded batch"""
+        feeds = {name: np.asarray(encoding[name], dtype=np.int64) for name in self.input_names if name in encoding}
+        logits = self.session.run(["logits"], feeds)[0]
+
+        if self.multi_label:
+            return 1.0 / (1.0 + np.exp(-logits))
+        shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return shifted / shifted.sum(axis=-1, keepdims=True)
+
+    def __call__(self, texts: Union[str, List[str]], **kwargs) -> List[List[Dict]]:
+        """Pipeline-compatible call: one `[{'label', 'score'}, ...]` list per text"""
+        if isinstance(texts, str):
+            texts = [texts]
+        # Label order, as the pipeline returns with `return_all_scores=True`
+        return [
+            [{'label': label, 'score': float(score)} for label, score in zip(self.labels, row)]
+            for row in self.score_batch(list(texts))
+        ]
+
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True, opset: int = 14) -> Dict[str, str]:
+    """
+    Export a Hugging Face sequence classifier to ONNX
+
+    Args:
+        model_name (str): Hub name or local path of the torch model
+        output_dir (str): Directory for the ONNX files, tokenizer and config
+        quantize (bool): Also write a dynamic int8 quantized copy
+        opset (int): ONNX opset version
+
+    Returns:
+        Dict[str, str]: Paths of the files that were written
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+
+    sample = tokenizer(["A short sample journal entry."], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    fp32_path = os.path.join(output_dir, FP32_FILENAME)
+    logger.info(f"Exporting {model_name} to {fp32_path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+    written = {"fp32": fp32_path}
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(output_dir, QUANTIZED_FILENAME)
+        logger.info(f"Quantizing to int8: {quantized_path}")
+        quantize_dynamic(fp32_path, quantized_path, weight_type=QuantType.QInt8)
+        written["int8"] = quantized_path
+
+    return written
+
+
+def parity_check(model_name: str, onnx_dir: str, texts: List[str], quantized: bool = True) -> Dict:
+    """
+    Compare ONNX Runtime scores against the eager torch pipeline
+
+    Returns:
+        Dict: Score drift, top-1 agreement and per-text latency for both paths
+    """
+    from transformers import pipeline
+
+    torch_pipeline = pipeline("text-classification", model=model_name, return_all_scores=True)
+    engine = OnnxEmotionEngine(onnx_dir, quantized=quantized)
+
+    started = time.perf_counter()
+    torch_outputs = [torch_pipeline([text], truncation=True)[0] for text in texts]
+    torch_ms = (time.perf_counter() - started) * 1000 / len(texts)
+
+    started = time.perf_counter()
+    onnx_outputs = [engine([text])[0] for text in texts]
+    onnx_ms = (time.perf_counter() - started) * 1000 / len(texts)
+
+    drifts = []
+    top1_matches = 0
+    for torch_scores, onnx_scores in zip(torch_outputs, onnx_outputs):
+        expected = {emotion['label']: emotion['score'] for emotion in torch_scores}
+        actual = {emotion['label']: emotion['score'] for emotion in onnx_scores}
+        drifts.extend(abs(expected[label] - actual.get(label, 0.0)) for label in expected)
+        if max(expected, key=expected.get) == max(actual, key=actual.get):
+            top1_matches += 1
+
+    return {
+        "model": model_name,
+        "onnx_model": os.path.join(onnx_dir, QUANTIZED_FILENAME if quantized else FP32_FILENAME),
+        "num_texts": len(texts),
+        "max_abs_drift": float(max(drifts)),
+        "mean_abs_drift": float(np.mean(drifts)),
+        "top1_agreement": top1_matches / len(texts),
+        "torch_ms_per_text": torch_ms,
+        "onnx_ms_per_text": onnx_ms,
+        "speedup": torch_ms / onnx_ms if onnx_ms else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX export and parity tools for the emotion model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export the model to ONNX (fp32 + int8)")
+    export_parser.add_argument("--model", default="j-hartmann/emotion-english-distilroberta-base")
+    export_parser.add_argument("--output-dir", default="onnx")
+    export_parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 copy")
+    export_parser.add_argument("--opset", type=int, default=14)
+
+    parity_parser = subparsers.add_parser("parity", help="Report score drift against the torch path")
+    parity_parser.add_argument("--model", default="j-hartmann/emotion-english-distilroberta-base")
+    parity_parser.add_argument("--onnx-dir", default="onnx")
+    parity_parser.add_argument("--fp32", action="store_true", help="Check the fp32 export instead of int8")
+    parity_parser.add_argument("--texts", help="Optional file with one text per line")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "export":
+        written = export_onnx(args.model, args.output_dir, quantize=not args.no_quantize, opset=args.opset)
+        print(json.dumps(written, indent=2))
+    else:
+        texts = DEFAULT_PARITY_TEXTS
+        if args.texts:
+            with open(args.texts) as f:
+                texts = [line.strip() for line in f if line.strip()]
+        report = parity_check(args.model, args.onnx_dir, texts, quantized=not args.fp32)
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# model/postprocess.py
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Emotions that count towards the sentiment polarity score
+POSITIVE_EMOTIONS = ['joy', 'optimism', 'love', 'excitement', 'amusement', 'approval', 'caring', 'gratitude']
+NEGATIVE_EMOTIONS = ['sadness', 'disappointment', 'anger', 'annoyance', 'grief', 'fear', 'disgust']
+
+
+def sentiment_score(emotion_scores: Dict) -> float:
+    """Overall sentiment in [-1, 1] from a `label -> score` mapping"""
+    positive_score = sum(emotion_scores.get(emotion, 0) for emotion in POSITIVE_EMOTIONS)
+    negative_score = sum(emotion_scores.get(emotion, 0) for emotion in NEGATIVE_EMOTIONS)
+    
+    # Normalize to [-1, 1] range
+    total_score = positive_score + negative_score
+    if total_score == 0:
+        return 0.0
+    
+    return (positive_score - negative_score) / total_score
+
+
+def mood_category(sentiment: float) -> str:
+    """Mood bucket for a sentiment score"""
+    if sentiment > 0.3:
+        return 'excellent' if sentiment > 0.6 else 'good'
+    elif sentiment > -0.3:
+        return 'okay'
+    else:
+        return 'difficult' if sentiment < -0.6 else 'struggling'
+
+
+# Insights keyed by the dominant emotions that trigger them
+DOMINANT_INSIGHTS = [
+    (['joy', 'optimism', 'love'],
+     "You're experiencing positive emotions. This is a great time to engage in activities you enjoy."),
+    (['sadness', 'disappointment', 'grief'],
+     "It seems you're going through a difficult time. Consider reaching out to someone you trust."),
+    (['anger', 'annoyance'],
+     "You might be feeling frustrated. Try some calming techniques like deep breathing."),
+    (['fear', 'nervousness'],
+     "Anxiety might be affecting you. Grounding techniques could help you feel more centered."),
+]
+BALANCED_INSIGHT = "Your emotions seem balanced today. This is a good time for reflection and planning."
+MIXED_INSIGHT = "You're experiencing a mix of emotions. This is completely normal and human."
+DEFAULT_INSIGHT = "Every feeling is valid. Take time to acknowledge what you're experiencing."
+
+MOOD_CATEGORIES = np.array(['excellent', 'good', 'okay', 'difficult', 'struggling'])
+
+
+class EmotionPostprocessor:
+    """
+    Batch post-processing over a `(texts, labels)` score matrix.
+
+    Column indices for the sentiment lists and the insight groups are
+    resolved once per label order. Sentiment, mood category, dominant
+    emotion and insight flags for a batch are then plain NumPy operations,
+    and give exactly the values of `sentiment_score`, `mood_category` and
+    `EmotionAnalyzer._generate_insights` for rows in label order.
+    """
+
+    def __init__(self, labels: List[str]):
+        self.labels = list(labels)
+        index = {label: column for column, label in enumerate(self.labels)}
+        # Kept in list order: the columns are summed one at a time, in the
+        # same order as sentiment_score, so the floats round identically
+        self.positive_columns = [index[emotion] for emotion in POSITIVE_EMOTIONS if emotion in index]
+        self.negative_columns = [index[emotion] for emotion in NEGATIVE_EMOTIONS if emotion in index]
+        # Insight group per label (-1 for none), looked up by dominant column
+        self.insight_group = np.full(len(self.labels), -1, dtype=np.int64)
+        for group, (emotions, _) in enumerate(DOMINANT_INSIGHTS):
+            for emotion in emotions:
+                if emotion in index:
+                    self.insight_group[index[emotion]] = group
+
+    def to_matrix(self, score_dicts: List[Dict[str, float]]) -> np.ndarray:
+        """Stack `label -> score` dicts into a float64 matrix (missing labels are 0)"""
+        matrix = np.zeros((len(score_dicts), len(self.labels)), dtype=np.float64)
+        for row, emotion_scores in enumerate(score_dicts):
+            matrix[row] = [emotion_scores.get(label, 0.0) for label in self.labels]
+        return matrix
+
+    def sentiment(self, scores: np.ndarray) -> np.ndarray:
+        positive = self._column_sum(scores, self.positive_columns)
+        negative = self._column_sum(scores, self.negative_columns)
+        total = positive + negative
+        sentiment = np.zeros(len(scores), dtype=np.float64)
+        np.divide(positive - negative, total, out=sentiment, where=total != 0)
+        return sentiment
+
+    def mood_categories(self, sentiment: np.ndarray) -> np.ndarray:
+        return np.select(
+            [sentiment > 0.6, sentiment > 0.3, sentiment > -0.3, sentiment < -0.6],
+            MOOD_CATEGORIES[:4],
+            default=MOOD_CATEGORIES[4],
+        )
+
+    def dominant(self, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Dominant column per row (-1 when no score is above 0) and its score
+
+        `argmax` picks the first maximum, like the scalar scan with `>`.
+        """
+        if not self.labels:
+            return np.full(len(scores), -1, dtype=np.int64), np.zeros(len(scores))
+        columns = np.argmax(scores, axis=1)
+        confidence = scores[np.arange(len(scores)), columns]
+        positive = confidence > 0
+        return np.where(positive, columns, -1), np.where(positive, confidence, 0.0)
+
+    def insight_flags(self, scores: np.ndarray, dominant: np.ndarray, sentiment: np.ndarray) -> Dict[str, np.ndarray]:
+        group = np.where(dominant >= 0, self.insight_group[np.maximum(dominant, 0)], -1)
+        return {
+            'group': group,
+            'balanced': np.abs(sentiment) < 0.2,
+            'mixed': (scores > 0.1).sum(axis=1) > 5,
+        }
+
+    def process(self, scores: np.ndarray) -> List[Dict]:
+        """Per-row `dominant_emotion`, `confidence`, `sentiment_score`, `mood_category`, `insights`"""
+        scores = np.asarray(scores, dtype=np.float64).reshape(-1, len(self.labels))
+        sentiment = self.sentiment(scores)
+        categories = self.mood_categories(sentiment)
+        dominant, confidence = self.dominant(scores)
+        flags = self.insight_flags(scores, dominant, sentiment)
+
+        results = []
+        for row in range(len(scores)):
+            insights = []
+            if flags['group'][row] >= 0:
+                insights.append(DOMINANT_INSIGHTS[flags['group'][row]][1])
+            if flags['balanced'][row]:
+                insights.append(BALANCED_INSIGHT)
+            if flags['mixed'][row]:
+                insights.append(MIXED_INSIGHT)
+            results.append({
+                'dominant_emotion': self.labels[dominant[row]] if dominant[row] >= 0 else None,
+                'confidence': float(confidence[row]) if dominant[row] >= 0 else 0,
+                'sentiment_score': float(sentiment[row]),
+                'mood_category': str(categories[row]),
+                'insights': insights or [DEFAULT_INSIGHT],
+            })
+        return results
+
+    @staticmethod
+    def _column_sum(scores: np.ndarray, columns: List[int]) -> np.ndarray:
+        total = np.zeros(len(scores), dtype=np.float64)
+        for column in columns:
+            total = total + scores[:, column]
+        return total
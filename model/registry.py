@@ -0,0 +1,261 @@
+# model/registry.py
+"""
+Local registry of emotion model versions
+
+    registry/
+        ACTIVE                 # name of the version the backend serves
+        v1/manifest.json       # version, source, labels, file hashes, notes
+        v1/model.safetensors   # plus config and tokenizer files
+        v1/onnx/               # optional, from `onnx_engine.py export`
+
+    python registry.py register --root registry --source j-hartmann/emotion-english-distilroberta-base
+    python registry.py register --root registry --source ./student --notes "distilled, 4 layers"
+    python registry.py activate --root registry v2
+    python registry.py list --root registry
+
+Weights are always stored as safetensors so `load_mmap_model` can map them
+instead of copying them into process memory.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import struct
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+ACTIVE_FILENAME = "ACTIVE"
+WEIGHTS_FILENAME = "model.safetensors"
+
+_VERSION_NUMBER = re.compile(r"^v(\d+)$")
+
+_SAFETENSORS_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+class ModelRegistry:
+    """
+    Versioned model directories under `root`, each with a manifest
+
+    A version is written to a temporary directory and renamed into place
+    once complete, and the active pointer is replaced atomically, so readers
+    never see a half-written version.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, version: str) -> str:
+        return os.path.join(self.root, version)
+
+    def versions(self) -> List[Dict]:
+        """Manifests of every complete version, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        manifests = []
+        for name in os.listdir(self.root):
+            manifest_path = os.path.join(self.root, name, MANIFEST_FILENAME)
+            if not name.startswith(".") and os.path.exists(manifest_path):
+                with open(manifest_path) as f:
+                    manifests.append(json.load(f))
+        return sorted(manifests, key=lambda manifest: manifest["created_at"])
+
+    def manifest(self, version: str) -> Dict:
+        manifest_path = os.path.join(self.path(version), MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            raise KeyError(f"Unknown model version: {version}")
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    def active_version(self) -> Optional[str]:
+        """The version to serve: the ACTIVE pointer, else the newest version"""
+        active_path = os.path.join(self.root, ACTIVE_FILENAME)
+        if os.path.exists(active_path):
+            with open(active_path) as f:
+                version = f.read().strip()
+            if version:
+                return version
+        versions = self.versions()
+        return versions[-1]["version"] if versions else None
+
+    def set_active(self, version: str):
+        self.manifest(version)
+        tmp_path = os.path.join(self.root, f".{ACTIVE_FILENAME}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(version + "\n")
+        os.replace(tmp_path, os.path.join(self.root, ACTIVE_FILENAME))
+        logger.info(f"Active model version is now {version}")
+
+    def next_version(self) -> str:
+        numbers = [int(match.group(1)) for manifest in self.versions()
+                   if (match := _VERSION_NUMBER.match(manifest["version"]))]
+        return f"v{max(numbers, default=0) + 1}"
+
+    def register(self, source: str, version: Optional[str] = None, notes: str = "") -> Dict:
+        """
+        Copy a Hugging Face model name or checkpoint directory into the registry
+
+        The model is re-saved as safetensors with its tokenizer. An `onnx/`
+        directory next to a local checkpoint's weights is copied along.
+
+        Returns:
+            Dict: The new version's manifest
+        """
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        version = version or self.next_version()
+        if os.path.exists(self.path(version)):
+            raise ValueError(f"Model version {version} already exists")
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = os.path.join(self.root, f".{version}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        model = AutoModelForSequenceClassification.from_pretrained(source)
+        AutoTokenizer.from_pretrained(source).save_pretrained(tmp_dir)
+        model.save_pretrained(tmp_dir, safe_serialization=True)
+        if os.path.isdir(os.path.join(source, "onnx")):
+            shutil.copytree(os.path.join(source, "onnx"), os.path.join(tmp_dir, "onnx"))
+
+        manifest = {
+            "version": version,
+            "source": source,
+            "created_at": time.time(),
+            "labels": [model.config.id2label[i] for i in range(model.config.num_labels)],
+            "parameters": sum(p.numel() for p in model.parameters()),
+            "files": _hash_files(tmp_dir),
+            "notes": notes,
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_FILENAME), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(tmp_dir, self.path(version))
+        logger.info(f"Registered {source} as {version}")
+        return manifest
+
+    def verify(self, version: str) -> bool:
+        """True when the version's files still match the hashes in its manifest"""
+        return _hash_files(self.path(version)) == self.manifest(version)["files"]
+
+
+def _hash_files(directory: str) -> Dict[str, str]:
+    hashes = {}
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            relative = os.path.relpath(path, directory)
+            if relative == MANIFEST_FILENAME:
+                continue
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            hashes[relative] = digest.hexdigest()
+    return dict(sorted(hashes.items()))
+
+
+def is_mmap_loadable(model_dir: str) -> bool:
+    """True for a local checkpoint with a single safetensors weights file"""
+    return os.path.isfile(os.path.join(model_dir, WEIGHTS_FILENAME))
+
+
+def load_mmap_state_dict(path: str) -> Dict:
+    """
+    Tensors of a safetensors file, backed by a private memory mapping
+
+    Nothing is read up front: pages come from the page cache on first use
+    and are shared by every process mapping the same file, so loading a
+    second copy (a swap, another worker) costs no extra physical memory.
+    """
+    import torch
+
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+    data_start = 8 + header_size
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+
+    state_dict = {}
+    for name, info in header.items():
+        dtype = getattr(torch, _SAFETENSORS_DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        offset = data_start + start
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        if offset % itemsize:
+            # Misaligned for its dtype: copy this tensor out of the mapping
+            raw = torch.empty(0, dtype=torch.uint8).set_(storage, offset, (end - start,))
+            state_dict[name] = raw.clone().view(dtype).reshape(info["shape"])
+        else:
+            state_dict[name] = torch.empty(0, dtype=dtype).set_(storage, offset // itemsize, info["shape"])
+    return state_dict
+
+
+def load_mmap_model(model_dir: str):
+    """
+    Sequence-classification model whose weights map `model.safetensors`
+
+    The module tree is built without initializing (or touching) its
+    parameters, which are then replaced by the mapped tensors. Checkpoints
+    this cannot account for fall back to `from_pretrained`.
+    """
+    from transformers import AutoConfig, AutoModelForSequenceClassification
+    from transformers.modeling_utils import no_init_weights
+
+    config = AutoConfig.from_pretrained(model_dir)
+    with no_init_weights():
+        model = AutoModelForSequenceClassification.from_config(config)
+    state_dict = load_mmap_state_dict(os.path.join(model_dir, WEIGHTS_FILENAME))
+    missing, _ = model.load_state_dict(state_dict, strict=False, assign=True)
+    model.tie_weights()
+    # Buffers keep their constructed values; tied parameters share a loaded one
+    parameters = {name for name, _ in model.named_parameters(remove_duplicate=False)}
+    tied = parameters - {name for name, _ in model.named_parameters()}
+    if (set(missing) & parameters) - tied:
+        logger.warning(f"{model_dir}: weights missing from the checkpoint, loading normally")
+        return AutoModelForSequenceClassification.from_pretrained(model_dir)
+    model.requires_grad_(False)
+    model.eval()
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local model registry")
+    parser.add_argument("--root", default=os.getenv("NEUS_MODEL_REGISTRY", "registry"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    register_parser = commands.add_parser("register", help="Add a model as a new version")
+    register_parser.add_argument("--source", required=True, help="Hugging Face model name or checkpoint directory")
+    register_parser.add_argument("--version", default=None, help="Default: next vN")
+    register_parser.add_argument("--notes", default="")
+    register_parser.add_argument("--activate", action="store_true")
+    activate_parser = commands.add_parser("activate", help="Point ACTIVE at a version")
+    activate_parser.add_argument("version")
+    verify_parser = commands.add_parser("verify", help="Check a version's files against its manifest")
+    verify_parser.add_argument("version")
+    commands.add_parser("list", help="Show every version")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    registry = ModelRegistry(args.root)
+    if args.command == "register":
+        report = registry.register(args.source, args.version, args.notes)
+        if args.activate:
+            registry.set_active(report["version"])
+    elif args.command == "activate":
+        registry.set_active(args.version)
+        report = {"active": args.version}
+    elif args.command == "verify":
+        report = {"version": args.version, "intact": registry.verify(args.version)}
+    else:
+        report = {"active": registry.active_version(), "versions": registry.versions()}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
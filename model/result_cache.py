@@ -0,0 +1,254 @@
+# model/result_cache.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Bumped when the stored scores change shape; 2: scores in label order
+KEY_VERSION = 2
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize journal text for cache lookups
+
+    Unicode is NFKC-normalized and runs of whitespace are collapsed. Case is
+    kept because the classifier is case-sensitive.
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def model_fingerprint(model_name: str, engine: str = "torch", version: Optional[str] = None) -> str:
+    """
+    Identify the exact model that produced a score
+
+    For a local model directory the version is derived from the config and
+    weight files, so re-saving a fine-tuned model invalidates old entries.
+    """
+    if version is None:
+        version = ""
+        if os.path.isdir(model_name):
+            digest = hashlib.sha256()
+            for name in sorted(os.listdir(model_name)):
+                path = os.path.join(model_name, name)
+                if os.path.isfile(path) and name.endswith((".json", ".safetensors", ".bin", ".onnx")):
+                    stat = os.stat(path)
+                    digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+            version = digest.hexdigest()[:16]
+    return f"{model_name}|{engine}|{version}"
+
+
+class EmotionResultCache:
+    """
+    Content-addressed cache of emotion scores.
+
+    Entries are keyed by a hash of the normalized text and the model
+    fingerprint, bounded by LRU eviction and a TTL, and optionally backed by
+    a SQLite file so they survive restarts. Several model versions can
+    share one file (a hot swap loads the new version next to the old one):
+    rows are tagged with their model fingerprint and each cache only reads
+    and clears its own. Expired rows are dropped when the file is opened,
+    and the oldest rows when the file grows past `max_disk_entries`.
+
+    `aget` and `aput` are for the event loop: memory hits are served
+    inline and SQLite is only touched on a worker thread.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        max_entries: int = 10000,
+        ttl_seconds: float = 24 * 3600,
+        disk_path: Optional[str] = None,
+        max_disk_entries: Optional[int] = 100000,
+    ):
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.disk_evictions = 0
+
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # SQLite calls hold their own lock so they never stall memory lookups
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_rows = 0
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def key(self, text: str) -> str:
+        payload = f"{KEY_VERSION}\0{self.model_id}\0{normalize_text(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Optional[Dict[str, float]]:
+        """Return cached scores for `text`, or None on a miss"""
+        key = self.key(text)
+        scores = self._get_memory(key)
+        if scores is None and self._db is not None:
+            scores = self._get_disk(key)
+        if scores is None:
+            self._record_miss()
+        return scores
+
+    async def aget(self, text: str) -> Optional[Dict[str, float]]:
+        """`get` that reads the disk tier on a worker thread"""
+        key = self.key(text)
+        scores = self._get_memory(key)
+        if scores is None and self._db is not None:
+            scores = await asyncio.to_thread(self._get_disk, key)
+        if scores is None:
+            self._record_miss()
+        return scores
+
+    def put(self, text: str, scores: Dict[str, float]):
+        """Store the scores computed for `text`"""
+        if self.max_entries <= 0:
+            return
+        key, now = self.key(text), time.time()
+        with self._lock:
+            self._insert(key, now, dict(scores))
+        if self._db is not None:
+            self._put_disk(key, now, scores)
+
+    async def aput(self, text: str, scores: Dict[str, float]):
+        """`put` that writes the disk tier on a worker thread"""
+        if self.max_entries <= 0:
+            return
+        key, now = self.key(text), time.time()
+        with self._lock:
+            self._insert(key, now, dict(scores))
+        if self._db is not None:
+            await asyncio.to_thread(self._put_disk, key, now, dict(scores))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM emotion_cache WHERE model_id = ?", (self.model_id,))
+                self._db.commit()
+                self._disk_rows = self._count_disk_rows()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "model_id": self.model_id,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "disk_evictions": self.disk_evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _get_memory(self, key: str) -> Optional[Dict[str, float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, scores = entry
+            if time.time() - stored_at <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(scores)
+            del self._entries[key]
+            self.expirations += 1
+            return None
+
+    def _get_disk(self, key: str) -> Optional[Dict[str, float]]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT stored_at, scores FROM emotion_cache WHERE key = ? AND model_id = ?", (key, self.model_id)
+            ).fetchone()
+        if row is None or time.time() - row[0] > self.ttl_seconds:
+            return None
+        scores = json.loads(row[1])
+        with self._lock:
+            self._insert(key, row[0], scores)
+            self.hits += 1
+            self.disk_hits += 1
+        return dict(scores)
+
+    def _put_disk(self, key: str, stored_at: float, scores: Dict[str, float]):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO emotion_cache (key, model_id, stored_at, scores) VALUES (?, ?, ?, ?)",
+                (key, self.model_id, stored_at, json.dumps(scores)),
+            )
+            # Replacing a row overcounts; the trim recounts before deleting
+            self._disk_rows += 1
+            if self.max_disk_entries is not None and self._disk_rows > self.max_disk_entries:
+                self._trim_disk()
+            self._db.commit()
+
+    def _trim_disk(self):
+        self._disk_rows = self._count_disk_rows()
+        overflow = self._disk_rows - self.max_disk_entries
+        if overflow <= 0:
+            return
+        # Trim a tenth below the cap so the next inserts do not each trim
+        removed = self._db.execute(
+            "DELETE FROM emotion_cache WHERE key IN (SELECT key FROM emotion_cache ORDER BY stored_at LIMIT ?)",
+            (overflow + self.max_disk_entries // 10,),
+        ).rowcount
+        self._disk_rows -= removed
+        self.disk_evictions += removed
+
+    def _count_disk_rows(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM emotion_cache").fetchone()[0]
+
+    def _record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def _insert(self, key: str, stored_at: float, scores: Dict[str, float]):
+        self._entries[key] = (stored_at, scores)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _open_disk(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS emotion_cache ("
+            "key TEXT PRIMARY KEY, model_id TEXT NOT NULL, stored_at REAL NOT NULL, scores TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS emotion_cache_stored_at ON emotion_cache (stored_at)")
+        # Rows of other fingerprints may belong to a version still serving
+        removed = self._db.execute(
+            "DELETE FROM emotion_cache WHERE stored_at < ?", (time.time() - self.ttl_seconds,)
+        ).rowcount
+        self._disk_rows = self._count_disk_rows()
+        if self.max_disk_entries is not None and self._disk_rows > self.max_disk_entries:
+            self._trim_disk()
+        self._db.commit()
+        if removed:
+            logger.info(f"Dropped {removed} expired emotion cache entries from {path}")
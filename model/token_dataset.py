@@ -0,0 +1,281 @@
+# model/token_dataset.py
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+META_FILENAME = "meta.json"
+TOKENS_FILENAME = "tokens.bin"
+OFFSETS_FILENAME = "offsets.bin"
+LABELS_FILENAME = "labels.bin"
+
+TOKEN_DTYPE = np.int32
+INDEX_DTYPE = np.int64
+UNLABELED = -1
+
+
+def iter_records(
+    path: str,
+    text_column: str = "text",
+    label_column: Optional[str] = "emotion",
+    chunk_size: int = 10000,
+) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    Stream (text, label) pairs from a CSV or JSONL file without loading it whole
+
+    The label is None when `label_column` is None or missing from a record.
+    """
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                label = record.get(label_column) if label_column else None
+                yield str(record.get(text_column, "")), None if label is None else str(label)
+        return
+
+    import pandas as pd
+
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        texts = chunk[text_column].fillna("").astype(str).tolist()
+        if label_column and label_column in chunk.columns:
+            labels = chunk[label_column].astype(str).tolist()
+        else:
+            labels = [None] * len(texts)
+        yield from zip(texts, labels)
+
+
+def _source_signature(path: str) -> Dict:
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def padding_efficiency(lengths: np.ndarray, batch_size: int, group_by_length: bool = True, seed: int = 42) -> float:
+    """
+    Fraction of real tokens in padded batches
+
+    With `group_by_length`, batches are formed the way the length-grouped
+    sampler forms them: shuffled mega-batches sorted by length.
+    """
+    if len(lengths) == 0:
+        return 1.0
+    indices = np.random.default_rng(seed).permutation(len(lengths))
+    if group_by_length:
+        mega_batch = batch_size * 50
+        groups = [indices[start:start + mega_batch] for start in range(0, len(indices), mega_batch)]
+        indices = np.concatenate([group[np.argsort(-lengths[group], kind="stable")] for group in groups])
+    padded = 0
+    for start in range(0, len(indices), batch_size):
+        batch = lengths[indices[start:start + batch_size]]
+        padded += int(batch.max()) * len(batch)
+    return float(lengths.sum()) / padded
+
+
+def tokenize_to_memmap(
+    source_path: str,
+    tokenizer,
+    output_dir: str,
+    text_column: str = "text",
+    label_column: Optional[str] = "emotion",
+    max_length: int = 512,
+    chunk_size: int = 4096,
+    batch_size: int = 16,
+) -> Dict:
+    """
+    One-time tokenization of a CSV/JSONL corpus into memory-mappable files
+
+    Token IDs are appended to a flat int32 file with an int64 offsets file
+    (sample `i` spans `tokens[offsets[i]:offsets[i + 1]]`). Labels are
+    factorized in first-seen order; unlabeled samples get -1.
+
+    Returns:
+        Dict: Throughput and padding-efficiency report
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # The meta file marks a complete run, so drop any stale one first
+    meta_path = os.path.join(output_dir, META_FILENAME)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    label_ids: Dict[str, int] = {}
+    num_samples = 0
+    num_tokens = 0
+    started = time.perf_counter()
+
+    def flush(texts: List[str], labels: List[Optional[str]], tokens_file, offsets_file, labels_file):
+        nonlocal num_samples, num_tokens
+        input_ids = tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+        lengths = np.fromiter((len(ids) for ids in input_ids), dtype=INDEX_DTYPE, count=len(input_ids))
+        flat = np.fromiter((token for ids in input_ids for token in ids), dtype=TOKEN_DTYPE, count=int(lengths.sum()))
+        label_array = np.fromiter(
+            (UNLABELED if label is None else label_ids.setdefault(label, len(label_ids)) for label in labels),
+            dtype=INDEX_DTYPE,
+            count=len(labels),
+        )
+
+        tokens_file.write(flat.tobytes())
+        offsets_file.write((num_tokens + np.cumsum(lengths)).astype(INDEX_DTYPE).tobytes())
+        labels_file.write(label_array.tobytes())
+        num_tokens += int(lengths.sum())
+        num_samples += len(texts)
+
+    with open(os.path.join(output_dir, TOKENS_FILENAME), "wb") as tokens_file, \
+            open(os.path.join(output_dir, OFFSETS_FILENAME), "wb") as offsets_file, \
+            open(os.path.join(output_dir, LABELS_FILENAME), "wb") as labels_file:
+        offsets_file.write(np.asarray([0], dtype=INDEX_DTYPE).tobytes())
+        texts, labels = [], []
+        for text, label in iter_records(source_path, text_column, label_column):
+            texts.append(text)
+            labels.append(label)
+            if len(texts) >= chunk_size:
+                flush(texts, labels, tokens_file, offsets_file, labels_file)
+                texts, labels = [], []
+                logger.info(f"Tokenized {num_samples} samples ({num_tokens} tokens)")
+        if texts:
+            flush(texts, labels, tokens_file, offsets_file, labels_file)
+
+    elapsed = time.perf_counter() - started
+    meta = {
+        "num_samples": num_samples,
+        "num_tokens": num_tokens,
+        "label_names": list(label_ids),
+        "max_length": max_length,
+        "pad_token_id": tokenizer.pad_token_id,
+        "tokenizer": getattr(tokenizer, "name_or_path", ""),
+        "source": _source_signature(source_path),
+    }
+    with open(meta_path, "w") as f:
+        json.dump(meta, f, indent=2)
+
+    lengths = MemmapTokenDataset(output_dir).lengths
+    report = {
+        "num_samples": num_samples,
+        "num_tokens": num_tokens,
+        "seconds": round(elapsed, 3),
+        "tokens_per_sec": num_tokens / elapsed if elapsed else 0.0,
+        "mean_length": float(lengths.mean()) if num_samples else 0.0,
+        "padding_efficiency_fixed": num_tokens / (num_samples * max_length) if num_samples else 1.0,
+        "padding_efficiency_dynamic": padding_efficiency(lengths, batch_size, group_by_length=False),
+        "padding_efficiency_grouped": padding_efficiency(lengths, batch_size, group_by_length=True),
+    }
+    logger.info(f"Tokenization report: {report}")
+    return report
+
+
+def is_tokenized(output_dir: str, source_path: str, tokenizer_name: str, max_length: int) -> bool:
+    """True when `output_dir` already holds tokens for this source and tokenizer"""
+    meta_path = os.path.join(output_dir, META_FILENAME)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return (
+        meta.get("source") == _source_signature(source_path)
+        and meta.get("tokenizer") == tokenizer_name
+        and meta.get("max_length") == max_length
+    )
+
+
+class MemmapTokenDataset:
+    """
+    Torch-compatible dataset over a directory written by `tokenize_to_memmap`
+
+    Nothing is loaded up front; samples are sliced out of the memory-mapped
+    token file on access, so corpora larger than RAM train fine.
+    """
+
+    def __init__(self, data_dir: str):
+        with open(os.path.join(data_dir, META_FILENAME)) as f:
+            self.meta = json.load(f)
+        self.label_names: List[str] = self.meta["label_names"]
+        self.pad_token_id = self.meta.get("pad_token_id") or 0
+
+        num_tokens = self.meta["num_tokens"]
+        num_samples = self.meta["num_samples"]
+        self.tokens = np.memmap(os.path.join(data_dir, TOKENS_FILENAME), dtype=TOKEN_DTYPE, mode="r",
+                                shape=(num_tokens,)) if num_tokens else np.zeros(0, dtype=TOKEN_DTYPE)
+        self.offsets = np.memmap(os.path.join(data_dir, OFFSETS_FILENAME), dtype=INDEX_DTYPE, mode="r",
+                                 shape=(num_samples + 1,))
+        self.labels = np.memmap(os.path.join(data_dir, LABELS_FILENAME), dtype=INDEX_DTYPE, mode="r",
+                                shape=(num_samples,)) if num_samples else np.zeros(0, dtype=INDEX_DTYPE)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        item = {"input_ids": np.array(self.tokens[start:end], dtype=np.int64)}
+        label = int(self.labels[idx])
+        if label != UNLABELED:
+            item["labels"] = label
+        return item
+
+
+class DynamicPaddingCollator:
+    """Pad each batch only to its own longest sample"""
+
+    def __init__(self, pad_token_id: int, pad_to_multiple_of: Optional[int] = 8):
+        self.pad_token_id = pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+
+    def __call__(self, features: List[Dict]) -> Dict:
+        import torch
+
+        max_length = max(len(feature["input_ids"]) for feature in features)
+        if self.pad_to_multiple_of:
+            max_length = -(-max_length // self.pad_to_multiple_of) * self.pad_to_multiple_of
+
+        input_ids = np.full((len(features), max_length), self.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(features), max_length), dtype=np.int64)
+        for row, feature in enumerate(features):
+            length = len(feature["input_ids"])
+            input_ids[row, :length] = feature["input_ids"]
+            attention_mask[row, :length] = 1
+
+        batch = {
+            "input_ids": torch.from_numpy(input_ids),
+            "attention_mask": torch.from_numpy(attention_mask),
+        }
+        if "labels" in features[0]:
+            batch["labels"] = torch.tensor([feature["labels"] for feature in features], dtype=torch.long)
+        return batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-tokenize a training corpus into memory-mapped files")
+    parser.add_argument("--input", required=True, help="CSV or JSONL file")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--tokenizer", default="distilbert-base-uncased")
+    parser.add_argument("--text-column", default="text")
+    parser.add_argument("--label-column", default="emotion", help="Empty for unlabeled text")
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=16, help="Used for the padding-efficiency estimate")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    logging.basicConfig(level=logging.INFO)
+    report = tokenize_to_memmap(
+        args.input,
+        AutoTokenizer.from_pretrained(args.tokenizer),
+        args.output_dir,
+        text_column=args.text_column,
+        label_column=args.label_column or None,
+        max_length=args.max_length,
+        batch_size=args.batch_size,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(REPO_DIR, "backend")
+MODEL_DIR = os.path.join(REPO_DIR, "model")
+
+# Both directories are flat script directories, imported by module name
+for directory in (BACKEND_DIR, MODEL_DIR):
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+
+@pytest.fixture(scope="session")
+def emotion_analyzer_class():
+    """The EmotionAnalyzer class; skips when the model stack is not installed"""
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    pytest.importorskip("pandas")
+    from analyzer_loader import load_emotion_analyzer
+
+    return load_emotion_analyzer()
+
+
+@pytest.fixture
+def bare_analyzer(emotion_analyzer_class):
+    """An EmotionAnalyzer with no model loaded, for its pure post-processing methods"""
+    def make(labels):
+        analyzer = emotion_analyzer_class.__new__(emotion_analyzer_class)
+        analyzer.labels = list(labels)
+        analyzer.postprocessor = None
+        return analyzer
+
+    return make
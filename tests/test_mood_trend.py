@@ -0,0 +1,173 @@
+# tests/test_mood_trend.py
+"""
+OnlineMoodTrend and MoodTrendRegistry against the batch
+EmotionAnalyzer.get_mood_trend over the same entries
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import mood_trend
+from mood_trend import MoodTrendRegistry, OnlineMoodTrend
+
+START = datetime(2024, 3, 1, 8, 0, tzinfo=timezone.utc)
+
+
+def sentiments(count, seed=0):
+    """Noisy sentiment that drifts up and down, so the trend label changes along the way"""
+    rng = np.random.default_rng(seed)
+    drift = 0.6 * np.sin(np.linspace(0, 3 * np.pi, count))
+    return np.clip(drift + rng.normal(0, 0.1, count), -1, 1).tolist()
+
+
+SERIES = {
+    'improving': np.linspace(-0.9, 0.9, 12).tolist(),
+    'declining': np.linspace(0.9, -0.9, 12).tolist(),
+    'stable': np.clip(0.1 + np.random.default_rng(5).normal(0, 0.05, 30), -1, 1).tolist(),
+    'mixed': sentiments(60),
+}
+
+
+@pytest.fixture
+def batch_trend(bare_analyzer):
+    analyzer = bare_analyzer([])
+    return lambda values: analyzer.get_mood_trend([{'sentiment_score': value} for value in values])
+
+
+def assert_same_summary(online, batch):
+    assert online.keys() == batch.keys()
+    assert online['trend'] == batch['trend']
+    assert online['average_sentiment'] == pytest.approx(float(batch['average_sentiment']), abs=1e-12)
+    if 'num_entries' in batch:
+        assert online['num_entries'] == batch['num_entries']
+        assert online['sentiment_range'] == batch['sentiment_range']
+
+
+@pytest.mark.parametrize("name", SERIES)
+def test_online_summary_matches_batch_at_every_prefix(batch_trend, name):
+    values = SERIES[name]
+    trend = OnlineMoodTrend()
+
+    assert_same_summary(trend.summary(), batch_trend([]))
+    for count, value in enumerate(values, start=1):
+        trend.update(value, START + timedelta(hours=count))
+        assert_same_summary(trend.summary(), batch_trend(values[:count]))
+
+    if name != 'mixed':
+        assert trend.summary()['trend'] == name
+
+
+def test_online_slope_matches_least_squares():
+    values = sentiments(40, seed=3)
+    trend = OnlineMoodTrend()
+    for count, value in enumerate(values, start=1):
+        trend.update(value)
+        if count > 1:
+            expected = np.polyfit(range(count), values[:count], 1)[0]
+            assert trend.slope == pytest.approx(expected, abs=1e-9)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Store:
+    """Mood entries of one user as the repository returns them, oldest first"""
+
+    def __init__(self):
+        self.entries = []
+        self.loads = 0
+        self.gate = None
+
+    def add(self, sentiment):
+        entry_id = f"entry-{len(self.entries)}"
+        timestamp = START + timedelta(hours=len(self.entries))
+        self.entries.append((timestamp, sentiment, entry_id))
+        return entry_id, timestamp
+
+    def sentiments(self):
+        return [sentiment for _, sentiment, _ in self.entries]
+
+    async def load(self, user_id):
+        self.loads += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        return list(self.entries)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    # Only the registry's clock: asyncio keeps the real one
+    monkeypatch.setattr(mood_trend, "time", SimpleNamespace(monotonic=fake))
+    return fake
+
+
+def test_registry_matches_batch_across_writes_and_ttl_reseed(batch_trend, clock):
+    values = sentiments(30, seed=1)
+    store = Store()
+    registry = MoodTrendRegistry(store.load, ttl_seconds=300)
+
+    async def scenario():
+        for value in values[:10]:
+            store.add(value)
+        trend = await registry.get("user")
+        assert_same_summary(trend.summary(), batch_trend(store.sentiments()))
+
+        # Writes through this process update the loaded trend in place
+        for value in values[10:20]:
+            entry_id, timestamp = store.add(value)
+            registry.record("user", value, timestamp, entry_id)
+        trend = await registry.get("user")
+        assert store.loads == 1
+        assert_same_summary(trend.summary(), batch_trend(store.sentiments()))
+
+        # Writes by another process are only seen once the TTL lapses
+        for value in values[20:]:
+            store.add(value)
+        clock.now += 299
+        stale = await registry.get("user")
+        assert stale.count == 20
+        clock.now += 2
+        trend = await registry.get("user")
+        assert store.loads == 2
+        assert registry.seeded == 2
+        assert_same_summary(trend.summary(), batch_trend(store.sentiments()))
+
+    asyncio.run(scenario())
+
+
+def test_records_during_a_reseed_are_counted_once(batch_trend, clock):
+    values = sentiments(24, seed=2)
+    store = Store()
+    registry = MoodTrendRegistry(store.load, ttl_seconds=300)
+
+    async def scenario():
+        for value in values[:16]:
+            store.add(value)
+        await registry.get("user")
+
+        clock.now += 301
+        store.gate = asyncio.Event()
+        first, second = asyncio.create_task(registry.get("user")), asyncio.create_task(registry.get("user"))
+        await asyncio.sleep(0)
+        # Stored and recorded while the load is in flight: the loader returns
+        # these too, and the registry must not apply them twice
+        for value in values[16:]:
+            entry_id, timestamp = store.add(value)
+            registry.record("user", value, timestamp, entry_id)
+        store.gate.set()
+        trend, shared = await first, await second
+
+        assert shared is trend
+        assert store.loads == 2
+        assert_same_summary(trend.summary(), batch_trend(store.sentiments()))
+
+    asyncio.run(scenario())
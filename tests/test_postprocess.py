@@ -0,0 +1,105 @@
+# tests/test_postprocess.py
+"""
+The vectorized EmotionPostprocessor against the scalar per-text path
+
+Both must give identical results (not just close ones) for score dicts in
+label order, which is what the pipeline, the cascade and the cache return.
+Nothing here depends on hash ordering: inputs come from seeded NumPy
+generators and dicts keep insertion order.
+"""
+import numpy as np
+import pytest
+
+from postprocess import EmotionPostprocessor, mood_category, sentiment_score
+
+# GoEmotions, in the order of the model's id2label
+LABELS = [
+    'admiration', 'amusement', 'anger', 'annoyance', 'approval', 'caring', 'confusion',
+    'curiosity', 'desire', 'disappointment', 'disapproval', 'disgust', 'embarrassment',
+    'excitement', 'fear', 'gratitude', 'grief', 'joy', 'love', 'nervousness', 'optimism',
+    'pride', 'realization', 'relief', 'remorse', 'sadness', 'surprise', 'neutral',
+]
+
+
+def _rows(labels, matrix):
+    return [dict(zip(labels, map(float, row))) for row in matrix]
+
+
+def random_scores(labels, seed=0, rows=200):
+    """Softmax-like rows (sum to 1) and independent multi-label rows"""
+    rng = np.random.default_rng(seed)
+    single_label = rng.dirichlet(np.full(len(labels), 0.3), size=rows)
+    multi_label = rng.random((rows, len(labels)))
+    return _rows(labels, single_label) + _rows(labels, multi_label)
+
+
+def edge_case_scores(labels):
+    def row(**scores):
+        return {label: float(scores.get(label, 0.0)) for label in labels}
+
+    return [
+        row(),                                        # nothing above 0: no dominant emotion
+        row(joy=0.4, sadness=0.4),                    # tie: first in label order wins
+        row(neutral=1.0),                             # no sentiment labels at all
+        row(joy=0.65, sadness=0.35),                  # around the mood and insight thresholds
+        row(joy=0.8, sadness=0.2),
+        row(joy=0.35, sadness=0.65),
+        row(joy=0.2, sadness=0.8),
+        row(joy=0.6, sadness=0.4),
+        row(joy=0.4, sadness=0.6),
+        row(joy=0.5, sadness=0.5),
+        row(anger=0.3, fear=0.3, joy=0.1, love=0.1),  # dominant without an insight group
+        {label: 0.11 if i < 5 else 0.0 for i, label in enumerate(labels)},  # 5 significant: not mixed
+        {label: 0.11 if i < 6 else 0.0 for i, label in enumerate(labels)},  # 6 significant: mixed
+        {label: 0.1 for label in labels},             # exactly 0.1 is not significant
+    ]
+
+
+@pytest.mark.parametrize("labels", [LABELS, LABELS[::-1], ['joy', 'sadness', 'neutral']],
+                         ids=["goemotions", "reversed", "few-labels"])
+def test_batch_results_match_scalar_results(bare_analyzer, labels):
+    analyzer = bare_analyzer(labels)
+    score_batch = random_scores(labels) + edge_case_scores(labels)
+    texts = [f"journal entry number {i}" for i in range(len(score_batch))]
+
+    vectorized = analyzer._build_results(texts, score_batch)
+    scalar = [analyzer._build_result(text, emotion_scores) for text, emotion_scores in zip(texts, score_batch)]
+
+    assert len(vectorized) == len(scalar)
+    for row, (batch_result, scalar_result) in enumerate(zip(vectorized, scalar)):
+        assert batch_result == scalar_result, f"row {row}: {score_batch[row]}"
+
+
+def test_dominant_emotion_is_first_maximum(bare_analyzer):
+    analyzer = bare_analyzer(LABELS)
+    tie = {label: 0.0 for label in LABELS}
+    tie['sadness'] = tie['anger'] = 0.5
+
+    [result] = analyzer._build_results(["tie"], [tie])
+
+    assert result['dominant_emotion'] == 'anger'
+    assert result == analyzer._build_result("tie", tie)
+
+
+def test_missing_labels_count_as_zero(bare_analyzer):
+    analyzer = bare_analyzer(LABELS)
+    partial = {'joy': 0.7, 'sadness': 0.2}
+
+    [result] = analyzer._build_results(["partial"], [partial])
+
+    full = {label: partial.get(label, 0.0) for label in LABELS}
+    expected = analyzer._build_result("partial", full)
+    assert result == {**expected, 'emotion_scores': partial}
+
+
+def test_sentiment_and_mood_match_scalar_helpers():
+    """The NumPy columns against postprocess.sentiment_score/mood_category; needs no model stack"""
+    postprocessor = EmotionPostprocessor(LABELS)
+    score_batch = random_scores(LABELS, seed=1) + edge_case_scores(LABELS)
+
+    processed = postprocessor.process(postprocessor.to_matrix(score_batch))
+
+    for emotion_scores, result in zip(score_batch, processed):
+        expected = sentiment_score(emotion_scores)
+        assert result['sentiment_score'] == expected
+        assert result['mood_category'] == mood_category(expected)
@@ -0,0 +1,191 @@
+# tests/test_write_behind.py
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from memory_firestore import InMemoryFirestore
+from write_behind import WriteBehindBuffer
+
+COLLECTION = "mood_entries"
+
+
+class RecordingFirestore(InMemoryFirestore):
+    """In-memory Firestore that records batch commit sizes and can fail them"""
+
+    def __init__(self):
+        super().__init__()
+        self.commits = []
+        self.before_commit = None
+
+    def batch(self):
+        batch = super().batch()
+        commit = batch.commit
+
+        def checked_commit():
+            if self.before_commit is not None:
+                self.before_commit()
+            results = commit()
+            self.commits.append(len(results))
+            return results
+
+        batch.commit = checked_commit
+        return batch
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def entry(number):
+    return {"user_id": "user", "n": number, "timestamp": datetime(2024, 3, 1, number % 24, tzinfo=timezone.utc)}
+
+
+def stored(db, doc_id):
+    return db.collection(COLLECTION).document(doc_id).get().to_dict()
+
+
+def fail_commit():
+    raise ConnectionError("Firestore unavailable")
+
+
+def test_adds_are_coalesced_into_batched_commits(tmp_path):
+    db = RecordingFirestore()
+    buffer = WriteBehindBuffer(lambda: db, str(tmp_path / "writes.log"), flush_size=50, flush_interval=60)
+    buffer.start()
+
+    ids = [buffer.add(COLLECTION, entry(n)) for n in range(120)]
+    # Full batches go out as soon as they fill up; the rest waits
+    wait_for(lambda: buffer.flushed == 100)
+    assert db.commits == [50, 50]
+    assert buffer.pending == 20
+
+    buffer.stop()
+    assert db.commits == [50, 50, 20]
+    assert buffer.pending == 0
+    assert [stored(db, doc_id) for doc_id in ids] == [entry(n) for n in range(120)]
+    # Everything committed: the log was compacted
+    assert os.path.getsize(tmp_path / "writes.log") == 0
+
+
+def test_a_partial_batch_flushes_after_the_interval(tmp_path):
+    db = RecordingFirestore()
+    buffer = WriteBehindBuffer(lambda: db, str(tmp_path / "writes.log"), flush_size=50, flush_interval=0.05)
+    buffer.start()
+    try:
+        ids = [buffer.add(COLLECTION, entry(n)) for n in range(3)]
+        wait_for(lambda: buffer.flushed == 3)
+        assert db.commits == [3]
+        assert buffer.pending_documents(COLLECTION) == []
+        assert [stored(db, doc_id) for doc_id in ids] == [entry(n) for n in range(3)]
+    finally:
+        buffer.stop()
+
+
+def test_replay_after_a_crash_commits_only_unflushed_writes(tmp_path):
+    log_path = str(tmp_path / "writes.log")
+    db = RecordingFirestore()
+    available = threading.Event()
+    first = WriteBehindBuffer(lambda: db if available.is_set() else None, log_path, flush_size=2, flush_interval=60)
+    first.start()
+
+    # The first batch commits, the second fails, then the process goes away
+    ids = [first.add(COLLECTION, entry(n)) for n in range(4)]
+    db.before_commit = lambda: fail_commit() if db.commits else None
+    available.set()
+    ids.append(first.add(COLLECTION, entry(4)))
+    wait_for(lambda: first.failed_flushes == 1)
+    first.stop(timeout=5)
+    assert db.commits == [2]
+    with open(log_path, "a") as log:
+        log.write('{"seq": 6, "collection": "mood_')  # torn by the crash mid-append
+
+    db.before_commit = None
+    available.clear()
+    second = WriteBehindBuffer(lambda: db if available.is_set() else None, log_path, flush_size=50, flush_interval=60)
+    second.start()
+    assert second.replayed == 3
+    assert [doc_id for doc_id, _ in second.pending_documents(COLLECTION)] == ids[2:]
+    later = second.add(COLLECTION, entry(5))
+    available.set()
+    second.stop()
+
+    # The replay rewrote only the three uncommitted entries, with their original IDs
+    assert db.commits == [2, 4]
+    assert [stored(db, doc_id) for doc_id in ids + [later]] == [entry(n) for n in range(6)]
+    assert len(db._documents(COLLECTION)) == 6
+
+
+def test_a_write_after_a_torn_line_survives_the_next_replay(tmp_path):
+    log_path = str(tmp_path / "writes.log")
+    first = WriteBehindBuffer(lambda: None, log_path)
+    first.start()
+    ids = [first.add(COLLECTION, entry(n)) for n in range(2)]
+    first.stop()
+    with open(log_path, "a") as log:
+        log.write('{"seq": 3, "coll')
+
+    second = WriteBehindBuffer(lambda: None, log_path)
+    second.start()
+    ids.append(second.add(COLLECTION, entry(2)))
+    second.stop()
+
+    third = WriteBehindBuffer(lambda: None, log_path)
+    third.start()
+    try:
+        assert third.replayed == 3
+        assert [doc_id for doc_id, _ in third.pending_documents(COLLECTION)] == ids
+    finally:
+        third.stop()
+
+
+def test_stop_while_retrying_a_failing_flush_returns_promptly(tmp_path):
+    log_path = str(tmp_path / "writes.log")
+    db = RecordingFirestore()
+    db.before_commit = fail_commit
+    buffer = WriteBehindBuffer(lambda: db, log_path, flush_size=5, flush_interval=0.01, max_backoff=60)
+    buffer.start()
+
+    for n in range(5):
+        buffer.add(COLLECTION, entry(n))
+    wait_for(lambda: buffer.failed_flushes >= 3)
+
+    started = time.monotonic()
+    buffer.stop(timeout=5)
+    assert time.monotonic() - started < 1
+    assert db.commits == []
+    # Nothing was lost: the writes are still in the log for the next start
+    assert buffer.pending == 5
+    with open(log_path) as log:
+        assert len(log.readlines()) == 5
+
+
+def test_a_flush_failing_after_stop_is_not_retried(tmp_path):
+    db = RecordingFirestore()
+    committing, release = threading.Event(), threading.Event()
+
+    def fail_once_stopped():
+        committing.set()
+        release.wait(5)
+        fail_commit()
+
+    db.before_commit = fail_once_stopped
+    buffer = WriteBehindBuffer(lambda: db, str(tmp_path / "writes.log"), flush_size=5, flush_interval=0.01)
+    buffer.start()
+    for n in range(5):
+        buffer.add(COLLECTION, entry(n))
+    committing.wait(5)
+
+    # stop() arrives while the commit is in flight, which then fails
+    stopper = threading.Thread(target=buffer.stop, kwargs={"timeout": 5})
+    stopper.start()
+    wait_for(lambda: buffer._stopping.is_set())
+    release.set()
+    stopper.join(2)
+
+    assert not stopper.is_alive()
+    assert buffer.failed_flushes == 1
+    assert buffer.pending == 5